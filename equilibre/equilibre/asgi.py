@@ -0,0 +1,21 @@
+"""
+ASGI config for equilibre project.
+
+It exposes the ASGI callable as a module-level variable named ``application``,
+to be served by an ASGI server, e.g.::
+
+    uvicorn --workers 4 equilibre.asgi:application
+
+Django 2.0 has no ASGI support of its own, so requests are run by the WSGI
+application in a pool of threads (see ``transactions.asgi``).
+"""
+
+import os
+
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "equilibre.settings")
+
+from transactions.asgi import ASGIHandler  # noqa: E402
+
+application = ASGIHandler(get_wsgi_application())
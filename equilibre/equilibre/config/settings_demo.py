@@ -2,6 +2,7 @@
 
 import os
 import datetime
+import importlib.util
 
 from corsheaders.defaults import default_headers
 
@@ -43,6 +44,13 @@ DATABASES = {
     }
 }
 
+# Cache config
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
 ADMINS = (
     ('Rod Manning', 'rod.t.manning@gmail.com')
 )
@@ -58,6 +66,9 @@ STATIC_ROOT = os.path.join(os.path.dirname(BASE_DIR), 'static_root')
 # URL for serving media files
 MEDIA_URL = '/media/'
 
+# MessagePack is only negotiated when the optional msgpack package is installed
+MSGPACK = importlib.util.find_spec('msgpack') is not None
+
 REST_FRAMEWORK = {
     # Authentication
     'DEFAULT_PERMISSION_CLASSES': (
@@ -71,7 +82,17 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 50,
     # Filtering
-    #"DEFAULT_FILTER_BACKENDS": ("django_filters.rest_framework.DjangoFilterBackend",),
+    "DEFAULT_FILTER_BACKENDS": ("django_filters.rest_framework.DjangoFilterBackend",),
+    # Rendering and parsing
+    'DEFAULT_RENDERER_CLASSES': (
+        'transactions.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ) + (('transactions.renderers.MessagePackRenderer',) if MSGPACK else ()),
+    'DEFAULT_PARSER_CLASSES': (
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ) + (('transactions.parsers.MessagePackParser',) if MSGPACK else ()),
 }
 
 SIMPLE_JWT = {
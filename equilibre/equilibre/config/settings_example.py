@@ -2,6 +2,7 @@
 
 import os
 import datetime
+import importlib.util
 
 from corsheaders.defaults import default_headers
 
@@ -41,6 +42,14 @@ DATABASES = {
     }
 }
 
+# Cache config. Reference data is cached here and shared between processes,
+# so use a shared backend (e.g. memcached) when running more than one.
+CACHES = {
+    'default': {
+        'Details go here ...'
+    }
+}
+
 ADMINS = (
     ('Rod Manning', 'rod.t.manning@gmail.com')
 )
@@ -56,6 +65,9 @@ STATIC_ROOT = os.path.join(os.path.dirname(BASE_DIR), 'static_root')
 # URL for serving media files
 MEDIA_URL = '/media/'
 
+# MessagePack is only negotiated when the optional msgpack package is installed
+MSGPACK = importlib.util.find_spec('msgpack') is not None
+
 REST_FRAMEWORK = {
     # Authentication
     'DEFAULT_PERMISSION_CLASSES': (
@@ -69,7 +81,17 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 50,
     # Filtering
-    #"DEFAULT_FILTER_BACKENDS": ("django_filters.rest_framework.DjangoFilterBackend",),
+    "DEFAULT_FILTER_BACKENDS": ("django_filters.rest_framework.DjangoFilterBackend",),
+    # Rendering and parsing
+    'DEFAULT_RENDERER_CLASSES': (
+        'transactions.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ) + (('transactions.renderers.MessagePackRenderer',) if MSGPACK else ()),
+    'DEFAULT_PARSER_CLASSES': (
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ) + (('transactions.parsers.MessagePackParser',) if MSGPACK else ()),
 }
 
 
@@ -50,6 +50,7 @@ CORE_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'rest_framework',
+    'django_filters',
     'corsheaders',
 ]
 
@@ -60,6 +61,8 @@ LOCAL_APPS = [
 INSTALLED_APPS = CORE_APPS + LOCAL_APPS
 
 MIDDLEWARE = [
+    'transactions.middleware.TimingMiddleware',
+    'transactions.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -70,6 +73,44 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Per-request query counts and timings, sent as `Server-Timing` headers and
+# logged to `transactions.timing` (see `transactions.middleware`).
+REQUEST_TIMING = {
+    'ENABLED': False,
+    'QUERY_BUDGET': 20,
+    'LATENCY_BUDGET_MS': 500,
+}
+
+# Metrics exposed at `/metrics` (see `transactions.metrics`). Set `DIR` to a
+# directory shared by the server's worker processes (and emptied when the
+# server starts) to add up the metrics of all of them.
+METRICS = {
+    'ENABLED': True,
+    'DIR': os.environ.get('METRICS_DIR'),
+}
+
+# The ASGI entry point (`equilibre.asgi`) runs up to `THREADS` requests at a
+# time in each process (see `transactions.asgi`), each with its own database
+# connection.
+ASGI = {
+    'THREADS': int(os.environ.get('ASGI_THREADS', 20)),
+}
+
+# The change feed of `/api/events/` (see `transactions.events`). The local
+# backend only reaches clients of the process which made the change, so with
+# several server processes use a shared backend.
+EVENTS = {
+    'BACKEND': 'transactions.events.LocalBackend',
+    'HEARTBEAT': 15.0,
+}
+
+# Incremental sync from `/api/transactions/changes/` (see
+# `transactions.sync`).
+SYNC = {
+    'MARGIN': 5.0,
+    'PAGE_SIZE': 500,
+}
+
 ROOT_URLCONF = 'equilibre.urls'
 
 TEMPLATES = [
@@ -16,6 +16,7 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import include, path, re_path
 from rest_framework.documentation import include_docs_urls
+from transactions.views import metrics_view
 # simple-jwt
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
@@ -27,6 +28,7 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     re_path(r'docs/', include_docs_urls(title='Equilibre API')),
     path('api/', include('transactions.urls')),
+    path('metrics', metrics_view, name='metrics'),
     # simple-jwt
     re_path(r'^api/token/$', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     re_path(r'^api/token/refresh/$', TokenRefreshView.as_view(), name='token_refresh'),
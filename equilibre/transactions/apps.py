@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class TransactionsConfig(AppConfig):
     name = 'transactions'
+
+    def ready(self):
+        from transactions import cache, events
+        cache.connect_signals()
+        events.connect_signals()
@@ -0,0 +1,209 @@
+"""An ASGI server interface to the WSGI application.
+
+Django 2.0 has neither an ASGI handler nor async views, and its ORM is
+synchronous, so each request still runs the ordinary (synchronous) views in
+a thread. The server's event loop, however, holds every open connection,
+reads request bodies and writes responses, so slow clients, idle keep-alive
+connections and requests queuing for a thread no longer tie up a worker
+process. The pool of threads bounds the number of requests (and so of
+database connections) in progress at a time, as sync workers did.
+
+A request runs in a single thread from start to finish, including the
+iteration of streamed responses, since Django's database connections belong
+to the thread which opened them. Responses with an `async_streaming_content`
+(an asynchronous iterable of bytes, such as the server-sent events of
+`EventViewSet`) are the exception: their content is read by the event loop
+once the view has returned, so long-lived streams don't hold a thread.
+
+"""
+import asyncio
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+
+DEFAULTS = {
+    # The number of requests run at a time by each process.
+    "THREADS": 20,
+}
+
+# Request bodies bigger than this are spooled to a temporary file.
+MAX_MEMORY_BODY_SIZE = 1024 * 1024
+
+
+def options():
+    """Return the `ASGI` setting, with defaults."""
+    return dict(DEFAULTS, **getattr(settings, "ASGI", {}))
+
+
+class ClientDisconnected(Exception):
+    """Raised in a request's thread when its client has gone away."""
+
+
+class ASGIHandler(object):
+    """An ASGI application running a WSGI application in a pool of threads.
+
+    :application: The WSGI application.
+    :threads: The number of threads (by default `ASGI["THREADS"]`).
+
+    """
+
+    def __init__(self, application, threads=None):
+        self.application = application
+        self.executor = ThreadPoolExecutor(
+            max_workers=threads or options()["THREADS"])
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self.http(scope, receive, send)
+        else:
+            raise ValueError("Unsupported ASGI scope type '%s'." % scope["type"])
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=True)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def http(self, scope, receive, send):
+        body = SpooledTemporaryFile(max_size=MAX_MEMORY_BODY_SIZE)
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                body.close()
+                return
+            body.write(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        length = body.tell()
+        body.seek(0)
+
+        loop = asyncio.get_event_loop()
+        disconnected = threading.Event()
+        listener = asyncio.ensure_future(self.listen(receive, disconnected))
+        try:
+            content = await loop.run_in_executor(
+                self.executor, self.run, self.environ(scope, body, length), send,
+                loop, disconnected)
+            if content is not None:
+                await self.stream(content, send, disconnected)
+        finally:
+            listener.cancel()
+            body.close()
+
+    async def stream(self, content, send, disconnected):
+        """Send an asynchronous iterable of bytes as the response body."""
+        try:
+            async for chunk in content:
+                if disconnected.is_set():
+                    return
+                if chunk:
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            await content.aclose()
+
+    async def listen(self, receive, disconnected):
+        """Set `disconnected` when the client goes away."""
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                disconnected.set()
+                return
+
+    def environ(self, scope, body, length):
+        """Return the WSGI environ of the request of an HTTP scope.
+
+        :body: The file holding the request body.
+        :length: The size of the body.
+
+        """
+        server = scope.get("server") or ("localhost", 80)
+        client = scope.get("client") or ("", 0)
+        environ = {
+            "REQUEST_METHOD": scope["method"],
+            "SCRIPT_NAME": scope.get("root_path", "").encode("utf8").decode("latin1"),
+            "PATH_INFO": scope["path"].encode("utf8").decode("latin1"),
+            "QUERY_STRING": scope.get("query_string", b"").decode("latin1"),
+            "SERVER_NAME": server[0],
+            "SERVER_PORT": str(server[1]),
+            "SERVER_PROTOCOL": "HTTP/%s" % scope.get("http_version", "1.1"),
+            "REMOTE_ADDR": client[0],
+            "REMOTE_PORT": str(client[1]),
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": scope.get("scheme", "http"),
+            "wsgi.input": body,
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": True,
+            "wsgi.run_once": False,
+        }
+        for name, value in scope.get("headers", []):
+            name = name.decode("latin1").upper().replace("-", "_")
+            if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+                name = "HTTP_%s" % name
+            value = value.decode("latin1")
+            if name in environ:
+                value = "%s,%s" % (environ[name], value)
+            environ[name] = value
+        # Chunked request bodies have no length, but it's known by now.
+        environ["CONTENT_LENGTH"] = str(length)
+        return environ
+
+    def run(self, environ, send, loop, disconnected):
+        """Run the WSGI application and send its response, in a thread.
+
+        :return: The `async_streaming_content` of the response, which is left
+                 for the event loop to send, or `None`.
+
+        """
+        def call(message):
+            if disconnected.is_set():
+                raise ClientDisconnected
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and response.get("started"):
+                raise exc_info[1].with_traceback(exc_info[2])
+            response["status"] = int(status.split(" ", 1)[0])
+            response["headers"] = [
+                (name.lower().encode("latin1"), value.encode("latin1"))
+                for name, value in headers]
+
+        def start():
+            if not response.get("started"):
+                response["started"] = True
+                call({
+                    "type": "http.response.start",
+                    "status": response["status"],
+                    "headers": response["headers"],
+                })
+
+        result = self.application(environ, start_response)
+        try:
+            content = getattr(result, "async_streaming_content", None)
+            if content is not None:
+                start()
+                return content
+            for chunk in result:
+                start()
+                if chunk:
+                    call({"type": "http.response.body", "body": chunk, "more_body": True})
+            start()
+            call({"type": "http.response.body", "body": b""})
+        except ClientDisconnected:
+            pass
+        finally:
+            # Closing the response closes the thread's database connections.
+            if hasattr(result, "close"):
+                result.close()
@@ -0,0 +1,236 @@
+"""Helpers for benchmarking the API against a synthetic ledger."""
+import itertools
+import json
+import math
+import random
+import statistics
+import time
+import tracemalloc
+import uuid
+from datetime import date, timedelta
+from decimal import Decimal
+from urllib.request import Request, urlopen
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.utils import timezone
+
+from transactions.models import (
+    Account, Balance, Category, MonthlySummary, Transaction)
+from transactions.sync import encode_token
+
+EXPLAIN_PREFIXES = {
+    "mysql": "EXPLAIN ",
+    "postgresql": "EXPLAIN ",
+    "sqlite": "EXPLAIN QUERY PLAN ",
+}
+
+# Python's sqlite3 module caches prepared statements by their SQL, and a cached
+# EXPLAIN isn't re-planned after the schema changes, so each EXPLAIN is made
+# unique with a comment.
+_explain_counter = itertools.count()
+
+
+class Rollback(Exception):
+    """Raised to roll back the benchmark's data."""
+
+
+def seed_ledger(transactions, users=3, accounts=5, categories=20, years=5,
+                batch_size=5000, seed=None, password=None):
+    """Create a synthetic ledger with bulk inserts.
+
+    Dates are spread evenly over the last `years` years, most transactions
+    are small debits with a long tail of larger amounts, and accounts and
+    categories are used unevenly, as they are in real ledgers.
+
+    :password: The password of the users, who can't log in if it's `None`.
+
+    :return: The list of users created.
+
+    """
+    rng = random.Random(seed)
+    suffix = "%06d" % rng.randrange(10 ** 6)
+    user_objs = [
+        User.objects.create_user("bench-%s-%d" % (suffix, i), password=password)
+        for i in range(users)
+    ]
+    account_objs = [
+        Account.objects.create(name="Account %d" % i, abbreviation="AC%d" % i)
+        for i in range(accounts)
+    ]
+    category_objs = [
+        Category.objects.create(name="Category %d" % i)
+        for i in range(categories)
+    ]
+    account_weights = [1.0 / (i + 1) for i in range(accounts)]
+    category_weights = [1.0 / (i + 1) for i in range(categories)]
+
+    end = date.today()
+    days = 365 * years
+    batch = []
+    for i in range(transactions):
+        action = 1 if rng.random() < 0.1 else -1
+        amount = min(rng.lognormvariate(3, 1.2) * (9 if action == 1 else 1), 999999)
+        user = rng.choice(user_objs)
+        batch.append(Transaction(
+            user=user,
+            date=end - timedelta(days=rng.randrange(days)),
+            description="Transaction %d" % i,
+            amount=Decimal("%.2f" % amount),
+            action=action,
+            account=rng.choices(account_objs, account_weights)[0],
+            category=rng.choices(category_objs, category_weights)[0],
+            created_by=user,
+            updated_by=user,
+            tax_deduction=rng.random() < 0.05,
+        ))
+        if len(batch) >= batch_size:
+            Transaction.objects.bulk_create(batch)
+            batch = []
+    Transaction.objects.bulk_create(batch)
+    Balance.objects.recompute(a.pk for a in account_objs)
+    MonthlySummary.objects.rebuild()
+
+    return user_objs
+
+
+def explain(queryset):
+    """Return the lines of the database's query plan for `queryset`."""
+    prefix = EXPLAIN_PREFIXES.get(connection.vendor)
+    if prefix is None:
+        return []
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "%s%s /* %d */" % (prefix, sql, next(_explain_counter)), params)
+        return [" ".join(str(col) for col in row) for row in cursor.fetchall()]
+
+
+def time_query(func, repeat=5):
+    """Return the median time in milliseconds taken to call `func`."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def percentile(values, percent):
+    """Return the `percent` percentile of `values`, by nearest rank."""
+    values = sorted(values)
+    if not values:
+        return None
+    rank = max(int(math.ceil(percent / 100.0 * len(values))), 1)
+    return values[rank - 1]
+
+
+def http_client(url, username, password, timeout=None):
+    """Return a function sending requests to a running server.
+
+    The user is authenticated with a JSON web token from `/api/token/`.
+
+    :return: A function taking a method, a path and optionally data to send
+             as JSON, which returns the response (a file-like object).
+
+    """
+    base = url.rstrip("/")
+    headers = {"Content-Type": "application/json", "Accept": "application/json"}
+
+    def request(method, path, data=None):
+        body = None if data is None else json.dumps(data).encode()
+        return urlopen(Request(base + path, body, headers, method=method), timeout=timeout)
+
+    with request("POST", "/api/token/", {"username": username, "password": password}) as r:
+        headers["Authorization"] = "Bearer %s" % json.loads(r.read().decode())["access"]
+    return request
+
+
+def api_requests(get, post=None):
+    """Return a list of `(name, method, path, data)` of each API request.
+
+    Every route of `transactions.urls` is covered except two:
+
+    - DELETE of a single transaction, since each request is repeated and
+      only the first would find the transaction. The bulk DELETE measures
+      the same `TransactionQuerySet.delete()`.
+    - `/api/events/`, which is a stream that stays open rather than a
+      request with a latency.
+
+    The ids used in the paths are discovered through the API. Writes change
+    only the transactions created by the requests themselves, which are
+    marked with a description unique to the call.
+
+    :get: A function which returns the decoded JSON of a GET of a path.
+
+    :post: A function which returns the decoded JSON of a POST of data to a
+           path, used to create the transaction changed by a single PATCH.
+           Without it, that request is left out.
+
+    """
+    account = get("/api/accounts/")[0]["id"]
+    category = get("/api/category/")[0]["id"]
+    page = get("/api/transactions/")
+    transaction = page["results"][0]
+    last_page = max(int(math.ceil(page["count"] / max(len(page["results"]), 1))), 1)
+    user = get("/api/transactions/%d/?fields=user&expand=" % transaction["id"])["user"]
+    today = date.today()
+    month = today.replace(day=1) - timedelta(days=1)
+    row = {
+        "user_id": user,
+        "account_id": account,
+        "category_id": category,
+        "date": today.isoformat(),
+        "action": -1,
+        "amount": "12.34",
+        "description": "Benchmark %s" % uuid.uuid4().hex,
+    }
+    selection = "/api/transactions/bulk/?search=%s" % row["description"].split()[1]
+    updates = []
+    if post is not None:
+        target = post("/api/transactions/", row)["id"]
+        updates.append((
+            "transaction update", "PATCH", "/api/transactions/%d/" % target,
+            dict(row, amount="43.21")))
+    return [
+        ("category list", "GET", "/api/category/", None),
+        ("category retrieve", "GET", "/api/category/%d/" % category, None),
+        ("account list", "GET", "/api/accounts/", None),
+        ("account retrieve", "GET", "/api/accounts/%d/" % account, None),
+        ("transaction list", "GET", "/api/transactions/", None),
+        ("transaction list (last page)", "GET",
+         "/api/transactions/?page=%d" % last_page, None),
+        ("transaction list (keyset)", "GET", "/api/transactions/?cursor=", None),
+        ("transaction list (filtered)", "GET",
+         "/api/transactions/?account=%d&date_from=%s" % (
+             account, (today - timedelta(days=90)).isoformat()), None),
+        ("transaction list (compact)", "GET",
+         "/api/transactions/?compact=true&fields=id,date,amount,account", None),
+        ("transaction retrieve", "GET", "/api/transactions/%d/" % transaction["id"], None),
+        ("transaction changes (last day)", "GET",
+         "/api/transactions/changes/?since=%s" % encode_token(
+             timezone.now() - timedelta(days=1), 0), None),
+        ("transaction export", "GET", "/api/transactions/export/?format=ndjson&date_from=%s" % (
+            month.replace(day=1).isoformat()), None),
+        ("transaction create", "POST", "/api/transactions/", row),
+        ("transaction bulk (10 rows)", "POST", "/api/transactions/bulk/", [row] * 10),
+    ] + updates + [
+        ("transaction bulk update", "PATCH", selection, {"set": {"tax_deduction": True}}),
+        ("transaction bulk delete", "DELETE", selection, None),
+        ("balance list", "GET", "/api/balances/", None),
+        ("balance list (as of)", "GET", "/api/balances/?as_of=%s" % month.isoformat(), None),
+        ("balance health", "GET", "/api/balances/health/", None),
+        ("report (category, month)", "GET", "/api/reports/?group_by=category,month", None),
+        ("report (week)", "GET", "/api/reports/?group_by=week&date_from=%s" % (
+            (today - timedelta(days=90)).isoformat()), None),
+    ]
+
+
+def measure_memory(func):
+    """Return the peak memory in KiB allocated while calling `func`."""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
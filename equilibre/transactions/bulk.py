@@ -0,0 +1,228 @@
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from rest_framework import serializers
+
+from transactions import cache
+from transactions.models import LedgerDeltas, Transaction
+from transactions.serializers import TransactionSerializer
+
+# The number of rows validated and inserted per `bulk_create()`.
+DEFAULT_CHUNK_SIZE = 500
+
+# The fields which can be changed by `update_transactions()`. Transactions
+# can't be given to another user in bulk, as their owner's sync would never
+# learn that they had gone.
+UPDATE_FIELDS = (
+    "account_id", "category_id", "date", "action", "amount", "description",
+    "tax_deduction",
+)
+
+# The related objects of transactions, and the error of an unknown `pk`.
+RELATED_ERRORS = (
+    ("account_id", "You must select an account."),
+    ("category_id", "You must select a category."),
+    ("user_id", "You must select a user."),
+)
+
+
+def related_errors(data, ids):
+    """Return the errors of the related objects of `data` which don't exist.
+
+    :ids: A dict mapping the fields of `RELATED_ERRORS` to the set of
+          `pk` of the objects which exist.
+
+    """
+    return {
+        field: [message] for field, message in RELATED_ERRORS
+        if field in data and data[field] not in ids[field]
+    }
+
+
+def chunked(iterable, size):
+    """Yield successive lists of up to `size` items from `iterable`."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class TransactionLoader(object):
+    """Validate and insert rows of transaction data in bulk.
+
+    Rows are validated with `TransactionSerializer` against related objects
+    which are fetched once up-front (accounts and categories from the
+    reference data caches), inserted in chunks with `bulk_create()`,
+    and each affected balance and monthly summary is then adjusted once with
+    the net amount of all of its new transactions.
+
+    :user: The user recorded as having created the transactions. Unless
+           they may see every user's transactions, they may only create
+           their own.
+
+    :chunk_size: The number of rows inserted per query.
+
+    :context: The context passed to `TransactionSerializer`.
+
+    :dry_run: If `True`, rows are validated but not inserted.
+
+    """
+
+    def __init__(self, user, chunk_size=DEFAULT_CHUNK_SIZE, context=None,
+                 dry_run=False):
+        self.user = user
+        self.chunk_size = chunk_size
+        self.dry_run = dry_run
+        self.serializer = TransactionSerializer(context=context or {})
+        self.account_ids = cache.accounts.ids()
+        self.category_ids = cache.categories.ids()
+        self.user_ids = set(User.objects.values_list("id", flat=True))
+        self.all_users = user.has_perm("transaction.view")
+        self.created = 0
+        self.errors = []
+        self.deltas = LedgerDeltas()
+
+    def validate(self, row):
+        """Return an unsaved `Transaction` for `row` of input data.
+
+        :raises: `ValidationError` if the row is invalid.
+
+        """
+        data = self.serializer.run_validation(row)
+        errors = related_errors(data, {
+            "account_id": self.account_ids,
+            "category_id": self.category_ids,
+            "user_id": self.user_ids,
+        })
+        if not errors and not self.all_users and data["user_id"] != self.user.pk:
+            errors["user_id"] = ["You may only add your own transactions."]
+        if errors:
+            raise serializers.ValidationError(errors)
+
+        return Transaction(
+            created_by=self.user, updated_by=self.user, **data)
+
+    def insert(self, instances):
+        """Insert a chunk of validated `instances`."""
+        if not self.dry_run:
+            Transaction.objects.bulk_create(instances)
+        for instance in instances:
+            self.deltas.add(instance)
+        self.created += len(instances)
+
+    def check(self, rows):
+        """Validate each row of `rows` without inserting any.
+
+        Invalid rows are recorded in `errors` along with their index.
+
+        """
+        for i, row in enumerate(rows):
+            try:
+                self.validate(row)
+            except serializers.ValidationError as exc:
+                self.errors.append({"index": i, "errors": exc.detail})
+
+    def load(self, rows, offset=0):
+        """Validate and insert each row of `rows`.
+
+        Invalid rows are skipped and recorded in `errors` along with their
+        index, so that one bad row doesn't prevent the rest being imported.
+
+        :rows: An iterable of dicts of transaction data.
+
+        :offset: The index of the first row, used when reporting errors.
+
+        """
+        for index, chunk in enumerate(chunked(rows, self.chunk_size)):
+            instances = []
+            for i, row in enumerate(chunk, offset + index * self.chunk_size):
+                try:
+                    instances.append(self.validate(row))
+                except serializers.ValidationError as exc:
+                    self.errors.append({"index": i, "errors": exc.detail})
+            self.insert(instances)
+
+    def apply_totals(self):
+        """Apply the net change of all inserted rows to balances and summaries."""
+        self.deltas.apply()
+
+
+def load_transactions(rows, user, atomic=False, **kwargs):
+    """Validate and insert `rows` of transaction data, updating balances.
+
+    Each chunk of rows is committed on its own along with its changes to
+    balances and summaries, so that no database transaction is open for long:
+    sync tokens assume rows are committed soon after they are stamped (see
+    `transactions.sync`). If the load fails part way, the chunks already
+    committed are kept.
+
+    :atomic: If `True`, nothing is inserted unless every row is valid and
+             every row is inserted: the rows are all validated first, then
+             inserted in a single database transaction. Rows of a load which
+             takes longer than `SYNC["MARGIN"]` may then be missed by clients
+             syncing while it runs, so atomic loads should be kept small.
+
+    :return: The `TransactionLoader` used, which records the number of rows
+             created and any row errors.
+
+    """
+    loader = TransactionLoader(user, **kwargs)
+    if not atomic:
+        _load_chunks(loader, rows)
+        return loader
+
+    rows = list(rows)
+    loader.check(rows)
+    if not loader.errors:
+        with transaction.atomic():
+            _load_chunks(loader, rows)
+    return loader
+
+
+def _load_chunks(loader, rows):
+    """Insert `rows` with `loader`, a chunk per (inner) database transaction."""
+    for index, chunk in enumerate(chunked(rows, loader.chunk_size)):
+        with transaction.atomic():
+            loader.load(chunk, offset=index * loader.chunk_size)
+            loader.apply_totals()
+
+
+def update_transactions(queryset, data, user, context=None):
+    """Apply the same change to every transaction of `queryset`.
+
+    The change is validated as for a PATCH of one transaction, then applied
+    with a single `UPDATE`, and balances and summaries are adjusted by its
+    net effect (see `TransactionQuerySet.update()`).
+
+    :data: A dict of the new values of some of `UPDATE_FIELDS`.
+
+    :user: The user recorded as having updated the transactions.
+
+    :return: The number of transactions updated.
+
+    :raises: `ValidationError` if the change is invalid.
+
+    """
+    if not isinstance(data, dict) or not data:
+        raise serializers.ValidationError(
+            {"set": ["Give a dict of the fields to change."]})
+    unknown = sorted(set(data) - set(UPDATE_FIELDS))
+    if unknown:
+        raise serializers.ValidationError(
+            {name: ["This field can't be changed in bulk."] for name in unknown})
+
+    serializer = TransactionSerializer(
+        data=data, partial=True, context=context or {})
+    serializer.is_valid(raise_exception=True)
+    changes = serializer.validated_data
+    errors = related_errors(changes, {
+        "account_id": cache.accounts.ids() if "account_id" in changes else (),
+        "category_id": cache.categories.ids() if "category_id" in changes else (),
+    })
+    if errors:
+        raise serializers.ValidationError(errors)
+
+    return queryset.update(updated_by=user, **changes)
@@ -0,0 +1,195 @@
+"""Caches of reference data and of transaction responses.
+
+Accounts and categories change a few times a year but are read on every
+request, so they are loaded once into the Django cache (shared between
+processes) and kept in memory in each process. Each cache has a version
+number in the shared cache which is bumped when a row is saved or deleted, so
+that every process reloads its copy on its next read.
+
+Responses listing transactions are cached under keys made from the versions
+of everything they contain: the transactions of their user (or of every user),
+and the accounts, categories and users the transactions refer to. Balances
+have a version of their own, which stamps the list of balances.
+
+"""
+import time
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from django.contrib.auth.models import User
+
+from transactions import metrics
+from transactions.models import Account, Balance, Category, Transaction
+from transactions.signals import ledger_changed
+
+
+class Version(object):
+    """A version number in the shared cache, bumped when data changes.
+
+    :key: The cache key of the version number.
+
+    """
+
+    def __init__(self, key):
+        self.key = key
+
+    def get(self):
+        """Return the current version number."""
+        version = cache.get(self.key)
+        if version is None:
+            self._reset()
+            version = cache.get(self.key)
+        return version
+
+    def bump(self):
+        """Change the version number."""
+        try:
+            cache.incr(self.key)
+        except ValueError:
+            self._reset()
+
+    def _reset(self):
+        # Start from the time, so that a version evicted from the cache is
+        # never reused by processes which still have data of that version.
+        cache.add(self.key, int(time.time() * 1000), None)
+
+
+class ReferenceCache(object):
+    """A cache of every row of a small, rarely changing table.
+
+    :model: The model of the table.
+
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.key = "reference:%s" % model._meta.label_lower
+        self._version = Version(self.key)
+        self._local = (None, None)
+
+    def version(self):
+        """Return the current version of the rows, which changes with them."""
+        return self._version.get()
+
+    def _load(self):
+        """Return an ordered dict of every row by `pk`, as of now."""
+        version = self.version()
+        local_version, rows = self._local
+        if local_version == version:
+            metrics.cache_requests_total.inc(cache=self.key, result="hit")
+            return rows
+
+        data_key = "%s:%d" % (self.key, version)
+        rows = cache.get(data_key)
+        metrics.cache_requests_total.inc(
+            cache=self.key, result="miss" if rows is None else "hit")
+        if rows is None:
+            rows = OrderedDict(
+                (obj.pk, obj) for obj in self.model.objects.order_by("pk"))
+            cache.set(data_key, rows, None)
+        self._local = (version, rows)
+        return rows
+
+    def all(self):
+        """Return a list of every row, ordered by `pk`."""
+        return list(self._load().values())
+
+    def active(self):
+        """Return a list of the active rows, ordered by `pk`."""
+        return [obj for obj in self._load().values() if obj.is_active]
+
+    def ids(self):
+        """Return the set of the `pk` of every row."""
+        return set(self._load())
+
+    def get(self, pk):
+        """Return the row with the given `pk`.
+
+        :raises: `DoesNotExist` if there is no such row.
+
+        """
+        try:
+            return self._load()[int(pk)]
+        except (KeyError, TypeError, ValueError):
+            raise self.model.DoesNotExist(
+                "%s matching query does not exist." % self.model._meta.object_name)
+
+    def invalidate(self):
+        """Make every process reload the rows on their next read."""
+        self._local = (None, None)
+        self._version.bump()
+
+
+accounts = ReferenceCache(Account)
+categories = ReferenceCache(Category)
+
+
+users = Version("reference:auth.user")
+all_transactions = Version("transactions:all")
+all_balances = Version("balances:all")
+
+
+def transactions_stamp(user, all_users=False):
+    """Return a stamp of the versions of a user's transaction responses.
+
+    :all_users: If `True`, the stamp covers the transactions of every user.
+
+    """
+    scope = all_transactions if all_users else Version("transactions:%d" % user.pk)
+    return "%s:%s.%s.%s.%s" % (
+        "all" if all_users else user.pk, scope.get(),
+        accounts.version(), categories.version(), users.get())
+
+
+def invalidate_transactions(user_ids):
+    """Invalidate the cached transaction responses of users."""
+    for user_id in set(user_ids):
+        Version("transactions:%d" % user_id).bump()
+    all_transactions.bump()
+
+
+def _on_commit(func, *args):
+    func(*args)
+    # Readers may cache the old data again before the change is committed.
+    transaction.on_commit(lambda: func(*args))
+
+
+def _invalidate_reference(sender, **kwargs):
+    _on_commit((accounts if sender is Account else categories).invalidate)
+
+
+def _invalidate_users(sender, update_fields=None, **kwargs):
+    # Logging in saves the user's `last_login`, which isn't serialized.
+    if update_fields is None or set(update_fields) != {"last_login"}:
+        _on_commit(users.bump)
+
+
+def _invalidate_balances(sender, **kwargs):
+    _on_commit(all_balances.bump)
+
+
+def _invalidate_transaction(sender, instance, **kwargs):
+    _on_commit(invalidate_transactions, [instance.user_id])
+
+
+def _invalidate_ledger(sender, user_ids, balances=None, **kwargs):
+    _on_commit(invalidate_transactions, user_ids)
+    if balances and any(balances.values()):
+        _on_commit(all_balances.bump)
+
+
+def connect_signals():
+    """Invalidate the caches whenever the data they hold changes."""
+    for model, receiver in ((Account, _invalidate_reference),
+                            (Category, _invalidate_reference),
+                            (User, _invalidate_users),
+                            (Balance, _invalidate_balances),
+                            (Transaction, _invalidate_transaction)):
+        post_save.connect(receiver, sender=model, dispatch_uid="cache-save")
+        post_delete.connect(receiver, sender=model, dispatch_uid="cache-delete")
+    # Bulk inserts send no signals, and saves can move transactions between
+    # users, so changes to the ledger are signalled with every user involved.
+    ledger_changed.connect(_invalidate_ledger, dispatch_uid="cache-ledger")
@@ -0,0 +1,235 @@
+"""A feed of changes to the ledger, pushed to clients as they happen.
+
+When a write to the ledger is committed, an event with the change of each
+balance and the `pk` of the transactions created, updated or deleted is
+published to a backend, which fans it out to every subscriber (such as the
+server-sent events of `EventViewSet`). Subscribers see every balance change,
+but only the transactions they may see.
+
+The backend is chosen with `EVENTS["BACKEND"]`. `LocalBackend` fans events
+out within a process, so it suits servers with a single process (e.g. a
+single ASGI worker with many threads) or stands in for a shared backend in
+development and tests. A backend shared between processes (e.g. on Redis
+pub/sub) needs only `publish()`, `subscribe()` and `listening()`; events
+are dicts of JSON-serializable values.
+
+"""
+import asyncio
+import queue
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from transactions.models import Balance
+from transactions.signals import ledger_changed
+
+DEFAULTS = {
+    # The dotted path of the backend's class.
+    "BACKEND": "transactions.events.LocalBackend",
+    # The number of seconds between messages keeping idle streams open.
+    "HEARTBEAT": 15.0,
+    # The number of events held for a slow subscriber before it is reset.
+    "QUEUE_SIZE": 100,
+}
+
+
+def options():
+    """Return the `EVENTS` setting, with defaults."""
+    return dict(DEFAULTS, **getattr(settings, "EVENTS", {}))
+
+
+class LocalBackend(object):
+    """A backend fanning events out to the subscribers of this process."""
+
+    def __init__(self):
+        self.subscribers = set()
+        self.lock = threading.Lock()
+
+    def publish(self, event):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for callback in subscribers:
+            callback(event)
+
+    def subscribe(self, callback):
+        """Call `callback` with every event until the returned function is called."""
+        with self.lock:
+            self.subscribers.add(callback)
+
+        def unsubscribe():
+            with self.lock:
+                self.subscribers.discard(callback)
+
+        return unsubscribe
+
+    def listening(self):
+        """Return whether anyone may receive events published now."""
+        return bool(self.subscribers)
+
+
+_backend = None
+
+
+def get_backend():
+    """Return the backend of this process."""
+    global _backend
+    if _backend is None:
+        _backend = import_string(options()["BACKEND"])()
+    return _backend
+
+
+class Subscription(object):
+    """The events for a user, queued until they are read.
+
+    Events are read with `get()` from any thread, or with `aget()` from the
+    event loop given, which must be running the code creating the
+    subscription. If more than `EVENTS["QUEUE_SIZE"]` events are queued,
+    they are dropped for a single `reset` event, after which clients should
+    fetch the data they show again.
+
+    :user_id: The `pk` of the user.
+    :all_users: Whether the user may see the transactions of every user.
+
+    """
+
+    def __init__(self, user_id, all_users=False, loop=None):
+        self.user_id = user_id
+        self.all_users = all_users
+        self.queue = queue.Queue(options()["QUEUE_SIZE"])
+        self.overflowed = False
+        self.loop = loop
+        # Created in the loop, which it binds to (it takes no `loop` argument
+        # since Python 3.10).
+        self.ready = asyncio.Event() if loop else None
+        self._unsubscribe = get_backend().subscribe(self.put)
+
+    def visible(self, changes):
+        """Return the `pk` of the `changes` (dicts of `id` and `user`) visible."""
+        return [c["id"] for c in changes if self.all_users or c["user"] == self.user_id]
+
+    def put(self, event):
+        """Queue the part of a published event visible to the user."""
+        data = {
+            "balances": event["balances"],
+            "transactions": self.visible(event["transactions"]),
+            "deleted": self.visible(event["deleted"]),
+        }
+        if not any(data.values()):
+            return
+        try:
+            self.queue.put_nowait({"event": "ledger", "data": data})
+        except queue.Full:
+            self.overflowed = True
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.ready.set)
+
+    def _next(self):
+        if self.overflowed:
+            self.overflowed = False
+            with self.queue.mutex:
+                self.queue.queue.clear()
+            return {"event": "reset", "data": {}}
+        return self.queue.get_nowait()
+
+    def get(self, timeout=None):
+        """Return the next event, or `None` if there is none within `timeout`."""
+        try:
+            if self.overflowed:
+                return self._next()
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    async def aget(self, timeout=None):
+        """Return the next event, or `None` if there is none within `timeout`."""
+        self.ready.clear()
+        try:
+            return self._next()
+        except queue.Empty:
+            pass
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        try:
+            return self._next()
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self._unsubscribe()
+
+
+def stream(user_id, all_users=False):
+    """Yield the events for a user, and `None` at least every heartbeat.
+
+    The subscription starts when the stream is first read, which is
+    immediately followed by a heartbeat.
+
+    """
+    heartbeat = options()["HEARTBEAT"]
+    subscription = Subscription(user_id, all_users)
+    try:
+        yield None
+        while True:
+            yield subscription.get(timeout=heartbeat)
+    finally:
+        subscription.close()
+
+
+async def astream(user_id, all_users=False):
+    """The asynchronous version of `stream()`, for the event loop."""
+    heartbeat = options()["HEARTBEAT"]
+    subscription = Subscription(user_id, all_users, loop=asyncio.get_event_loop())
+    try:
+        yield None
+        while True:
+            yield await subscription.aget(timeout=heartbeat)
+    finally:
+        subscription.close()
+
+
+def publish(balances=(), transactions=(), deleted=()):
+    """Publish a change to the ledger once the current transaction commits.
+
+    :balances: A dict mapping account `pk` values to the change of their
+               balance.
+    :transactions: A list of `(user_id, pk)` of the transactions created or
+                   updated.
+    :deleted: A list of `(user_id, pk)` of the transactions deleted.
+
+    """
+    balances = {k: v for k, v in dict(balances).items() if v}
+    transactions = [{"user": u, "id": pk} for u, pk in transactions]
+    deleted = [{"user": u, "id": pk} for u, pk in deleted]
+
+    def send():
+        backend = get_backend()
+        if not backend.listening():
+            return
+        values = dict(Balance.objects.filter(
+            account_id__in=balances).values_list("account_id", "value")) if balances else {}
+        backend.publish({
+            "balances": [
+                {"account": account_id, "delta": "{:.2f}".format(delta),
+                 "value": "{:.2f}".format(values[account_id])
+                 if account_id in values else None}
+                for account_id, delta in sorted(balances.items())
+            ],
+            "transactions": transactions,
+            "deleted": deleted,
+        })
+
+    if balances or transactions or deleted:
+        transaction.on_commit(send)
+
+
+def _publish_ledger(sender, balances=None, transactions=None, deleted=None, **kwargs):
+    publish(balances or {}, transactions or (), deleted or ())
+
+
+def connect_signals():
+    """Publish every change to the ledger."""
+    ledger_changed.connect(_publish_ledger, dispatch_uid="events-ledger")
@@ -0,0 +1,37 @@
+"""Export of transactions as flat rows.
+
+The rows have the columns read by `importers.parse_csv()`, so an export can be
+imported again with the `import_transactions` command.
+
+"""
+from collections import OrderedDict
+
+# The number of rows fetched from the database at a time.
+EXPORT_CHUNK_SIZE = 2000
+
+# The columns of each row, and the field each is read from.
+EXPORT_COLUMNS = OrderedDict((
+    ("id", "id"),
+    ("date", "date"),
+    ("description", "description"),
+    ("amount", "amount"),
+    ("action", "action"),
+    ("account", "account__name"),
+    ("category", "category__name"),
+    ("tax_deduction", "tax_deduction"),
+))
+
+
+def export_rows(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield a dict of each transaction in `queryset`.
+
+    The transactions are read with a server-side cursor where the database
+    supports one, so any number of them can be exported in bounded memory.
+
+    """
+    fields = list(EXPORT_COLUMNS.values())
+    for values in queryset.values_list(*fields).iterator(chunk_size=chunk_size):
+        row = OrderedDict(zip(EXPORT_COLUMNS, values))
+        row["date"] = row["date"].isoformat()
+        row["amount"] = "{:.2f}".format(row["amount"])
+        yield row
@@ -0,0 +1,33 @@
+from django_filters import rest_framework as filters
+from transactions.models import Transaction
+
+
+class NumberInFilter(filters.BaseInFilter, filters.NumberFilter):
+    """Filter on a comma-separated list of numbers."""
+    pass
+
+
+class TransactionFilter(filters.FilterSet):
+    """Filters for Transaction objects.
+
+    Accounts and categories are filtered by id (or a comma-separated list of
+    ids) without looking them up, so filtering never adds queries.
+
+    """
+    date_from = filters.DateFilter(name="date", lookup_expr="gte")
+    date_to = filters.DateFilter(name="date", lookup_expr="lte")
+    account = NumberInFilter(name="account_id", lookup_expr="in")
+    category = NumberInFilter(name="category_id", lookup_expr="in")
+    amount_min = filters.NumberFilter(name="amount", lookup_expr="gte")
+    amount_max = filters.NumberFilter(name="amount", lookup_expr="lte")
+    search = filters.CharFilter(name="description", lookup_expr="icontains")
+
+    class Meta:
+        model = Transaction
+        fields = (
+            "date_from", "date_to",
+            "account", "category",
+            "action", "tax_deduction",
+            "amount_min", "amount_max",
+            "search",
+        )
@@ -0,0 +1,113 @@
+"""Parsers for importing transactions from bank statement files.
+
+Each parser is a generator which reads its file one line at a time and yields
+a dict per transaction, so files of any size can be imported in bounded
+memory. `map_rows()` then resolves the account and category of each row into
+the ids expected by `TransactionSerializer`.
+
+"""
+import csv
+import re
+from decimal import Decimal, InvalidOperation
+
+from transactions.models import Account, Category
+
+# Matches an OFX tag and the (optional) value which follows it, in both the
+# SGML (OFX 1.x) and XML (OFX 2.x) dialects.
+OFX_TAG_RE = re.compile(r"<(/?[A-Za-z0-9.]+)>([^<\r\n]*)")
+
+ACTIONS = {"credit": 1, "debit": -1, "1": 1, "-1": -1}
+
+
+def parse_csv(lines):
+    """Yield a dict of each row of CSV data.
+
+    The first row must be a header naming the columns. The recognised columns
+    are `date`, `description`, `amount`, `action`, `account`, `category` and
+    `tax_deduction`; only `date`, `description` and `amount` are required.
+
+    """
+    for row in csv.DictReader(lines):
+        yield {k.strip().lower(): (v or "").strip() for k, v in row.items() if k}
+
+
+def parse_ofx(lines):
+    """Yield a dict of each `<STMTTRN>` transaction of OFX data."""
+    txn = None
+    for line in lines:
+        for tag, value in OFX_TAG_RE.findall(line):
+            tag = tag.upper()
+            if tag == "STMTTRN":
+                txn = {}
+            elif tag == "/STMTTRN" and txn is not None:
+                yield {
+                    "date": txn.get("DTPOSTED", ""),
+                    "description": txn.get("NAME") or txn.get("MEMO", ""),
+                    "amount": txn.get("TRNAMT", ""),
+                }
+                txn = None
+            elif txn is not None and not tag.startswith("/"):
+                txn[tag] = value.strip()
+
+
+PARSERS = {
+    "csv": parse_csv,
+    "ofx": parse_ofx,
+}
+
+
+def _lookup(model):
+    """Return a dict mapping the ids and names of `model` objects to ids."""
+    lookup = {}
+    for obj in model.objects.all():
+        for key in (str(obj.pk), obj.name, getattr(obj, "abbreviation", None)):
+            if key:
+                lookup.setdefault(key.lower(), obj.pk)
+    return lookup
+
+
+def _parse_date(value):
+    """Convert OFX (`YYYYMMDD...`) dates to ISO format."""
+    if re.match(r"^\d{8}", value):
+        return "%s-%s-%s" % (value[:4], value[4:6], value[6:8])
+    return value
+
+
+def map_rows(rows, user, account=None, category=None):
+    """Yield `TransactionSerializer` data for each row of parsed data.
+
+    Accounts and categories may be given by id, name or abbreviation, and
+    are looked up in memory. When a row has no `action`, the sign of its
+    `amount` decides whether it is a credit or a debit.
+
+    :user: The user the transactions belong to.
+
+    :account: The account used for rows which don't specify one.
+
+    :category: The category used for rows which don't specify one.
+
+    """
+    accounts = _lookup(Account)
+    categories = _lookup(Category)
+    for row in rows:
+        amount = row.get("amount", "").replace(",", "")
+        action = ACTIONS.get(row.get("action", "").lower())
+        try:
+            if action is None:
+                action = -1 if Decimal(amount) < 0 else 1
+            amount = str(abs(Decimal(amount)))
+        except InvalidOperation:
+            pass
+        yield {
+            "user_id": user.pk,
+            "date": _parse_date(row.get("date", "")),
+            "description": row.get("description", ""),
+            "amount": amount,
+            "action": action,
+            "account_id": accounts.get(
+                (row.get("account") or account or "").lower()),
+            "category_id": categories.get(
+                (row.get("category") or category or "").lower()),
+            "tax_deduction": row.get("tax_deduction", "").lower() in (
+                "1", "true", "yes"),
+        }
@@ -0,0 +1,190 @@
+import json
+import platform
+import re
+import time
+from datetime import datetime
+
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from transactions.benchmarks import (
+    Rollback, api_requests, http_client, percentile, seed_ledger)
+
+
+# Matches the query count in a `Server-Timing` header of `TimingMiddleware`.
+SERVER_TIMING_QUERIES_RE = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive every API endpoint and report the p50/p95/p99 latency, "
+        "throughput and query count of each. By default a synthetic ledger "
+        "of each size is seeded and requested through Django's test client, "
+        "and rolled back afterwards; with --url a running server (e.g. a "
+        "local gunicorn) is requested over HTTP with its existing data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--transactions", type=int, nargs="+", default=[10000],
+            help="The sizes of ledger to seed (e.g. 10000 100000 1000000).")
+        parser.add_argument(
+            "--requests", type=int, default=20,
+            help="The number of times each endpoint is requested.")
+        parser.add_argument(
+            "--cold", action="store_true",
+            help="Clear the cache before every request.")
+        parser.add_argument(
+            "--seed", type=int, default=0,
+            help="The seed for the random number generator.")
+        parser.add_argument(
+            "--url",
+            help="The base URL of a running server to request instead.")
+        parser.add_argument(
+            "--username", help="The user to log in to --url as.")
+        parser.add_argument(
+            "--password", help="The password of --username.")
+        parser.add_argument(
+            "--writes", action="store_true",
+            help="Also request endpoints which write, with --url.")
+        parser.add_argument(
+            "--output",
+            help="A file to write the results to as JSON.")
+
+    def measure(self, send, requests, repeat, cold):
+        """Return the results of sending each request `repeat` times.
+
+        :send: A function sending a request, which returns its status and
+               the number of queries it made (or `None` if unknown).
+
+        """
+        results = []
+        for name, method, path, data in requests:
+            timings, queries, statuses = [], [], set()
+            start = time.perf_counter()
+            for _ in range(repeat):
+                if cold:
+                    cache.clear()
+                request_start = time.perf_counter()
+                status, count = send(method, path, data)
+                timings.append((time.perf_counter() - request_start) * 1000)
+                statuses.add(status)
+                if count is not None:
+                    queries.append(count)
+            elapsed = time.perf_counter() - start
+            results.append({
+                "endpoint": name,
+                "method": method,
+                "path": path,
+                "status": sorted(statuses),
+                "requests": repeat,
+                "p50_ms": percentile(timings, 50),
+                "p95_ms": percentile(timings, 95),
+                "p99_ms": percentile(timings, 99),
+                "throughput_rps": repeat / elapsed,
+                "queries": sum(queries) / len(queries) if queries else None,
+            })
+        return results
+
+    def run_client(self, size, options):
+        """Seed a ledger of `size` transactions and request it in-process."""
+        host = next((h for h in settings.ALLOWED_HOSTS if "*" not in h), "localhost")
+        client = APIClient(HTTP_HOST=host.lstrip("."))
+
+        def get(path):
+            return json.loads(client.get(path).content.decode())
+
+        def post(path, data):
+            return json.loads(client.post(path, data, format="json").content.decode())
+
+        def send(method, path, data):
+            with CaptureQueriesContext(connection) as queries:
+                if method == "GET":
+                    response = client.get(path)
+                else:
+                    response = client.generic(
+                        method, path, "" if data is None else json.dumps(data),
+                        "application/json")
+                if response.streaming:
+                    b"".join(response.streaming_content)
+            return response.status_code, len(queries)
+
+        try:
+            with transaction.atomic():
+                self.stdout.write("Seeding %d transactions..." % size)
+                users = seed_ledger(size, seed=options["seed"])
+                client.force_login(users[0])
+                results = self.measure(
+                    send, api_requests(get, post), options["requests"], options["cold"])
+                raise Rollback
+        except Rollback:
+            pass
+        return results
+
+    def run_url(self, options):
+        """Request a running server over HTTP."""
+        if not options["username"] or not options["password"]:
+            raise CommandError("--url needs --username and --password.")
+        request = http_client(options["url"], options["username"], options["password"])
+
+        def get(path):
+            with request("GET", path) as response:
+                return json.loads(response.read().decode())
+
+        def post(path, data):
+            with request("POST", path, data) as response:
+                return json.loads(response.read().decode())
+
+        def send(method, path, data):
+            with request(method, path, data) as response:
+                response.read()
+                match = SERVER_TIMING_QUERIES_RE.search(
+                    response.headers.get("Server-Timing", ""))
+                return response.status, int(match.group(1)) if match else None
+
+        if options["writes"]:
+            requests = api_requests(get, post)
+        else:
+            requests = [r for r in api_requests(get) if r[1] == "GET"]
+        return self.measure(send, requests, options["requests"], options["cold"])
+
+    def handle(self, *args, **options):
+        report = {
+            "meta": {
+                "timestamp": datetime.utcnow().isoformat() + "Z",
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "database": connection.vendor,
+                "mode": "url" if options["url"] else "client",
+                "requests": options["requests"],
+                "cold": options["cold"],
+            },
+            "runs": [],
+        }
+        if options["url"]:
+            report["runs"].append({"transactions": None, "results": self.run_url(options)})
+        else:
+            for size in options["transactions"]:
+                report["runs"].append(
+                    {"transactions": size, "results": self.run_client(size, options)})
+
+        for run in report["runs"]:
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                "%s transactions" % (run["transactions"] or "Existing")))
+            for result in run["results"]:
+                self.stdout.write(
+                    "  %-30s p50 %8.2f ms  p95 %8.2f ms  p99 %8.2f ms  "
+                    "%8.1f req/s  %s queries" % (
+                        result["endpoint"], result["p50_ms"], result["p95_ms"],
+                        result["p99_ms"], result["throughput_rps"],
+                        "?" if result["queries"] is None else "%g" % result["queries"]))
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write("Results written to %s." % options["output"])
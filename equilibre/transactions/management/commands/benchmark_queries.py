@@ -0,0 +1,96 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Q, Sum
+
+from transactions.benchmarks import Rollback, explain, seed_ledger, time_query
+from transactions.models import Transaction
+from transactions.serializers import TransactionSerializer
+
+# Indexes created by migrations which aren't declared on the model.
+EXTRA_INDEXES = ("transaction_tax_deduction_idx",)
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a synthetic ledger and report the query plan and latency of "
+        "each TransactionViewSet access path, with and without the "
+        "transaction indexes. All data is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--transactions", type=int, default=100000,
+            help="The number of transactions to seed.")
+        parser.add_argument(
+            "--repeat", type=int, default=5,
+            help="The number of times each query is timed.")
+        parser.add_argument(
+            "--seed", type=int, default=0,
+            help="The seed for the random number generator.")
+
+    def access_paths(self, user):
+        """Return a list of `(name, queryset)` for each access path."""
+        recent = date.today() - timedelta(days=90)
+        base = TransactionSerializer.setup_eager_loading(
+            Transaction.objects.order_by("-date", "-id"))
+        mine = base.filter(user=user)
+        account_id = mine.values_list("account_id", flat=True).first()
+        middle = Transaction.objects.order_by("-date", "-id").values_list(
+            "date", "id")[Transaction.objects.count() // 2]
+        return [
+            ("list (all users)", base[:50]),
+            ("list (own)", mine[:50]),
+            ("list (own, deep page)", mine[5000:5050]),
+            ("keyset (deep page)", base.filter(
+                Q(date__lt=middle[0]) | Q(date=middle[0], id__lt=middle[1]))[:50]),
+            ("retrieve", base.filter(pk=middle[1])),
+            ("account over 90 days", mine.filter(
+                account_id=account_id, date__gte=recent)),
+            ("category totals over 90 days", Transaction.objects.filter(
+                user=user, date__gte=recent).values("category_id").annotate(
+                    total=Sum("amount"))),
+            ("tax deductions", mine.filter(tax_deduction=True)),
+        ]
+
+    def measure(self, paths, repeat):
+        results = {}
+        for name, queryset in paths:
+            results[name] = (
+                time_query(lambda: list(queryset.all()), repeat), explain(queryset))
+        return results
+
+    def drop_indexes(self):
+        names = [index.name for index in Transaction._meta.indexes]
+        names.extend(EXTRA_INDEXES)
+        with connection.cursor() as cursor:
+            for name in names:
+                try:
+                    with transaction.atomic():
+                        cursor.execute("DROP INDEX %s" % name)
+                except DatabaseError:
+                    pass
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.stdout.write("Seeding %d transactions..." % options["transactions"])
+                users = seed_ledger(options["transactions"], seed=options["seed"])
+                paths = self.access_paths(users[0])
+
+                indexed = self.measure(paths, options["repeat"])
+                self.drop_indexes()
+                unindexed = self.measure(paths, options["repeat"])
+                raise Rollback
+        except Rollback:
+            pass
+
+        for name, _ in paths:
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write("  without indexes: %8.2f ms" % unindexed[name][0])
+            for line in unindexed[name][1]:
+                self.stdout.write("    %s" % line)
+            self.stdout.write("  with indexes:    %8.2f ms" % indexed[name][0])
+            for line in indexed[name][1]:
+                self.stdout.write("    %s" % line)
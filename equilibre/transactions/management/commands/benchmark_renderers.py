@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from transactions import renderers
+from transactions.benchmarks import Rollback, seed_ledger, time_query
+from transactions.models import Balance, Transaction
+from transactions.serializers import BalanceSerializer, TransactionSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a synthetic ledger and compare the encode time and payload size "
+        "of each renderer for pages of transactions and the balances. All data "
+        "is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rows", type=int, nargs="+", default=[50, 500, 5000],
+            help="The page sizes of transactions to render.")
+        parser.add_argument(
+            "--repeat", type=int, default=5,
+            help="The number of times each payload is rendered.")
+        parser.add_argument(
+            "--seed", type=int, default=0,
+            help="The seed for the random number generator.")
+
+    def payloads(self, sizes):
+        """Return a list of `(name, data)` of each payload to render."""
+        queryset = Transaction.objects.order_by("-date", "-id").values(
+            *TransactionSerializer.values())
+        payloads = [
+            ("transactions (%d)" % rows,
+             TransactionSerializer(queryset[:rows], many=True).data)
+            for rows in sizes
+        ]
+        payloads.append((
+            "balances",
+            BalanceSerializer(Balance.objects.select_related("account"), many=True).data))
+        return payloads
+
+    def renderers(self):
+        """Return a list of `(name, renderer)` of each available renderer."""
+        available = [
+            ("json", JSONRenderer()),
+            ("json (orjson)" if renderers.orjson else "json (fallback)",
+             renderers.FastJSONRenderer()),
+        ]
+        if renderers.msgpack is not None:
+            available.append(("msgpack", renderers.MessagePackRenderer()))
+        return available
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.stdout.write("Seeding %d transactions..." % max(options["rows"]))
+                seed_ledger(max(options["rows"]), seed=options["seed"])
+                payloads = self.payloads(options["rows"])
+                raise Rollback
+        except Rollback:
+            pass
+
+        for name, data in payloads:
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            for renderer_name, renderer in self.renderers():
+                ms = time_query(lambda: renderer.render(data), options["repeat"])
+                size = len(renderer.render(data))
+                self.stdout.write("  %-16s %8.2f ms %10d bytes" % (
+                    renderer_name + ":", ms, size))
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from transactions.benchmarks import Rollback, measure_memory, seed_ledger, time_query
+from transactions.models import Transaction
+from transactions.serializers import TransactionSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a synthetic ledger and compare the throughput and memory of "
+        "serializing pages of transactions from model instances and from "
+        "`values()` rows. All data is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rows", type=int, nargs="+", default=[50, 500, 5000],
+            help="The page sizes to serialize.")
+        parser.add_argument(
+            "--repeat", type=int, default=5,
+            help="The number of times each page is serialized.")
+        parser.add_argument(
+            "--seed", type=int, default=0,
+            help="The seed for the random number generator.")
+
+    def paths(self, rows):
+        """Return a list of `(name, func)` serializing a page of `rows`."""
+        queryset = Transaction.objects.order_by("-date", "-id")
+        instances = TransactionSerializer.setup_eager_loading(queryset)[:rows]
+        values = queryset.values(*TransactionSerializer.values())[:rows]
+        return [
+            ("instances", lambda: TransactionSerializer(instances.all(), many=True).data),
+            ("values", lambda: TransactionSerializer(values.all(), many=True).data),
+        ]
+
+    def handle(self, *args, **options):
+        results = []
+        try:
+            with transaction.atomic():
+                self.stdout.write("Seeding %d transactions..." % max(options["rows"]))
+                seed_ledger(max(options["rows"]), seed=options["seed"])
+                for rows in options["rows"]:
+                    for name, func in self.paths(rows):
+                        ms = time_query(func, options["repeat"])
+                        results.append((rows, name, rows / ms * 1000, measure_memory(func)))
+                raise Rollback
+        except Rollback:
+            pass
+
+        for rows, name, rate, memory in results:
+            self.stdout.write("%5d rows, %-9s %10.0f rows/s %10.0f KiB" % (
+                rows, name + ":", rate, memory))
@@ -0,0 +1,88 @@
+import os
+import time
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from transactions.bulk import DEFAULT_CHUNK_SIZE, TransactionLoader, chunked
+from transactions.importers import PARSERS, map_rows
+from transactions.models import LedgerDeltas
+
+
+class Command(BaseCommand):
+    help = (
+        "Import transactions from a CSV or OFX file. Each chunk of rows is "
+        "committed separately along with its changes to balances and monthly "
+        "summaries, so the ledger stays consistent throughout and an "
+        "interrupted import can be resumed with --offset."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="The file to import.")
+        parser.add_argument(
+            "--format", choices=sorted(PARSERS),
+            help="The format of the file (default: from its extension).")
+        parser.add_argument(
+            "--user", required=True,
+            help="The username the transactions belong to.")
+        parser.add_argument(
+            "--account",
+            help="The account (id, name or abbreviation) of rows without one.")
+        parser.add_argument(
+            "--category",
+            help="The category (id or name) of rows without one.")
+        parser.add_argument(
+            "--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+            help="The number of rows inserted per query and transaction.")
+        parser.add_argument(
+            "--offset", type=int, default=0,
+            help="The number of rows to skip, to resume an earlier import.")
+        parser.add_argument(
+            "--dry-run", action="store_true",
+            help="Validate the rows without importing them.")
+
+    def handle(self, *args, **options):
+        fmt = options["format"] or os.path.splitext(
+            options["path"])[1].lstrip(".").lower()
+        if fmt not in PARSERS:
+            raise CommandError("Unknown file format '%s'." % fmt)
+        try:
+            user = User.objects.get(username=options["user"])
+        except User.DoesNotExist:
+            raise CommandError("Unknown user '%s'." % options["user"])
+
+        chunk_size = options["chunk_size"]
+        offset = options["offset"]
+        loader = TransactionLoader(
+            user, chunk_size=chunk_size, dry_run=options["dry_run"])
+        verb = "Validated" if options["dry_run"] else "Imported"
+
+        start = time.time()
+        position = offset
+        with open(options["path"], newline="") as f:
+            rows = map_rows(
+                PARSERS[fmt](f), user,
+                account=options["account"], category=options["category"])
+            for chunk in chunked(islice(rows, offset, None), chunk_size):
+                with transaction.atomic():
+                    loader.load(chunk, offset=position)
+                    if options["dry_run"]:
+                        loader.deltas = LedgerDeltas()
+                    else:
+                        loader.apply_totals()
+                position += len(chunk)
+
+                for error in loader.errors:
+                    self.stderr.write("Row %d: %s" % (error["index"], error["errors"]))
+                loader.errors = []
+
+                rate = (position - offset) / max(time.time() - start, 1e-6)
+                self.stdout.write(
+                    "%s %d rows (%d rows/s); resume with --offset %d" % (
+                        verb, loader.created, rate, position))
+
+        self.stdout.write(self.style.SUCCESS(
+            "%s %d of %d rows in %.1fs." % (
+                verb, loader.created, position - offset, time.time() - start)))
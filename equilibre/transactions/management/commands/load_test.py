@@ -0,0 +1,127 @@
+import json
+import platform
+import threading
+import time
+from datetime import datetime
+from urllib.error import HTTPError
+
+from django.core.management.base import BaseCommand
+
+from transactions.benchmarks import http_client, percentile
+
+# The read-heavy endpoints polled by clients.
+DEFAULT_PATHS = [
+    "/api/balances/",
+    "/api/transactions/",
+    "/api/accounts/",
+    "/api/category/",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Poll the read-heavy endpoints of a running server from an increasing "
+        "number of concurrent clients and report the throughput, latency and "
+        "errors at each concurrency. Run it against the sync deployment "
+        "(gunicorn equilibre.wsgi) and the ASGI one (uvicorn equilibre.asgi) "
+        "with the same number of processes to compare how many clients each "
+        "can hold."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", required=True, help="The base URL of the server.")
+        parser.add_argument("--username", required=True, help="The user to log in as.")
+        parser.add_argument("--password", required=True, help="The password of --username.")
+        parser.add_argument(
+            "--concurrency", type=int, nargs="+", default=[1, 10, 50, 100, 200],
+            help="The numbers of concurrent clients to try.")
+        parser.add_argument(
+            "--duration", type=float, default=10.0,
+            help="The number of seconds each concurrency is run for.")
+        parser.add_argument(
+            "--timeout", type=float, default=10.0,
+            help="The number of seconds after which a request has failed.")
+        parser.add_argument(
+            "--paths", nargs="+", default=DEFAULT_PATHS,
+            help="The paths polled, in turn, by each client.")
+        parser.add_argument(
+            "--label", default="",
+            help="A name for the deployment tested, e.g. 'sync' or 'asgi'.")
+        parser.add_argument(
+            "--output", help="A file to write the results to as JSON.")
+
+    def run(self, request, concurrency, paths, duration):
+        """Return the results of `concurrency` clients polling `paths`."""
+        timings, errors = [], []
+        lock = threading.Lock()
+        deadline = time.perf_counter() + duration
+
+        def client(offset):
+            i = offset
+            while time.perf_counter() < deadline:
+                path = paths[i % len(paths)]
+                i += 1
+                start = time.perf_counter()
+                try:
+                    with request("GET", path) as response:
+                        response.read()
+                    error = None
+                except HTTPError as e:
+                    error = "HTTP %d" % e.code
+                except OSError as e:
+                    error = type(getattr(e, "reason", e)).__name__
+                elapsed = (time.perf_counter() - start) * 1000
+                with lock:
+                    (errors if error else timings).append(error or elapsed)
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        total = len(timings) + len(errors)
+        return {
+            "concurrency": concurrency,
+            "requests": total,
+            "throughput_rps": len(timings) / elapsed,
+            "p50_ms": percentile(timings, 50),
+            "p95_ms": percentile(timings, 95),
+            "p99_ms": percentile(timings, 99),
+            "error_rate": len(errors) / total if total else 0.0,
+            "errors": {e: errors.count(e) for e in set(errors)},
+        }
+
+    def handle(self, *args, **options):
+        request = http_client(
+            options["url"], options["username"], options["password"],
+            timeout=options["timeout"])
+        report = {
+            "meta": {
+                "timestamp": datetime.utcnow().isoformat() + "Z",
+                "python": platform.python_version(),
+                "label": options["label"],
+                "url": options["url"],
+                "paths": options["paths"],
+                "duration": options["duration"],
+                "timeout": options["timeout"],
+            },
+            "results": [],
+        }
+        for concurrency in options["concurrency"]:
+            result = self.run(
+                request, concurrency, options["paths"], options["duration"])
+            report["results"].append(result)
+            self.stdout.write(
+                "%4d clients: %8.1f req/s  p50 %8.2f ms  p99 %8.2f ms  "
+                "%5.1f%% errors" % (
+                    concurrency, result["throughput_rps"],
+                    result["p50_ms"] or 0, result["p99_ms"] or 0,
+                    result["error_rate"] * 100))
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write("Results written to %s." % options["output"])
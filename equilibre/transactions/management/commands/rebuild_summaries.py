@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from transactions.models import MonthlySummary
+
+
+def _key(summary):
+    return (summary.user_id, summary.account_id, summary.category_id, summary.month)
+
+
+def _totals(summary):
+    return (summary.credit_total, summary.debit_total, summary.count)
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the monthly summaries from the transactions, reporting any "
+        "which had drifted from them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify", action="store_true",
+            help="Only report inconsistent summaries; fail if there are any.")
+
+    def handle(self, *args, **options):
+        expected = {_key(s): _totals(s) for s in MonthlySummary.objects.compute()}
+        actual = {_key(s): _totals(s) for s in MonthlySummary.objects.all()}
+
+        empty = (0, 0, 0)
+        mismatched = sorted(
+            key for key in set(expected) | set(actual)
+            if expected.get(key, empty) != actual.get(key, empty)
+        )
+        for key in mismatched:
+            self.stdout.write(
+                "user %s, account %s, category %s, %s: expected %s, found %s" % (
+                    key[0], key[1], key[2], key[3].strftime("%Y-%m"),
+                    expected.get(key, empty), actual.get(key, empty)))
+
+        if options["verify"]:
+            if mismatched:
+                raise CommandError("%d summaries are inconsistent." % len(mismatched))
+            self.stdout.write(self.style.SUCCESS(
+                "All %d summaries are consistent." % len(actual)))
+            return
+
+        summaries = MonthlySummary.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            "Rebuilt %d summaries (%d were inconsistent)." % (
+                len(summaries), len(mismatched))))
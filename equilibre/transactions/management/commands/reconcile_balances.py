@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from transactions.models import Balance
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare every account's balance with the sum of its transactions and "
+        "fix any which have drifted, e.g. after transactions were deleted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify", action="store_true",
+            help="Only report inconsistent balances; fail if there are any.")
+
+    def handle(self, *args, **options):
+        if options["verify"]:
+            drift = Balance.objects.drift()
+            self.report(drift)
+            if drift:
+                raise CommandError("%d balances are inconsistent." % len(drift))
+            self.stdout.write(self.style.SUCCESS("All balances are consistent."))
+            return
+
+        drift = Balance.objects.reconcile()
+        self.report(drift)
+        self.stdout.write(self.style.SUCCESS(
+            "Fixed %d inconsistent balances." % len(drift)))
+
+    def report(self, drift):
+        for account_id, (expected, actual) in sorted(drift.items()):
+            self.stdout.write("account %s: expected %s, found %s" % (
+                account_id, expected, "no balance" if actual is None else actual))
@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from transactions.benchmarks import seed_ledger
+
+
+class Command(BaseCommand):
+    help = (
+        "Create a synthetic ledger of users, accounts, categories and "
+        "transactions with bulk inserts, for benchmarks and load tests."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--transactions", type=int, default=10000,
+            help="The number of transactions to create.")
+        parser.add_argument(
+            "--users", type=int, default=3,
+            help="The number of users to create.")
+        parser.add_argument(
+            "--accounts", type=int, default=5,
+            help="The number of accounts to create.")
+        parser.add_argument(
+            "--categories", type=int, default=20,
+            help="The number of categories to create.")
+        parser.add_argument(
+            "--years", type=int, default=5,
+            help="The number of years the transactions are spread over.")
+        parser.add_argument(
+            "--batch-size", type=int, default=5000,
+            help="The number of transactions inserted per query.")
+        parser.add_argument(
+            "--seed", type=int, default=None,
+            help="The seed for the random number generator.")
+        parser.add_argument(
+            "--password",
+            help="The password of the users (by default they can't log in).")
+
+    def handle(self, *args, **options):
+        start = time.time()
+        with transaction.atomic():
+            users = seed_ledger(
+                options["transactions"], users=options["users"],
+                accounts=options["accounts"], categories=options["categories"],
+                years=options["years"], batch_size=options["batch_size"],
+                seed=options["seed"], password=options["password"])
+        self.stdout.write(self.style.SUCCESS(
+            "Created %d transactions for %s in %.1fs." % (
+                options["transactions"], ", ".join(u.username for u in users),
+                time.time() - start)))
@@ -0,0 +1,244 @@
+"""Metrics of the API, exposed in the Prometheus text format.
+
+Each process counts in memory. When `METRICS["DIR"]` is set, every process
+also writes its counts to a file of its own in that directory (at most once
+per `FLUSH_INTERVAL` seconds), and `/metrics` adds up the files of all the
+processes, so the numbers cover every gunicorn worker whichever one answers.
+
+"""
+import glob
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+logger = logging.getLogger("transactions.metrics")
+
+DEFAULTS = {
+    # Whether requests are counted by `MetricsMiddleware`.
+    "ENABLED": True,
+    # The directory shared by the processes of a server, or `None` to
+    # expose the metrics of each process on its own.
+    "DIR": os.environ.get("METRICS_DIR"),
+    # The minimum number of seconds between writes of a process's file.
+    "FLUSH_INTERVAL": 1.0,
+}
+
+# Buckets of durations in seconds.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def options():
+    """Return the `METRICS` setting, with defaults."""
+    return dict(DEFAULTS, **getattr(settings, "METRICS", {}))
+
+
+class Registry(object):
+    """The metrics of a process."""
+
+    def __init__(self):
+        self.metrics = OrderedDict()
+        self.lock = threading.Lock()
+        self._flushed = 0.0
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self):
+        """Return a dict of the values of every metric, as saved in files."""
+        with self.lock:
+            return {
+                name: [[list(labels), value] for labels, value in metric.values.items()]
+                for name, metric in self.metrics.items()
+            }
+
+    def reset(self):
+        """Forget the values of every metric of this process."""
+        with self.lock:
+            for metric in self.metrics.values():
+                metric.values.clear()
+
+    def flush(self, force=False):
+        """Write this process's values to its file in the metrics directory.
+
+        Errors writing the file are logged rather than raised, so that a
+        missing or unwritable directory never fails the request being counted.
+
+        """
+        opts = options()
+        now = time.time()
+        if not opts["DIR"] or (not force and now - self._flushed < opts["FLUSH_INTERVAL"]):
+            return
+        self._flushed = now
+        path = os.path.join(opts["DIR"], "metrics-%d.json" % os.getpid())
+        tmp = None
+        try:
+            # Write then rename, so readers never see a partly written file.
+            fd, tmp = tempfile.mkstemp(dir=opts["DIR"], suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp, path)
+        except OSError:
+            logger.exception("Could not write metrics to %s", path)
+            if tmp is not None and os.path.exists(tmp):
+                os.remove(tmp)
+
+    def collect(self):
+        """Return the values of every metric, added up over all processes.
+
+        :return: A dict mapping the name of each metric to a dict of its
+                 values by label values.
+
+        """
+        opts = options()
+        if not opts["DIR"]:
+            snapshots = [self.snapshot()]
+        else:
+            self.flush(force=True)
+            snapshots = []
+            for path in glob.glob(os.path.join(opts["DIR"], "metrics-*.json")):
+                try:
+                    with open(path) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+
+        totals = {name: {} for name in self.metrics}
+        for snapshot in snapshots:
+            for name, values in snapshot.items():
+                if name not in self.metrics:
+                    continue
+                for labels, value in values:
+                    labels = tuple(labels)
+                    totals[name][labels] = self.metrics[name].merge(
+                        totals[name].get(labels), value)
+        return totals
+
+    def expose(self):
+        """Return every metric in the Prometheus text format."""
+        lines = []
+        totals = self.collect()
+        for name, metric in self.metrics.items():
+            lines.append("# HELP %s %s" % (name, metric.help))
+            lines.append("# TYPE %s %s" % (name, metric.type))
+            for labels, value in sorted(totals[name].items()):
+                lines.extend(metric.expose(labels, value))
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{%s}" % ",".join(
+        '%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+        for k, v in pairs)
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter(object):
+    """A count which only goes up."""
+    type = "counter"
+
+    def __init__(self, name, help, labels=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self.registry = registry
+        registry.register(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def merge(self, total, value):
+        return (total or 0) + value
+
+    def expose(self, labels, value):
+        return ["%s%s %s" % (
+            self.name, _format_labels(self.labels, labels), _format_value(value))]
+
+
+class Histogram(object):
+    """A distribution of observed values, counted in cumulative buckets."""
+    type = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DURATION_BUCKETS,
+                 registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.values = {}
+        self.registry = registry
+        registry.register(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self.registry.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                # A count per bucket and the `+Inf` bucket, then the sum.
+                counts = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[len(self.buckets)] += 1
+            counts[-1] += value
+
+    def merge(self, total, value):
+        if total is None:
+            return list(value)
+        return [a + b for a, b in zip(total, value)]
+
+    def expose(self, labels, value):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ("+Inf",), value[:-1]):
+            cumulative += count
+            lines.append("%s_bucket%s %d" % (
+                self.name,
+                _format_labels(self.labels, labels, [("le", bound)]),
+                cumulative))
+        lines.append("%s_sum%s %s" % (
+            self.name, _format_labels(self.labels, labels), _format_value(value[-1])))
+        lines.append("%s_count%s %d" % (
+            self.name, _format_labels(self.labels, labels), cumulative))
+        return lines
+
+
+requests_total = Counter(
+    "api_requests_total", "Requests answered, by view, method and status.",
+    labels=("view", "method", "status"))
+request_duration = Histogram(
+    "api_request_duration_seconds", "Time taken to answer requests, by view.",
+    labels=("view",))
+queries_total = Counter(
+    "api_db_queries_total", "SQL queries made while answering requests, by view.",
+    labels=("view",))
+cache_requests_total = Counter(
+    "cache_requests_total", "Lookups in caches, by cache and result (hit or miss).",
+    labels=("cache", "result"))
+balance_updates_total = Counter(
+    "ledger_balance_updates_total",
+    "Changes applied to account balances by transaction writes.")
+ledger_update_duration = Histogram(
+    "ledger_update_duration_seconds",
+    "Time taken to apply the changes of transaction writes to balances, "
+    "monthly summaries and balance checkpoints.")
@@ -0,0 +1,153 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from transactions import metrics
+
+logger = logging.getLogger("transactions.timing")
+
+DEFAULTS = {
+    # Whether requests are timed at all.
+    "ENABLED": False,
+    # Requests with more queries than this are logged as warnings.
+    "QUERY_BUDGET": 20,
+    # Requests which take longer than this (in milliseconds) are logged as
+    # warnings.
+    "LATENCY_BUDGET_MS": 500,
+}
+
+
+class QueryTimer(object):
+    """A database execute wrapper which counts and times queries."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+class TimingMiddleware(object):
+    """Record the queries and time taken by each request.
+
+    The number of queries and the time spent in the database, in the view
+    (which, for API views, is mostly serialization) and rendering the
+    response are sent in a `Server-Timing` header and logged to
+    `transactions.timing`, as warnings for requests over the budgets of the
+    `REQUEST_TIMING` setting.
+
+    """
+
+    def __init__(self, get_response):
+        self.options = dict(DEFAULTS, **getattr(settings, "REQUEST_TIMING", {}))
+        if not self.options["ENABLED"]:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        request._timing = {"timer": timer, "view": 0.0, "render": 0.0}
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        total = time.perf_counter() - start
+
+        timings = request._timing
+        if "view_start" in timings:
+            # The response wasn't rendered by a view (e.g. it's streamed).
+            self._end_view(timings, time.perf_counter())
+        view = timings["view"]
+        response["Server-Timing"] = ", ".join((
+            'db;dur=%.1f;desc="%d queries"' % (timer.duration * 1000, timer.count),
+            "view;dur=%.1f" % (view * 1000),
+            "render;dur=%.1f" % (timings["render"] * 1000),
+            "total;dur=%.1f" % (total * 1000),
+        ))
+
+        over_budget = (
+            timer.count > self.options["QUERY_BUDGET"] or
+            total * 1000 > self.options["LATENCY_BUDGET_MS"])
+        logger.log(
+            logging.WARNING if over_budget else logging.INFO,
+            "method=%s path=%s status=%d queries=%d db_ms=%.1f view_ms=%.1f "
+            "render_ms=%.1f total_ms=%.1f over_budget=%s",
+            request.method, request.path, response.status_code, timer.count,
+            timer.duration * 1000, view * 1000, timings["render"] * 1000,
+            total * 1000, over_budget,
+            extra={
+                "method": request.method,
+                "path": request.path,
+                "status": response.status_code,
+                "queries": timer.count,
+                "db_ms": timer.duration * 1000,
+                "view_ms": view * 1000,
+                "render_ms": timings["render"] * 1000,
+                "total_ms": total * 1000,
+                "over_budget": over_budget,
+            })
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timings = request._timing
+        timings["view_start"] = time.perf_counter()
+        timings["view_db"] = timings["timer"].duration
+
+    def _end_view(self, timings, now):
+        # Time spent in the database is reported separately.
+        db = timings["timer"].duration - timings.pop("view_db")
+        timings["view"] = max(now - timings.pop("view_start") - db, 0.0)
+
+    def process_template_response(self, request, response):
+        timings = request._timing
+        start = time.perf_counter()
+        if "view_start" in timings:
+            self._end_view(timings, start)
+
+        def rendered(response):
+            timings["render"] = time.perf_counter() - start
+
+        response.add_post_render_callback(rendered)
+        return response
+
+
+class MetricsMiddleware(object):
+    """Count the requests, time and queries of each view for `/metrics`."""
+
+    def __init__(self, get_response):
+        if not metrics.options()["ENABLED"]:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        request._metrics_view = "unknown"
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+
+        view = request._metrics_view
+        metrics.request_duration.observe(time.perf_counter() - start, view=view)
+        metrics.requests_total.inc(
+            view=view, method=request.method, status=response.status_code)
+        metrics.queries_total.inc(timer.count, view=view)
+        metrics.REGISTRY.flush()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Viewsets are labelled by their class rather than by each action.
+        view = getattr(view_func, "cls", None) or getattr(view_func, "view_class", None)
+        request._metrics_view = (view or view_func).__name__
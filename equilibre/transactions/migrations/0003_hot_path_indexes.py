@@ -0,0 +1,43 @@
+# Generated by Django 2.0 on 2026-10-18 10:43
+
+from django.db import migrations, models
+
+# Partial index of tax deductible transactions, for backends which support
+# them. Django 2.0 can't declare these on the model.
+TAX_DEDUCTION_INDEX = "transaction_tax_deduction_idx"
+PARTIAL_INDEX_VENDORS = ("postgresql", "sqlite")
+
+
+def create_tax_deduction_index(apps, schema_editor):
+    if schema_editor.connection.vendor in PARTIAL_INDEX_VENDORS:
+        schema_editor.execute(
+            "CREATE INDEX %s ON transactions_transaction (user_id, date) "
+            "WHERE tax_deduction" % TAX_DEDUCTION_INDEX)
+
+
+def drop_tax_deduction_index(apps, schema_editor):
+    if schema_editor.connection.vendor in PARTIAL_INDEX_VENDORS:
+        schema_editor.execute("DROP INDEX %s" % TAX_DEDUCTION_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0002_transaction_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', 'date', 'id'], name='transaction_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['account', 'date'], name='transaction_account_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['category', 'date'], name='transaction_category_date_idx'),
+        ),
+        migrations.RunPython(create_tax_deduction_index, drop_tax_deduction_index),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 2.0 on 2026-10-18 10:48
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Case, Count, F, Sum, When
+from django.db.models.functions import TruncMonth
+
+
+def build_summaries(apps, schema_editor):
+    """Summarise the existing transactions."""
+    Transaction = apps.get_model("transactions", "Transaction")
+    MonthlySummary = apps.get_model("transactions", "MonthlySummary")
+    money = models.DecimalField(max_digits=12, decimal_places=2)
+    rows = Transaction.objects.annotate(
+        summary_month=TruncMonth("date"),
+    ).values(
+        "user_id", "account_id", "category_id", "summary_month",
+    ).annotate(
+        credit=Sum(Case(When(action=1, then=F("amount")), default=0, output_field=money)),
+        debit=Sum(Case(When(action=-1, then=F("amount")), default=0, output_field=money)),
+        num=Count("id"),
+    )
+    MonthlySummary.objects.bulk_create(
+        MonthlySummary(
+            user_id=row["user_id"], account_id=row["account_id"],
+            category_id=row["category_id"], month=row["summary_month"],
+            credit_total=row["credit"], debit_total=row["debit"],
+            count=row["num"])
+        for row in rows.iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('transactions', '0003_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlySummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='The first day of the month summarised.')),
+                ('credit_total', models.DecimalField(decimal_places=2, default=0, help_text='The total amount of credits.', max_digits=12)),
+                ('debit_total', models.DecimalField(decimal_places=2, default=0, help_text='The total amount of debits.', max_digits=12)),
+                ('count', models.IntegerField(default=0, help_text='The number of transactions.')),
+                ('account', models.ForeignKey(help_text='The payment account used.', on_delete=django.db.models.deletion.CASCADE, to='transactions.Account')),
+                ('category', models.ForeignKey(help_text='The category of the transactions.', on_delete=django.db.models.deletion.CASCADE, to='transactions.Category')),
+                ('user', models.ForeignKey(help_text='The user the transactions belong to.', on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='monthlysummary',
+            index=models.Index(fields=['user', 'month'], name='summary_user_month_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='monthlysummary',
+            unique_together={('user', 'account', 'category', 'month')},
+        ),
+        migrations.RunPython(build_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 2.0 on 2026-10-18 10:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0004_monthlysummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(help_text='The last day of the month of the balance.')),
+                ('value', models.DecimalField(decimal_places=2, default=0, help_text='The balance of the account at the end of the day.', max_digits=12)),
+                ('account', models.ForeignKey(help_text='The account the balance has been computed for.', on_delete=django.db.models.deletion.CASCADE, to='transactions.Account')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='balancecheckpoint',
+            unique_together={('account', 'date')},
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 2.0 on 2026-10-18 11:22
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('transactions', '0005_balancecheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransactionTombstone',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transaction_id', models.IntegerField(help_text='The `pk` of the deleted transaction.', unique=True)),
+                ('deleted', models.DateTimeField(default=django.utils.timezone.now, help_text='Timestamp of when the transaction was deleted.')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['updated', 'id'], name='transaction_updated_id_idx'),
+        ),
+        migrations.AddField(
+            model_name='transactiontombstone',
+            name='user',
+            field=models.ForeignKey(help_text='The user the transaction belonged to.', on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='transactiontombstone',
+            index=models.Index(fields=['deleted', 'transaction_id'], name='tombstone_deleted_idx'),
+        ),
+    ]
@@ -1,7 +1,22 @@
-from django.db import models
+import time
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models import Case, Count, F, Func, Sum, Value, When
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
 
 from django.contrib.auth.models import User
 
+from transactions import metrics
+from transactions.signals import ledger_changed
+
+# The number of transactions written per statement by bulk updates and
+# deletes, which select them by `pk` (within SQLite's limit of parameters).
+LOCKED_BATCH_SIZE = 500
+
 
 class Category(models.Model):
     """Model of the categories an expense belongs to."""
@@ -49,6 +64,153 @@ class Account(models.Model):
         return self.name
 
 
+class UserOwnedQuerySet(models.QuerySet):
+    """QuerySet for objects which belong to a user."""
+
+    def visible_to(self, user):
+        """Return the objects `user` is allowed to see."""
+        if user.has_perm("transaction.view"):
+            return self
+        return self.filter(user=user)
+
+
+class TransactionQuerySet(UserOwnedQuerySet):
+    """QuerySet for Transaction objects."""
+
+    def account_totals(self):
+        """Return a dict of the net value of the transactions per account.
+
+        The totals are computed with a single grouped aggregate query.
+
+        """
+        totals = self.order_by().values("account_id").annotate(
+            total=Sum(
+                F("amount") * F("action"),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2)))
+        return {row["account_id"]: row["total"] for row in totals}
+
+    def ledger_totals(self):
+        """Return the totals of the transactions per group of ledger values.
+
+        The totals are computed with a single grouped aggregate query.
+
+        :return: A list of `(values, count)`, where `values` is a dict of the
+                 `LEDGER_FIELDS` of `count` transactions, with the total of
+                 their `amount` and the first day of the month of their `date`.
+
+        """
+        rows = self.order_by().annotate(month=TruncMonth("date")).values(
+            "user_id", "account_id", "category_id", "action", "month",
+        ).annotate(total=Sum("amount"), num=Count("id"))
+        return [
+            ({"user_id": row["user_id"], "account_id": row["account_id"],
+              "category_id": row["category_id"], "action": row["action"],
+              "date": row["month"], "amount": row["total"]}, row["num"])
+            for row in rows
+        ]
+
+    def _lock(self):
+        """Lock the transactions; return a list of their `(user_id, pk)`."""
+        return list(self.select_for_update().order_by("pk").values_list("user_id", "pk"))
+
+    def _locked_batches(self):
+        """Lock the transactions; yield batches of them selected by `pk`.
+
+        Rows which come to match the filter once the transactions are locked
+        must be left alone, as they aren't in the totals read, so the locked
+        transactions are read and written by `pk` rather than by the filter.
+
+        :return: An iterator of `(rows, queryset)`, where `rows` is a list
+                 of the `(user_id, pk)` of the transactions of `queryset`.
+
+        """
+        rows = self._lock()
+        for start in range(0, len(rows), LOCKED_BATCH_SIZE):
+            batch = rows[start:start + LOCKED_BATCH_SIZE]
+            yield batch, type(self)(self.model, using=self.db).filter(
+                pk__in=[pk for _, pk in batch])
+
+    def update(self, **kwargs):
+        """Update the transactions, and the balances and summaries they affect.
+
+        The transactions are locked, then changed with an `UPDATE` per
+        `LOCKED_BATCH_SIZE` of them, and their net change to each balance
+        and summary is computed from an aggregate query of their totals
+        before the change. Ledger fields can only be set to values, not
+        expressions. The `updated` timestamp of every row is set, so that the
+        change is synced.
+
+        """
+        changes = {}
+        for name, value in kwargs.items():
+            field = self.model._meta.get_field(name)
+            if field.attname not in Transaction.LEDGER_FIELDS:
+                continue
+            if hasattr(value, "resolve_expression"):
+                raise ValueError(
+                    "Transactions can't be updated with an expression for '%s'." % name)
+            if isinstance(value, models.Model):
+                value = value.pk
+            changes[field.attname] = field.to_python(value)
+        kwargs.setdefault("updated", timezone.now())
+
+        count = 0
+        deltas = LedgerDeltas()
+        with transaction.atomic(using=self.db):
+            for rows, locked in self._locked_batches():
+                totals = locked.ledger_totals() if changes else []
+                count += super(TransactionQuerySet, locked).update(**kwargs)
+
+                for values, num in totals:
+                    deltas.add(values, sign=-1, count=num)
+                    new = dict(values, **changes)
+                    new["amount"] = changes["amount"] * num if "amount" in changes else values["amount"]
+                    deltas.add(new, count=num)
+                deltas.transactions.update(rows)
+                if "user_id" in changes:
+                    deltas.transactions.update((changes["user_id"], pk) for _, pk in rows)
+            deltas.apply()
+        return count
+
+    update.alters_data = True
+
+    def delete(self):
+        """Delete the transactions, reversing them out of balances and summaries.
+
+        The transactions are deleted with a `DELETE` per batch as for
+        `update()`, their totals are reversed out, and a tombstone is left
+        for each so that the deletion is synced. No `pre_delete` or
+        `post_delete` signals are sent.
+
+        """
+        assert self.query.can_filter(), \
+            "Cannot use 'limit' or 'offset' with delete."
+        if self._fields is not None:
+            raise TypeError("Cannot call delete() after .values() or .values_list()")
+
+        count = 0
+        deltas = LedgerDeltas()
+        now = timezone.now()
+        with transaction.atomic(using=self.db):
+            for rows, locked in self._locked_batches():
+                totals = locked.ledger_totals()
+                TransactionTombstone.objects.bulk_create([
+                    TransactionTombstone(transaction_id=pk, user_id=user_id, deleted=now)
+                    for user_id, pk in rows
+                ])
+                # Nothing refers to transactions, so there is nothing to collect.
+                count += locked._raw_delete(self.db)
+
+                for values, num in totals:
+                    deltas.add(values, sign=-1, count=num)
+                deltas.deleted.update(rows)
+            deltas.apply()
+        return count, {self.model._meta.label: count}
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+
 class Transaction(models.Model):
     """Model of transactions between accounts."""
     ACTION_CHOICES = (
@@ -122,55 +284,313 @@ class Transaction(models.Model):
         ("view", "Can view all transactions")
     )
 
+    objects = TransactionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of transactions, see `KeysetPagination`.
+            models.Index(fields=["date", "id"], name="transaction_date_id_idx"),
+            # Listing a user's transactions by date.
+            models.Index(fields=["user", "date", "id"], name="transaction_user_date_idx"),
+            # Totals of an account or category over a range of dates.
+            models.Index(fields=["account", "date"], name="transaction_account_date_idx"),
+            models.Index(fields=["category", "date"], name="transaction_category_date_idx"),
+            # Incremental sync of the transactions changed since a token.
+            models.Index(fields=["updated", "id"], name="transaction_updated_id_idx"),
+        ]
+
+    # Fields which contribute to balances and monthly summaries.
+    LEDGER_FIELDS = ("amount", "action", "account_id", "category_id", "user_id", "date")
+
     def _update_balances(self, _orig):
-        """Update the value of related balances.
+        """Update the value of related balances and monthly summaries.
 
-        :_orig: A copy of this instance with pre-save values.
+        :_orig: A dict of the pre-save values of `LEDGER_FIELDS`, or `None`
+                if the transaction is new.
 
         """
-        # Calculate how much the balance has changed (including handling null
-        # cases), and also check if the account has changed.
+        # Reverse-out the original values, and apply the new values to the
+        # (possibly different) current account and month. When nothing has
+        # moved the two changes simply net off.
+        deltas = LedgerDeltas()
         if _orig is not None:
-            amount_change = (self.amount * self.action) - (_orig.amount * _orig.action)
-            account_changed = self.account != _orig.account
-        else:
-            amount_change = self.amount * self.action
-            account_changed = False
-
-        # Handle cases where the account has changed by reversing-out the
-        # original values (e.g. transfer out the amount) and apply the whole
-        # value to the new account
-        if account_changed is True:
-            # Calculate the size of the old amount and update the balance of
-            # the old account by *reversing* it (i.e. '-=')
-            old_amount = _orig.amount * _orig.action
-            old_balance, _ = Balance.objects.get_or_create(account=_orig.account)
-            old_balance.value -= old_amount
-            old_balance.save()
-
-            # Then update the value of the new account with the whole value of the transaction
-            new_balance, _ = Balance.objects.get_or_create(account=self.account)
-            new_balance.value += self.amount * self.action
-            new_balance.save()
-
-        # Handle cases where the account remains the same by updating the
-        # amount of the account currently selected on the transaction
-        elif amount_change != 0:
-            balance, _ = Balance.objects.get_or_create(
-                account=self.account)
-            balance.value += amount_change
-            balance.save()
+            deltas.add(_orig, sign=-1)
+        deltas.add(self)
+        deltas.apply()
 
     def save(self, *args, **kwargs):
         """Override `save()` method to updated related balances."""
-        _orig = type(self).objects.get(pk=self.pk) if self.pk else None
-        super(Transaction, self).save(*args, **kwargs)
+        update_fields = kwargs.get("update_fields")
+        ledger_fields = set(self.LEDGER_FIELDS) | {
+            f[:-len("_id")] for f in self.LEDGER_FIELDS if f.endswith("_id")}
+        if update_fields is not None and ledger_fields.isdisjoint(update_fields):
+            return super(Transaction, self).save(*args, **kwargs)
+
+        with transaction.atomic():
+            # Lock the original row so that concurrent edits of the same
+            # transaction can't both reverse-out the same original value.
+            _orig = None
+            if self.pk:
+                _orig = type(self).objects.select_for_update().filter(
+                    pk=self.pk).values("id", *self.LEDGER_FIELDS).first()
+
+            super(Transaction, self).save(*args, **kwargs)
+            self._update_balances(_orig)
+
+    def delete(self, using=None, keep_parents=False):
+        """Override `delete()` method to update related balances."""
+        deleted = type(self).objects.db_manager(using).filter(pk=self.pk).delete()
+        self.pk = None
+        return deleted
+
+
+class LedgerDeltas(object):
+    """Accumulate the changes transactions make to balances and summaries.
+
+    The changes of many transactions are netted off, so that each balance,
+    monthly summary and balance checkpoint is updated at most once when they
+    are applied. The `(user_id, pk)` of the transactions saved and deleted are
+    collected for `ledger_changed`.
+
+    """
+
+    def __init__(self):
+        self.balances = defaultdict(int)
+        self.summaries = defaultdict(lambda: [0, 0, 0])
+        self.transactions = set()
+        self.deleted = set()
 
-        # Update the related balances
-        self._update_balances(_orig)
+    def add(self, values, sign=1, count=1):
+        """Add the changes made by a transaction.
 
-        # Call the "real" save() method.
-        super().save(*args, **kwargs)
+        :values: A Transaction, or a dict of its `LEDGER_FIELDS` (and `id`).
+
+        :sign: 1 to add the transaction, or -1 to reverse it out.
+
+        :count: The number of transactions `values` stands for, when its
+                `amount` is their total (see `ledger_totals()`).
+
+        """
+        if not isinstance(values, dict):
+            values = dict(
+                {f: getattr(values, f) for f in Transaction.LEDGER_FIELDS},
+                id=values.pk)
+        if values.get("id") is not None:
+            self.transactions.add((values["user_id"], values["id"]))
+        amount = sign * values["amount"]
+        self.balances[values["account_id"]] += amount * values["action"]
+
+        summary = self.summaries[(
+            values["user_id"], values["account_id"], values["category_id"],
+            values["date"].replace(day=1))]
+        summary[0 if values["action"] == 1 else 1] += amount
+        summary[2] += sign * count
+
+    def checkpoints(self):
+        """Return a dict of the net change per `(account_id, month)`."""
+        checkpoints = defaultdict(int)
+        for (_, account_id, _, month), (credit, debit, _) in self.summaries.items():
+            checkpoints[(account_id, month)] += credit - debit
+        return checkpoints
+
+    def apply(self):
+        """Apply the accumulated changes to balances and summaries."""
+        start = time.perf_counter()
+        Balance.objects.apply_deltas(self.balances)
+        metrics.balance_updates_total.inc(
+            len([v for v in self.balances.values() if v]))
+        MonthlySummary.objects.apply_deltas(self.summaries)
+        BalanceCheckpoint.objects.apply_deltas(self.checkpoints())
+        user_ids = {key[0] for key in self.summaries} | {
+            user_id for user_id, _ in self.transactions | self.deleted}
+        ledger_changed.send(
+            sender=Transaction, user_ids=user_ids, balances=dict(self.balances),
+            transactions=sorted(self.transactions), deleted=sorted(self.deleted))
+        metrics.ledger_update_duration.observe(time.perf_counter() - start)
+        self.balances.clear()
+        self.summaries.clear()
+        self.transactions.clear()
+        self.deleted.clear()
+
+
+class RunningTotalManager(models.Manager):
+    """Manager for models which hold running totals."""
+
+    def increment(self, lookup, deltas, **defaults):
+        """Add amounts to the totals of the object matching `lookup`.
+
+        The totals are changed with a single `UPDATE ... SET total = total +
+        delta`, so concurrent writers never lose each other's updates. The
+        object is created if it doesn't exist yet.
+
+        :lookup: A dict of the field values which identify the object.
+
+        :deltas: A dict mapping fields to the amount to add to them.
+
+        :defaults: Other field values to set.
+
+        """
+        if self._add(lookup, deltas, defaults):
+            return
+        try:
+            with transaction.atomic():
+                self.create(**dict(lookup, **dict(deltas, **defaults)))
+        except IntegrityError:
+            # Another writer created the object first; add to theirs.
+            self._add(lookup, deltas, defaults)
+
+    def _add(self, lookup, deltas, defaults):
+        """Add `deltas` to the object matching `lookup`; return the rows changed."""
+        updates = dict(defaults)
+        for field, delta in deltas.items():
+            value = F(field) + delta
+            model_field = self.model._meta.get_field(field)
+            if isinstance(model_field, models.DecimalField):
+                # Round in the database, as SQLite does its arithmetic in
+                # floating point and would otherwise accumulate error.
+                value = Func(
+                    value, Value(model_field.decimal_places),
+                    function="ROUND", output_field=model_field)
+            updates[field] = value
+        return self.filter(**lookup).update(**updates)
+
+
+class BalanceManager(RunningTotalManager):
+    """Manager for Balance objects."""
+
+    def apply_deltas(self, deltas):
+        """Add an amount to the balance of one or more accounts.
+
+        Missing balances are created on demand.
+
+        :deltas: A dict mapping account `pk` values to the amount to add.
+
+        """
+        now = timezone.now()
+        # Update in a consistent order so that concurrent writers touching the
+        # same pair of accounts can't deadlock each other.
+        for account_id in sorted(deltas):
+            if deltas[account_id]:
+                self.increment(
+                    {"account_id": account_id}, {"value": deltas[account_id]},
+                    updated=now)
+
+    def recompute(self, account_ids):
+        """Set the balance of accounts to the sum of their transactions.
+
+        The totals are read and then written without locking, so this is
+        only for when nothing else is writing to the ledger (e.g. after
+        seeding it); use `apply_deltas()` otherwise.
+
+        :account_ids: The `pk` values of the accounts to recompute.
+
+        """
+        account_ids = set(account_ids)
+        totals = Transaction.objects.filter(
+            account_id__in=account_ids).account_totals()
+        previous = dict(self.filter(account_id__in=account_ids).values_list(
+            "account_id", "value"))
+        now = timezone.now()
+        for account_id in sorted(account_ids):
+            value = totals.get(account_id, 0)
+            if not self.filter(account_id=account_id).update(
+                    value=value, updated=now):
+                self.create(account_id=account_id, value=value)
+        ledger_changed.send(
+            sender=Transaction, user_ids=set(), balances={
+                account_id: totals.get(account_id, 0) - previous.get(account_id, 0)
+                for account_id in account_ids},
+            transactions=[], deleted=[])
+
+    def drift(self, account_ids=None, lock=False):
+        """Return the balances which differ from the sum of their transactions.
+
+        The stored balances are read with one query, and the expected
+        balances are then computed with a single grouped aggregate query.
+
+        :account_ids: The `pk` values of the accounts to check, or `None` to
+                      check every account.
+
+        :lock: If `True`, the stored balances are locked until the end of the
+               current transaction, so that no change to them can be
+               committed before the drift is repaired (see `reconcile()`).
+
+        :return: A dict mapping account `pk` values to `(expected, actual)`,
+                 where `actual` is `None` if the account has no balance.
+
+        """
+        transactions = Transaction.objects.all()
+        balances = self.all()
+        if account_ids is not None:
+            account_ids = set(account_ids)
+            transactions = transactions.filter(account_id__in=account_ids)
+            balances = balances.filter(account_id__in=account_ids)
+        if lock:
+            # In the order in which `apply_deltas()` locks them.
+            balances = balances.select_for_update().order_by("account_id")
+        # Writers change a balance before committing their transactions, so
+        # once the balances are read (and locked) every transaction committed
+        # later is in a change still to be made to them.
+        actual = dict(balances.values_list("account_id", "value"))
+        expected = transactions.account_totals()
+
+        drift = {}
+        for account_id in set(expected) | set(actual):
+            value = expected.get(account_id) or Decimal(0)
+            if actual.get(account_id) is None or value != actual[account_id]:
+                drift[account_id] = (value, actual.get(account_id))
+        return drift
+
+    def reconcile(self, account_ids=None):
+        """Repair every drifted balance, and return the drift repaired.
+
+        The balances are locked while they are compared and repaired, so
+        that changes committed in between aren't overwritten.
+
+        :account_ids: As for `drift()`.
+
+        """
+        with transaction.atomic(using=self.db):
+            drift = self.drift(account_ids, lock=True)
+            self.repair(drift)
+        return drift
+
+    def repair(self, drift):
+        """Set drifted balances to their expected values.
+
+        The balances must not have changed since `drift()` read them; use
+        `reconcile()` to compare and repair them together.
+
+        Existing balances are fixed with a single UPDATE, and missing ones are
+        created with a single INSERT.
+
+        :drift: A dict as returned by `drift()`.
+
+        """
+        now = timezone.now()
+        existing = {
+            account_id: expected
+            for account_id, (expected, actual) in drift.items()
+            if actual is not None
+        }
+        with transaction.atomic():
+            if existing:
+                self.filter(account_id__in=existing).update(
+                    value=Case(
+                        *[When(account_id=account_id, then=Value(value))
+                          for account_id, value in sorted(existing.items())],
+                        output_field=Balance._meta.get_field("value")),
+                    updated=now)
+            self.bulk_create([
+                Balance(account_id=account_id, value=expected, updated=now)
+                for account_id, (expected, actual) in sorted(drift.items())
+                if actual is None
+            ])
+            ledger_changed.send(
+                sender=Transaction, user_ids=set(), balances={
+                    account_id: expected - (actual or 0)
+                    for account_id, (expected, actual) in drift.items()},
+                transactions=[], deleted=[])
 
 
 class Balance(models.Model):
@@ -194,5 +614,270 @@ class Balance(models.Model):
         blank=True, null=True
     )
 
+    objects = BalanceManager()
+
     def __str__(self):
         return self.account.name
+
+
+class MonthlySummaryManager(RunningTotalManager.from_queryset(UserOwnedQuerySet)):
+    """Manager for MonthlySummary objects."""
+
+    def apply_deltas(self, deltas):
+        """Add to the totals of one or more monthly summaries.
+
+        Missing summaries are created on demand.
+
+        :deltas: A dict mapping `(user_id, account_id, category_id, month)`
+                 to a list of the `[credit, debit, count]` to add.
+
+        """
+        for key in sorted(deltas):
+            credit, debit, count = deltas[key]
+            if not (credit or debit or count):
+                continue
+            user_id, account_id, category_id, month = key
+            self.increment(
+                {"user_id": user_id, "account_id": account_id,
+                 "category_id": category_id, "month": month},
+                {"credit_total": credit, "debit_total": debit, "count": count})
+
+    def compute(self):
+        """Return unsaved summaries computed from all transactions."""
+        money = models.DecimalField(max_digits=12, decimal_places=2)
+        rows = Transaction.objects.order_by().annotate(
+            summary_month=TruncMonth("date"),
+        ).values(
+            "user_id", "account_id", "category_id", "summary_month",
+        ).annotate(
+            credit=Sum(Case(When(action=1, then=F("amount")), default=0, output_field=money)),
+            debit=Sum(Case(When(action=-1, then=F("amount")), default=0, output_field=money)),
+            num=Count("id"),
+        )
+        return [
+            self.model(
+                user_id=row["user_id"], account_id=row["account_id"],
+                category_id=row["category_id"], month=row["summary_month"],
+                credit_total=row["credit"], debit_total=row["debit"],
+                count=row["num"])
+            for row in rows
+        ]
+
+    def rebuild(self):
+        """Replace all summaries with ones computed from the transactions.
+
+        The summaries are locked against writers before the transactions are
+        read, and replaced in the same transaction, so that changes committed
+        in between aren't lost: writers change summaries before committing
+        their transactions, so every transaction committed later is in a
+        change still to be made to them.
+
+        Balance checkpoints are computed from the summaries, so they are
+        discarded to be recomputed when next needed.
+
+        """
+        with transaction.atomic(using=self.db):
+            connection = connections[self.db]
+            if connection.vendor == "postgresql":
+                # Deleting the rows doesn't stop new ones being inserted.
+                with connection.cursor() as cursor:
+                    cursor.execute("LOCK TABLE %s IN SHARE ROW EXCLUSIVE MODE" % (
+                        connection.ops.quote_name(self.model._meta.db_table)))
+            # Deleting first locks the summaries (and on SQLite, the database)
+            # before the transactions are read.
+            self.all().delete()
+            summaries = self.compute()
+            self.bulk_create(summaries)
+            BalanceCheckpoint.objects.all().delete()
+        return summaries
+
+
+class MonthlySummary(models.Model):
+    """Model of the totals of transactions per user, account, category and month.
+
+    Summaries are kept up to date as transactions are saved, so reports can be
+    read from them rather than aggregating every transaction.
+
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        help_text="The user the transactions belong to.",
+    )
+    account = models.ForeignKey(
+        Account,
+        on_delete=models.CASCADE,
+        help_text="The payment account used.",
+    )
+    category = models.ForeignKey(
+        Category,
+        on_delete=models.CASCADE,
+        help_text="The category of the transactions.",
+    )
+    month = models.DateField(
+        help_text="The first day of the month summarised.",
+    )
+    credit_total = models.DecimalField(
+        decimal_places=2,
+        max_digits=12,
+        default=0,
+        help_text="The total amount of credits.",
+    )
+    debit_total = models.DecimalField(
+        decimal_places=2,
+        max_digits=12,
+        default=0,
+        help_text="The total amount of debits.",
+    )
+    count = models.IntegerField(
+        default=0,
+        help_text="The number of transactions.",
+    )
+
+    objects = MonthlySummaryManager()
+
+    class Meta:
+        unique_together = ("user", "account", "category", "month")
+        indexes = [
+            models.Index(fields=["user", "month"], name="summary_user_month_idx"),
+        ]
+
+    def __str__(self):
+        return "%s %s %s %s" % (
+            self.user_id, self.account_id, self.category_id,
+            self.month.strftime("%Y-%m"))
+
+
+class BalanceCheckpointManager(RunningTotalManager):
+    """Manager for BalanceCheckpoint objects."""
+
+    def apply_deltas(self, deltas):
+        """Add the changes to transactions to every later checkpoint.
+
+        :deltas: A dict mapping `(account_id, month)` to the net amount the
+                 account's transactions in that month have changed by.
+
+        """
+        for key in sorted(deltas):
+            if deltas[key]:
+                account_id, month = key
+                self._add(
+                    {"account_id": account_id, "date__gte": month},
+                    {"value": deltas[key]}, {})
+
+    def balances_as_of(self, as_of, account_ids):
+        """Return a dict of the balance of each account at the end of a day.
+
+        Each balance is read from the checkpoint at the end of the previous
+        month (creating it if necessary) plus the transactions since then.
+
+        :as_of: The date of the balances.
+
+        :account_ids: The `pk` values of the accounts.
+
+        """
+        account_ids = set(account_ids)
+        end = as_of.replace(day=1) - timedelta(days=1)
+        with transaction.atomic():
+            values = dict(self.filter(
+                account_id__in=account_ids, date=end).values_list("account_id", "value"))
+            for account_id in sorted(account_ids - set(values)):
+                values[account_id] = self._create(account_id, end).value
+            deltas = Transaction.objects.filter(
+                account_id__in=account_ids, date__gt=end, date__lte=as_of,
+            ).account_totals()
+        return {pk: values[pk] + deltas.get(pk, 0) for pk in account_ids}
+
+    def _create(self, account_id, date):
+        """Create the checkpoint of an account at the end of `date`.
+
+        The value is computed from the latest earlier checkpoint and the
+        monthly summaries since.
+
+        """
+        # Lock the account's balance so that no transaction can change the
+        # account until the new checkpoint exists for it to update.
+        list(Balance.objects.select_for_update().filter(account_id=account_id))
+
+        base = self.filter(
+            account_id=account_id, date__lt=date).order_by("-date").first()
+        summaries = MonthlySummary.objects.filter(
+            account_id=account_id, month__lte=date)
+        if base is not None:
+            summaries = summaries.filter(month__gt=base.date)
+        totals = summaries.aggregate(
+            credit=Sum("credit_total"), debit=Sum("debit_total"))
+        value = (
+            (base.value if base is not None else 0) +
+            (totals["credit"] or 0) - (totals["debit"] or 0))
+
+        try:
+            with transaction.atomic():
+                return self.create(account_id=account_id, date=date, value=value)
+        except IntegrityError:
+            # Another request created the checkpoint first.
+            return self.get(account_id=account_id, date=date)
+
+
+class BalanceCheckpoint(models.Model):
+    """Model of the balance of an account at the end of a month.
+
+    Checkpoints are created when first needed to answer a point-in-time
+    balance query, and are kept up to date as (possibly back-dated)
+    transactions are saved.
+
+    """
+    account = models.ForeignKey(
+        Account,
+        on_delete=models.CASCADE,
+        help_text="The account the balance has been computed for.",
+    )
+    date = models.DateField(
+        help_text="The last day of the month of the balance.",
+    )
+    value = models.DecimalField(
+        decimal_places=2,
+        max_digits=12,
+        default=0,
+        help_text="The balance of the account at the end of the day.",
+    )
+
+    objects = BalanceCheckpointManager()
+
+    class Meta:
+        unique_together = ("account", "date")
+
+    def __str__(self):
+        return "%s %s" % (self.account_id, self.date.isoformat())
+
+
+class TransactionTombstone(models.Model):
+    """Model of a deleted transaction.
+
+    Tombstones are kept so that clients syncing the changes to their
+    transactions (see `transactions.sync`) learn of deletions.
+
+    """
+    transaction_id = models.IntegerField(
+        unique=True,
+        help_text="The `pk` of the deleted transaction.",
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        help_text="The user the transaction belonged to.",
+    )
+    deleted = models.DateTimeField(
+        default=timezone.now,
+        help_text="Timestamp of when the transaction was deleted.",
+    )
+
+    objects = UserOwnedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["deleted", "transaction_id"], name="tombstone_deleted_idx"),
+        ]
+
+    def __str__(self):
+        return str(self.transaction_id)
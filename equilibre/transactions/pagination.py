@@ -0,0 +1,69 @@
+from django.db.models import Q
+from django.utils.dateparse import parse_date
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+
+
+class KeysetPagination(CursorPagination):
+    """Keyset pagination of transactions, newest first.
+
+    Pages are ordered on `(date, id)` and each cursor records the position of
+    the last (or first) row of the page, so fetching any page is a single
+    indexed range query: no `COUNT(*)` and no `OFFSET`, however deep the page.
+
+    """
+    ordering = ("-date", "-id")
+    page_size_query_param = "page_size"
+    max_page_size = 500
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        position = self.cursor and self.cursor.position
+
+        if position is not None:
+            date, pk = self._parse_position(position)
+            if reverse:
+                queryset = queryset.filter(Q(date__gt=date) | Q(date=date, id__gt=pk))
+            else:
+                queryset = queryset.filter(Q(date__lt=date) | Q(date=date, id__lt=pk))
+
+        ordering = ("date", "id") if reverse else self.ordering
+        results = list(queryset.order_by(*ordering)[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+
+        self.has_next = has_more if not reverse else position is not None
+        self.has_previous = has_more if reverse else position is not None
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(Cursor(
+            offset=0, reverse=False, position=self._position(self.page[-1])))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(Cursor(
+            offset=0, reverse=True, position=self._position(self.page[0])))
+
+    def _position(self, instance):
+        if isinstance(instance, dict):
+            return "%s|%d" % (instance["date"].isoformat(), instance["id"])
+        return "%s|%d" % (instance.date.isoformat(), instance.pk)
+
+    def _parse_position(self, position):
+        try:
+            date, pk = position.split("|")
+            date, pk = parse_date(date), int(pk)
+        except (TypeError, ValueError):
+            date = None
+        if date is None:
+            raise NotFound(self.invalid_cursor_message)
+        return date, pk
@@ -0,0 +1,49 @@
+import codecs
+import json
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+
+class NDJSONParser(BaseParser):
+    """Parser for newline-delimited JSON (one JSON object per line).
+
+    Rows are parsed lazily as they are read from the request stream, so large
+    uploads can be processed without holding the whole body in memory. Lines
+    which aren't valid JSON are passed through as strings, so that they are
+    reported as row errors rather than failing the whole request.
+
+    """
+    media_type = "application/x-ndjson"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+        return self._rows(codecs.getreader(encoding)(stream))
+
+    def _rows(self, lines):
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield line
+
+
+class MessagePackParser(BaseParser):
+    """Parser for MessagePack (requires `msgpack`)."""
+    media_type = "application/msgpack"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except Exception as exc:
+            raise ParseError("MessagePack parse error - %s" % exc)
@@ -0,0 +1,146 @@
+import csv
+import json
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+
+def _default(obj):
+    """Encode the types `orjson` and `msgpack` can't as DRF does for JSON."""
+    return JSONEncoder().default(obj)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """Renderer for JSON which encodes with `orjson` where it can.
+
+    The output is the same as `JSONRenderer`'s, as the types `orjson` doesn't
+    encode natively (including `Decimal` and dates) are encoded by DRF's
+    encoder. Indented or ASCII-only output, and all output when `orjson`
+    isn't installed, is rendered by `JSONRenderer`.
+
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if (orjson is None or data is None or indent is not None or
+                self.ensure_ascii or not self.compact):
+            return super(FastJSONRenderer, self).render(
+                data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(data, default=_default, option=(
+            orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME))
+        if b"\xe2\x80\xa8" in ret or b"\xe2\x80\xa9" in ret:
+            # Escape as `JSONRenderer` does, so the output is a strict subset
+            # of JavaScript.
+            ret = ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(
+                b"\xe2\x80\xa9", b"\\u2029")
+        return ret
+
+
+class MessagePackRenderer(BaseRenderer):
+    """Renderer for MessagePack (requires `msgpack`)."""
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return msgpack.packb(data, default=_default, use_bin_type=True)
+
+
+class RowRenderer(BaseRenderer):
+    """Base class for renderers of flat rows of data.
+
+    `render_rows()` encodes rows incrementally, so that it can be used with a
+    `StreamingHttpResponse`; `render()` renders a list of rows (or a single
+    row, such as an error) in one go.
+
+    """
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return b"".join(self.render_rows(data if isinstance(data, list) else [data]))
+
+    def render_rows(self, rows):
+        """Yield the encoded bytes of each row of `rows` (a dict per row)."""
+        raise NotImplementedError
+
+
+class NDJSONRenderer(RowRenderer):
+    """Renderer for newline-delimited JSON (one JSON object per line)."""
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+
+    def render_rows(self, rows):
+        for row in rows:
+            yield (json.dumps(row, cls=JSONEncoder) + "\n").encode(self.charset)
+
+
+class _Line(object):
+    """A file-like object whose `write()` returns what is written."""
+
+    def write(self, value):
+        return value
+
+
+class CSVRenderer(RowRenderer):
+    """Renderer for CSV, with a header of the first row's keys."""
+    media_type = "text/csv"
+    format = "csv"
+
+    def render_rows(self, rows):
+        writer = csv.writer(_Line())
+        header = None
+        for row in rows:
+            if header is None:
+                header = list(row)
+                yield writer.writerow(header).encode(self.charset)
+            yield writer.writerow([row.get(key) for key in header]).encode(self.charset)
+
+
+class EventStreamRenderer(RowRenderer):
+    """Renderer for server-sent events.
+
+    Each row is an event, a dict of its `event` name and its `data`, which
+    is sent as JSON; `None` is sent as a comment, which keeps idle streams
+    open. Anything else (such as an error) is sent as the data of an unnamed
+    event.
+
+    """
+    media_type = "text/event-stream"
+    format = "events"
+
+    def render_event(self, event):
+        if event is None:
+            return b": keep-alive\n\n"
+        name = event.get("event") if "data" in event else None
+        data = json.dumps(event["data"] if name else event, cls=JSONEncoder)
+        return ("%sdata: %s\n\n" % (
+            "event: %s\n" % name if name else "", data)).encode(self.charset)
+
+    def render_rows(self, rows):
+        for row in rows:
+            yield self.render_event(row)
+
+    async def render_rows_async(self, rows):
+        """Yield the encoded bytes of each row of an asynchronous iterable."""
+        try:
+            async for row in rows:
+                yield self.render_event(row)
+        finally:
+            if hasattr(rows, "aclose"):
+                await rows.aclose()
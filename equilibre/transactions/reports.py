@@ -0,0 +1,171 @@
+"""Aggregate reports of transactions, computed in the database.
+
+Reports which only need monthly totals are read from `MonthlySummary`, which
+has a row per user, account, category and month, rather than aggregating
+every transaction.
+
+"""
+import calendar
+from collections import OrderedDict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import models
+from django.db.models import Case, Count, F, Sum, When
+from django.db.models.functions import ExtractYear, TruncMonth
+
+from transactions.models import MonthlySummary
+
+# The fields a report may be grouped by, and the column each is read from.
+GROUP_FIELDS = OrderedDict((
+    ("account", "account_id"),
+    ("category", "category_id"),
+    ("action", "action"),
+    ("tax_deduction", "tax_deduction"),
+))
+
+# The periods a report may be grouped by. Weeks are folded together from
+# daily totals, as Django 2.0 can't truncate dates to weeks.
+PERIODS = ("year", "month", "week")
+
+# The group fields and filters which can be answered from monthly summaries.
+SUMMARY_GROUP_FIELDS = ("account", "category", "year", "month")
+SUMMARY_FILTERS = ("account", "category", "date_from", "date_to")
+
+MONEY = models.DecimalField(max_digits=12, decimal_places=2)
+CENT = Decimal("0.01")
+
+
+class ReportError(ValueError):
+    """Raised for an invalid report specification."""
+
+
+def parse_group_by(value):
+    """Return the list of fields in a comma-separated `group_by` value.
+
+    :raises: `ReportError` for unknown fields or more than one period.
+
+    """
+    fields = [f.strip() for f in (value or "").split(",") if f.strip()]
+    unknown = [f for f in fields if f not in GROUP_FIELDS and f not in PERIODS]
+    if unknown:
+        raise ReportError("Unknown group_by field(s): %s." % ", ".join(unknown))
+    if len([f for f in fields if f in PERIODS]) > 1:
+        raise ReportError("Only one of %s may be used." % ", ".join(PERIODS))
+    return fields
+
+
+def _period_expression(period, date_field):
+    if period == "year":
+        return ExtractYear(date_field)
+    if period == "month":
+        return TruncMonth(date_field)
+    return F(date_field)
+
+
+def _period_label(period, value):
+    if period == "year":
+        return value
+    if period == "month":
+        return value.strftime("%Y-%m")
+    return (value - timedelta(days=value.weekday())).isoformat()
+
+
+def summarise(queryset, group_by):
+    """Return the totals of the transactions in `queryset`, grouped by fields.
+
+    Each row has the value of each `group_by` field, the `credit`, `debit` and
+    net `total` of the group's transactions, and their `count`.
+
+    :queryset: A queryset of Transaction or MonthlySummary objects.
+
+    :group_by: A list of fields from `GROUP_FIELDS` and `PERIODS`.
+
+    """
+    from_summaries = queryset.model is MonthlySummary
+    date_field = "month" if from_summaries else "date"
+    period = next((f for f in group_by if f in PERIODS), None)
+    annotations = {}
+    values = []
+    for field in group_by:
+        if field == period:
+            annotations["_period"] = _period_expression(period, date_field)
+            values.append("_period")
+        else:
+            annotations["_" + field] = F(GROUP_FIELDS[field])
+            values.append("_" + field)
+
+    if from_summaries:
+        totals = dict(
+            _credit=Sum("credit_total"),
+            _debit=Sum("debit_total"),
+            _count=Sum("count"),
+        )
+    else:
+        totals = dict(
+            _credit=Sum(Case(When(action=1, then=F("amount")), default=0, output_field=MONEY)),
+            _debit=Sum(Case(When(action=-1, then=F("amount")), default=0, output_field=MONEY)),
+            _count=Count("id"),
+        )
+    rows = queryset.order_by().annotate(**annotations).values(*values).annotate(**totals)
+
+    groups = OrderedDict()
+    for row in rows:
+        key = tuple(
+            _period_label(period, row["_period"]) if field == period
+            else row["_" + field]
+            for field in group_by
+        )
+        group = groups.setdefault(key, [Decimal(0), Decimal(0), 0])
+        group[0] += row["_credit"] or 0
+        group[1] += row["_debit"] or 0
+        group[2] += row["_count"] or 0
+
+    results = []
+    for key in sorted(groups, key=lambda k: tuple((v is None, v) for v in k)):
+        credit, debit, count = groups[key]
+        result = OrderedDict(zip(group_by, key))
+        result["credit"] = str(credit.quantize(CENT))
+        result["debit"] = str(debit.quantize(CENT))
+        result["total"] = str((credit - debit).quantize(CENT))
+        result["count"] = count
+        results.append(result)
+    return results
+
+
+def summary_queryset(filters, group_by):
+    """Return the monthly summaries needed for a report, if it can use them.
+
+    :filters: The cleaned data of the report's `TransactionFilter`.
+
+    :group_by: A list of fields from `GROUP_FIELDS` and `PERIODS`.
+
+    :return: A queryset of MonthlySummary objects, or `None` if the report
+             needs totals which aren't summarised (e.g. weekly totals, or a
+             date range which doesn't cover whole months).
+
+    """
+    used = {k for k, v in filters.items() if v not in (None, "", [])}
+    if not set(group_by) <= set(SUMMARY_GROUP_FIELDS):
+        return None
+    if not used <= set(SUMMARY_FILTERS):
+        return None
+
+    date_from, date_to = filters.get("date_from"), filters.get("date_to")
+    if date_from and date_from.day != 1:
+        return None
+    if date_to and date_to.day != calendar.monthrange(date_to.year, date_to.month)[1]:
+        return None
+
+    # Summaries whose transactions have all moved away or been deleted are
+    # left at zero rather than removed, and mustn't be reported as groups.
+    queryset = MonthlySummary.objects.filter(count__gt=0)
+    if filters.get("account"):
+        queryset = queryset.filter(account_id__in=filters["account"])
+    if filters.get("category"):
+        queryset = queryset.filter(category_id__in=filters["category"])
+    if date_from:
+        queryset = queryset.filter(month__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(month__lte=date_to)
+    return queryset
@@ -1,5 +1,10 @@
+import operator
+from collections import OrderedDict
+
 from django.contrib.auth.models import User
+from django.db import models
 from rest_framework import serializers
+from transactions import cache
 from transactions.models import Account, Balance, Category, Transaction
 
 
@@ -32,7 +37,7 @@ class AccountSerializer(serializers.ModelSerializer):
 
 
     def get_icon(self, obj):
-        return obj.icon.url
+        return obj.icon.url if obj.icon else None
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -60,6 +65,134 @@ class UserSerializer(serializers.ModelSerializer):
         return obj.get_full_name()
 
 
+# The related objects of a transaction which may be nested, and the key they
+# are side-loaded under in compact lists.
+RELATED_FIELDS = OrderedDict((
+    ("user", "users"),
+    ("account", "accounts"),
+    ("category", "categories"),
+))
+
+
+def _split(value):
+    return [v.strip() for v in value.split(",") if v.strip()]
+
+
+def parse_representation(query_params):
+    """Return the representation of transactions requested by a client.
+
+    `?fields=` limits the output to a comma-separated list of fields,
+    `?expand=` nests only the listed related objects (the others are given
+    by id), and `?compact=true` gives every related object by id and
+    side-loads them in an `included` map of lists.
+
+    :return: A dict of `fields` and `expand` (a set, or `None` for all) and
+             `compact`.
+
+    :raises: `ValidationError` for unknown fields.
+
+    """
+    options = {"fields": None, "expand": None}
+    for name, allowed in (("fields", TransactionSerializer.READ_FIELDS),
+                          ("expand", RELATED_FIELDS)):
+        if name in query_params:
+            options[name] = set(_split(query_params[name]))
+            unknown = options[name] - set(allowed)
+            if unknown:
+                raise serializers.ValidationError({name: [
+                    "Unknown field(s): %s." % ", ".join(sorted(unknown))]})
+    options["compact"] = (
+        query_params.get("compact", "").lower() in ("1", "true"))
+    return options
+
+
+class TransactionListSerializer(serializers.ListSerializer):
+    """List serializer for Transaction objects, with a fast path for rows.
+
+    Rows fetched with `values(*TransactionSerializer.values())` are turned
+    into output directly, with the same shape as `TransactionSerializer`,
+    rather than by running the nested serializers and method fields for each
+    row. Lists of model instances are serialized as usual.
+
+    In compact lists, the related objects of the rows are collected in
+    `included`.
+
+    """
+    included = None
+
+    def to_representation(self, data):
+        rows = list(data.all() if isinstance(data, models.Manager) else data)
+        if not rows or not isinstance(rows[0], dict):
+            return super(TransactionListSerializer, self).to_representation(rows)
+
+        options = self.child.representation()
+        fields = self.child.fields
+        date = fields["date"].to_representation
+        amount = fields["amount"].to_representation
+        created = fields["created"].to_representation
+        updated = fields["updated"].to_representation
+        icon_url = Account._meta.get_field("icon").storage.url
+
+        related = {
+            "user": lambda row: OrderedDict((
+                ("username", row["user__username"]),
+                ("first_name", row["user__first_name"]),
+                ("last_name", row["user__last_name"]),
+                ("full_name", ("%s %s" % (
+                    row["user__first_name"], row["user__last_name"])).strip()),
+                ("email", row["user__email"]),
+            )),
+            "account": lambda row: OrderedDict((
+                ("id", row["account_id"]),
+                ("name", row["account__name"]),
+                ("abbreviation", row["account__abbreviation"]),
+                ("icon", icon_url(row["account__icon"]) if row["account__icon"] else None),
+            )),
+            "category": lambda row: OrderedDict((
+                ("id", row["category_id"]),
+                ("name", row["category__name"]),
+            )),
+        }
+        builders = OrderedDict((
+            ("id", lambda row: row["id"]),
+            ("user", related["user"]),
+            ("account", related["account"]),
+            ("date", lambda row: date(row["date"])),
+            ("action", lambda row: row["action"]),
+            ("amount", lambda row: amount(row["amount"])),
+            ("category", related["category"]),
+            ("description", lambda row: row["description"]),
+            ("tax_deduction", lambda row: row["tax_deduction"]),
+            ("created", lambda row: created(row["created"])),
+            ("created_by", lambda row: row["created_by__username"]),
+            ("updated", lambda row: updated(row["updated"])),
+            ("updated_by", lambda row: row["updated_by__username"]),
+        ))
+        if options["fields"] is not None:
+            builders = OrderedDict(
+                (k, v) for k, v in builders.items() if k in options["fields"])
+
+        sideloaded = []
+        for name in RELATED_FIELDS:
+            if name in builders and not self.child.is_expanded(name, options):
+                builders[name] = operator.itemgetter(name + "_id")
+                if options["compact"]:
+                    sideloaded.append(name)
+        if options["compact"]:
+            self.included = OrderedDict(
+                (RELATED_FIELDS[name], {}) for name in sideloaded)
+
+        results = []
+        for row in rows:
+            results.append(OrderedDict(
+                (name, build(row)) for name, build in builders.items()))
+            for name in sideloaded:
+                objects = self.included[RELATED_FIELDS[name]]
+                if row[name + "_id"] not in objects:
+                    objects[row[name + "_id"]] = related[name](row)
+        return results
+
+
 class TransactionSerializer(serializers.ModelSerializer):
     """Serializer for Transaction objects."""
     user = UserSerializer(read_only=True)
@@ -93,6 +226,39 @@ class TransactionSerializer(serializers.ModelSerializer):
             "updated",
             "updated_by"
         )
+        list_serializer_class = TransactionListSerializer
+
+    # The fields which are output, in order.
+    READ_FIELDS = (
+        "id", "user", "account", "date", "action", "amount", "category",
+        "description", "tax_deduction", "created", "created_by", "updated",
+        "updated_by",
+    )
+
+    # The columns read by the fast path of `TransactionListSerializer` for
+    # each field, and for each related object when it is nested.
+    FIELD_VALUES = {
+        "id": ("id",),
+        "user": ("user_id",),
+        "account": ("account_id",),
+        "date": ("date",),
+        "action": ("action",),
+        "amount": ("amount",),
+        "category": ("category_id",),
+        "description": ("description",),
+        "tax_deduction": ("tax_deduction",),
+        "created": ("created",),
+        "created_by": ("created_by__username",),
+        "updated": ("updated",),
+        "updated_by": ("updated_by__username",),
+    }
+    RELATED_VALUES = {
+        "user": (
+            "user__username", "user__first_name", "user__last_name",
+            "user__email"),
+        "account": ("account__name", "account__abbreviation", "account__icon"),
+        "category": ("category__name",),
+    }
 
     def __init__(self, *args, **kwargs):
         """Override __init__ method to set custom validation messages."""
@@ -103,13 +269,77 @@ class TransactionSerializer(serializers.ModelSerializer):
         self.fields["action"].error_messages["invalid_choice"] = "Select an action."
         self.fields["date"].error_messages["invalid"] = "You must enter a valid date (try YYYY-MM-DD)."
 
+    @classmethod
+    def values(cls, options=None):
+        """Return the columns to fetch for the fast path of lists.
+
+        Only the columns of the requested fields are fetched, along with the
+        `id` and `date` by which lists are paginated.
+
+        :options: The options returned by `parse_representation()`.
+
+        """
+        options = options or {"fields": None, "expand": None, "compact": False}
+        columns = ["id", "date"]
+        for name in cls.READ_FIELDS:
+            if options["fields"] is not None and name not in options["fields"]:
+                continue
+            columns.extend(cls.FIELD_VALUES[name])
+            if name in RELATED_FIELDS and (
+                    options["compact"] or cls.is_expanded(name, options)):
+                columns.extend(cls.RELATED_VALUES[name])
+        return list(OrderedDict.fromkeys(columns))
+
+    @staticmethod
+    def is_expanded(name, options):
+        """Return whether the related object `name` is nested in the output."""
+        return not options["compact"] and (
+            options["expand"] is None or name in options["expand"])
+
+    def representation(self):
+        """Return the representation options passed in the context."""
+        return self.context.get("representation") or {
+            "fields": None, "expand": None, "compact": False}
+
+    def to_representation(self, instance):
+        data = super(TransactionSerializer, self).to_representation(instance)
+        options = self.representation()
+        for name in RELATED_FIELDS:
+            if name in data and not self.is_expanded(name, options):
+                data[name] = getattr(instance, name + "_id")
+        if options["fields"] is not None:
+            for name in list(data):
+                if name not in options["fields"]:
+                    del data[name]
+        return data
+
     def get_created_by(self, obj):
         """Return the value for the `created_by` field."""
         return obj.created_by.username
 
     def get_updated_by(self, obj):
         """Return the value for the `updated_by` field."""
-        return obj.created_by.username
+        return obj.updated_by.username
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """Fetch the related objects used by this serializer in one query.
+
+        Only the columns which are actually serialized are selected.
+
+        """
+        return queryset.select_related(
+            "user", "account", "category", "created_by", "updated_by",
+        ).only(
+            "id", "user", "account", "category", "date", "action", "amount",
+            "description", "tax_deduction", "created", "created_by",
+            "updated", "updated_by",
+            "user__username", "user__first_name", "user__last_name",
+            "user__email",
+            "account__name", "account__abbreviation", "account__icon",
+            "category__name",
+            "created_by__username", "updated_by__username",
+        )
 
     def _handle_related_fields(self, validated_data):
         """Handle fields for writable related objects.
@@ -122,10 +352,10 @@ class TransactionSerializer(serializers.ModelSerializer):
                  `category` fields replaced by the applicable related objects.
 
         """
-        validated_data["account"] = Account.objects.get(
-            id=validated_data["account_id"])
-        validated_data["category"] = Category.objects.get(
-            id=validated_data["category_id"])
+        validated_data["account"] = cache.accounts.get(
+            validated_data["account_id"])
+        validated_data["category"] = cache.categories.get(
+            validated_data["category_id"])
         validated_data["user"] = User.objects.get(id=1)
 
         return validated_data
@@ -161,3 +391,11 @@ class BalanceSerializer(serializers.ModelSerializer):
     class Meta:
         model = Balance
         fields = "__all__"
+
+
+class HistoricalBalanceSerializer(serializers.Serializer):
+    """Read-only serializer for the balance of an account on a past date."""
+    id = serializers.IntegerField(read_only=True)
+    account = AccountSerializer(read_only=True)
+    value = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+    as_of = serializers.DateField(read_only=True)
@@ -0,0 +1,7 @@
+from django.dispatch import Signal
+
+# Sent by `LedgerDeltas.apply()` (and when balances are repaired or
+# recomputed) with the `pk` of every user whose transactions have changed, a
+# dict of the change of each account's balance, and lists of the
+# `(user_id, pk)` of the transactions saved (when known) and deleted.
+ledger_changed = Signal(providing_args=["user_ids", "balances", "transactions", "deleted"])
@@ -0,0 +1,116 @@
+"""Incremental sync of transactions.
+
+Clients keep a copy of their transactions up to date by asking for what has
+changed since the sync token of their last sync: the transactions created or
+updated (by their `updated` timestamp) and the tombstones of those deleted
+(left by `TransactionQuerySet.delete()`), both read in order through an
+index. A sync costs as much as the changes since the token, however long the
+history.
+
+Timestamps are taken when a row is written, but a transaction's rows may be
+committed a little later, after rows written after them. So that such rows
+aren't skipped, the token returned once a client has caught up is never
+later than `SYNC["MARGIN"]` seconds ago, and the changes of the last moments
+are sent again by the next sync; clients apply changes idempotently. Writes
+to the ledger must therefore commit well within the margin, which is why
+bulk loads commit each chunk of rows on its own (see `load_transactions()`).
+
+"""
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+DEFAULTS = {
+    # The number of seconds of changes sent again by the next sync.
+    "MARGIN": 5.0,
+    # The maximum number of changes returned at once.
+    "PAGE_SIZE": 500,
+}
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+Changes = namedtuple("Changes", "rows deleted token has_more")
+
+
+def options():
+    """Return the `SYNC` setting, with defaults."""
+    return dict(DEFAULTS, **getattr(settings, "SYNC", {}))
+
+
+class SyncError(ValueError):
+    """Raised for an invalid sync token."""
+
+
+def encode_token(timestamp, pk):
+    """Return the sync token of the changes up to `(timestamp, pk)`."""
+    return "%d.%d" % ((timestamp - EPOCH) // timedelta(microseconds=1), pk)
+
+
+def decode_token(token):
+    """Return the `(timestamp, pk)` of a sync token, or `None` if it's empty.
+
+    :raises: `SyncError` if the token is invalid.
+
+    """
+    if not token:
+        return None
+    try:
+        micros, pk = (int(part) for part in token.split("."))
+    except ValueError:
+        raise SyncError("Invalid sync token.")
+    return EPOCH + timedelta(microseconds=micros), pk
+
+
+def changes_since(transactions, tombstones, since=None, limit=None):
+    """Return the changes to transactions since a sync token.
+
+    :transactions: A queryset of the transactions to sync, which may return
+                   rows of `values()` including `updated`.
+    :tombstones: A queryset of the tombstones of the transactions to sync.
+    :since: The `(timestamp, pk)` of the token, or `None` for every change.
+    :limit: The maximum number of changes (by default `SYNC["PAGE_SIZE"]`).
+
+    :return: `Changes` of the transactions created or updated, the `pk` of
+             those deleted, the next token and whether there are more.
+
+    """
+    opts = options()
+    limit = limit or opts["PAGE_SIZE"]
+    if since is not None:
+        timestamp, pk = since
+        # The first condition bounds the range read from the index.
+        transactions = transactions.filter(updated__gte=timestamp).filter(
+            Q(updated__gt=timestamp) | Q(id__gt=pk))
+        tombstones = tombstones.filter(deleted__gte=timestamp).filter(
+            Q(deleted__gt=timestamp) | Q(transaction_id__gt=pk))
+
+    rows = transactions.order_by("updated", "id")[:limit + 1]
+    deleted = tombstones.order_by("deleted", "transaction_id").values_list(
+        "deleted", "transaction_id")[:limit + 1]
+    changes = sorted(
+        [((_get(row, "updated"), _get(row, "id")), row) for row in rows] +
+        [((timestamp, pk), None) for timestamp, pk in deleted],
+        key=lambda change: change[0])
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    last = changes[-1][0] if changes else since
+    if not has_more:
+        # Send the changes of the last moments again, in case any of their
+        # rows are still to be committed.
+        settled = (timezone.now() - timedelta(seconds=opts["MARGIN"]), 0)
+        last = settled if last is None or last > settled else last
+        if since is not None:
+            last = max(last, since)
+    return Changes(
+        rows=[row for _, row in changes if row is not None],
+        deleted=[pk for (_, pk), row in changes if row is None],
+        token=encode_token(*last),
+        has_more=has_more)
+
+
+def _get(row, name):
+    return row[name] if isinstance(row, dict) else getattr(row, name)
@@ -1,3 +1,1692 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import json
+import os
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management import CommandError, call_command
+from django.db import (
+    IntegrityError, OperationalError, close_old_connections, connection, transaction)
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _lazy
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from transactions import cache, events, metrics
+from transactions.asgi import ASGIHandler
+from transactions.bulk import TransactionLoader, load_transactions
+from transactions.models import (
+    Account, Balance, BalanceCheckpoint, Category, MonthlySummary, Transaction,
+    TransactionQuerySet, TransactionTombstone)
+from transactions.importers import map_rows, parse_csv
+from transactions.pagination import KeysetPagination
+from transactions.renderers import FastJSONRenderer, msgpack
+from transactions.reports import summarise
+from transactions.serializers import TransactionSerializer
+
+
+class LedgerMixin:
+    """Helpers for creating a minimal ledger."""
+
+    def make_ledger(self):
+        self.user = User.objects.create_user("alice", password="secret")
+        self.account = Account.objects.create(name="Cash", abbreviation="CASH")
+        self.other_account = Account.objects.create(name="Visa", abbreviation="VISA")
+        self.category = Category.objects.create(name="Food")
+
+    def make_transaction(self, amount="10.00", action=-1, account=None, **kwargs):
+        values = dict(
+            user=self.user,
+            date=datetime.date(2018, 1, 1),
+            description="Groceries",
+            amount=Decimal(amount),
+            action=action,
+            account=account or self.account,
+            category=self.category,
+            created_by=self.user,
+            updated_by=self.user,
+        )
+        values.update(kwargs)
+        return Transaction.objects.create(**values)
+
+    def balance(self, account=None):
+        return Balance.objects.get(account=account or self.account).value
+
+
+class BalanceTests(LedgerMixin, TestCase):
+    """Tests for maintaining balances from `Transaction.save()`."""
+
+    def setUp(self):
+        self.make_ledger()
+
+    def test_create_applies_amount(self):
+        self.make_transaction("10.00", action=-1)
+        self.make_transaction("25.50", action=1)
+        self.assertEqual(self.balance(), Decimal("15.50"))
+
+    def test_edit_applies_difference(self):
+        txn = self.make_transaction("10.00", action=-1)
+        txn.amount = Decimal("12.00")
+        txn.save()
+        self.assertEqual(self.balance(), Decimal("-12.00"))
+
+    def test_edit_moves_amount_between_accounts(self):
+        txn = self.make_transaction("10.00", action=-1)
+        txn.account = self.other_account
+        txn.amount = Decimal("7.00")
+        txn.save()
+        self.assertEqual(self.balance(), Decimal("0.00"))
+        self.assertEqual(self.balance(self.other_account), Decimal("-7.00"))
+
+    def test_create_query_count(self):
+        self.make_transaction()
+        # INSERT transaction, UPDATE balance, monthly summary and later
+        # balance checkpoints, inside a savepoint.
+        with self.assertNumQueries(6):
+            self.make_transaction()
+
+    def test_edit_query_count(self):
+        txn = self.make_transaction()
+        txn.amount = Decimal("1.00")
+        # SELECT original, UPDATE transaction, balance, monthly summary and
+        # later balance checkpoints, inside a savepoint.
+        with self.assertNumQueries(7):
+            txn.save()
+
+    def test_save_without_balance_fields_skips_balance(self):
+        txn = self.make_transaction()
+        txn.description = "Lunch"
+        with self.assertNumQueries(1):
+            txn.save(update_fields=["description"])
+
+
+class MonthlySummaryTests(LedgerMixin, TestCase):
+    """Tests for maintaining monthly summaries of transactions."""
+
+    def setUp(self):
+        self.make_ledger()
+
+    def summaries(self):
+        return {
+            (s.account_id, s.month.isoformat()): (s.credit_total, s.debit_total, s.count)
+            for s in MonthlySummary.objects.all()
+        }
+
+    def test_create_and_move_between_months_and_accounts(self):
+        txn = self.make_transaction("10.00")
+        self.make_transaction("4.00", action=1)
+        self.assertEqual(self.summaries(), {
+            (self.account.pk, "2018-01-01"): (Decimal("4.00"), Decimal("10.00"), 2)})
+
+        txn.date = datetime.date(2018, 2, 10)
+        txn.account = self.other_account
+        txn.save()
+        self.assertEqual(self.summaries(), {
+            (self.account.pk, "2018-01-01"): (Decimal("4.00"), Decimal("0.00"), 1),
+            (self.other_account.pk, "2018-02-01"): (Decimal("0.00"), Decimal("10.00"), 1)})
+
+    def test_rebuild_reads_transactions_once_summaries_are_locked(self):
+        self.make_transaction("10.00")
+        compute = MonthlySummary.objects.compute
+
+        def checked_compute():
+            # The summaries have been deleted in the same transaction.
+            self.assertTrue(connection.in_atomic_block)
+            self.assertFalse(MonthlySummary.objects.exists())
+            return compute()
+
+        with mock.patch.object(MonthlySummary.objects, "compute", checked_compute):
+            MonthlySummary.objects.rebuild()
+        self.assertEqual(self.summaries(), {
+            (self.account.pk, "2018-01-01"): (Decimal("0.00"), Decimal("10.00"), 1)})
+
+    def test_rebuild_summaries_command(self):
+        self.make_transaction("10.00")
+        MonthlySummary.objects.update(count=5)
+
+        with self.assertRaises(CommandError):
+            call_command("rebuild_summaries", "--verify", stdout=StringIO())
+
+        out = StringIO()
+        call_command("rebuild_summaries", stdout=out)
+        self.assertIn("Rebuilt 1 summaries (1 were inconsistent)", out.getvalue())
+        call_command("rebuild_summaries", "--verify", stdout=StringIO())
+
+
+class ReconcileBalancesTests(LedgerMixin, TestCase):
+    """Tests for detecting and repairing balances which have drifted."""
+
+    def setUp(self):
+        self.make_ledger()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.make_transaction("10.00")
+        self.make_transaction("2.50", account=self.other_account, action=1)
+
+    def test_consistent(self):
+        self.assertEqual(Balance.objects.drift(), {})
+        out = StringIO()
+        call_command("reconcile_balances", "--verify", stdout=out)
+        self.assertIn("All balances are consistent", out.getvalue())
+        response = self.client.get("/api/balances/health/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["checked"], 2)
+        self.assertTrue(response.data["healthy"])
+
+    def test_repairs_drift(self):
+        Balance.objects.filter(account=self.account).update(value=Decimal("5.00"))
+        Balance.objects.filter(account=self.other_account).delete()
+        self.assertEqual(Balance.objects.drift(), {
+            self.account.pk: (Decimal("-10.00"), Decimal("5.00")),
+            self.other_account.pk: (Decimal("2.50"), None),
+        })
+        self.assertEqual(
+            self.client.get("/api/balances/health/").status_code, 503)
+        with self.assertRaises(CommandError):
+            call_command("reconcile_balances", "--verify", stdout=StringIO())
+
+        out = StringIO()
+        # Two queries to compare, and an UPDATE and INSERT, all inside one
+        # savepoint so that the balances stay locked until they are repaired.
+        with self.assertNumQueries(8):
+            call_command("reconcile_balances", stdout=out)
+        self.assertIn("Fixed 2 inconsistent balances", out.getvalue())
+        self.assertEqual(self.balance(), Decimal("-10.00"))
+        self.assertEqual(self.balance(self.other_account), Decimal("2.50"))
+        self.assertEqual(Balance.objects.drift(), {})
+
+
+class BalanceAsOfTests(LedgerMixin, TestCase):
+    """Tests for point-in-time balances read from balance checkpoints."""
+
+    def setUp(self):
+        self.make_ledger()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.make_transaction("10.00", date=datetime.date(2018, 1, 5))
+        self.make_transaction("30.00", action=1, date=datetime.date(2018, 2, 10))
+        self.make_transaction("5.00", date=datetime.date(2018, 3, 20))
+
+    def as_of(self, value):
+        response = self.client.get("/api/balances/", {"as_of": value})
+        self.assertEqual(response.status_code, 200)
+        return {
+            row["account"]["id"]: Decimal(row["value"]) for row in response.data}
+
+    def test_balances_as_of(self):
+        self.assertEqual(self.as_of("2017-12-31")[self.account.pk], Decimal("0.00"))
+        self.assertEqual(self.as_of("2018-01-31")[self.account.pk], Decimal("-10.00"))
+        self.assertEqual(self.as_of("2018-03-19")[self.account.pk], Decimal("20.00"))
+        self.assertEqual(self.as_of("2019-01-01")[self.account.pk], self.balance())
+        self.assertEqual(
+            set(BalanceCheckpoint.objects.values_list("date", flat=True)), {
+                datetime.date(2017, 11, 30),
+                datetime.date(2017, 12, 31),
+                datetime.date(2018, 2, 28),
+                datetime.date(2018, 12, 31),
+            })
+
+    def test_backdated_edit_updates_later_checkpoints(self):
+        self.as_of("2018-03-31")
+        txn = self.make_transaction("7.00", date=datetime.date(2018, 1, 15))
+        self.assertEqual(self.as_of("2018-03-01")[self.account.pk], Decimal("13.00"))
+
+        txn.date = datetime.date(2018, 3, 1)
+        txn.save()
+        self.assertEqual(self.as_of("2018-02-28")[self.account.pk], Decimal("20.00"))
+        self.assertEqual(self.as_of("2018-03-01")[self.account.pk], Decimal("13.00"))
+        self.assertEqual(
+            BalanceCheckpoint.objects.get(
+                account=self.account, date=datetime.date(2018, 2, 28)).value,
+            Decimal("20.00"))
+
+    def test_invalid_date(self):
+        for value in ("2018-02-30", "0001-01-15"):
+            response = self.client.get("/api/balances/", {"as_of": value})
+            self.assertEqual(response.status_code, 400, value)
+            self.assertIn("as_of", response.data)
+        self.assertEqual(self.as_of("0001-02-01")[self.account.pk], Decimal("0.00"))
+
+
+class ConcurrentBalanceTests(LedgerMixin, TransactionTestCase):
+    """Stress tests for concurrent balance updates."""
+
+    THREADS = 8
+    WRITES_PER_THREAD = 25
+    # The number of times each write is tried before the test fails.
+    ATTEMPTS = 1000
+
+    def setUp(self):
+        self.make_ledger()
+
+    def _hammer(self, errors):
+        try:
+            for i in range(self.WRITES_PER_THREAD):
+                # SQLite serialises writers by failing them outright, so retry
+                # the whole (rolled-back) write until it succeeds, but not
+                # forever, so that a persistent error fails the test.
+                for attempt in range(self.ATTEMPTS):
+                    try:
+                        self.make_transaction("1.%02d" % i, action=1 if i % 2 else -1)
+                        break
+                    except OperationalError:
+                        if attempt == self.ATTEMPTS - 1:
+                            raise
+                        time.sleep(0.001)
+        except Exception as exc:  # pragma: no cover
+            errors.append(exc)
+        finally:
+            close_old_connections()
+            connection.close()
+
+    def test_concurrent_writes_match_ledger(self):
+        errors = []
+        threads = [
+            threading.Thread(target=self._hammer, args=(errors,))
+            for _ in range(self.THREADS)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(
+            Transaction.objects.count(), self.THREADS * self.WRITES_PER_THREAD)
+        expected = sum(t.amount * t.action for t in Transaction.objects.all())
+        self.assertEqual(self.balance(), expected)
+
+
+class ASGIHandlerTests(LedgerMixin, TransactionTestCase):
+    """Tests for serving the API through the ASGI handler."""
+
+    def setUp(self):
+        self.make_ledger()
+        self.handler = ASGIHandler(WSGIHandler(), threads=2)
+
+    def tearDown(self):
+        self.handler.executor.shutdown()
+
+    def request(self, method, path, body=b"", headers=(), disconnect=False):
+        """Return the messages sent by the handler for a request."""
+        messages = [{"type": "http.disconnect"} if disconnect else
+                    {"type": "http.request", "body": body}]
+        sent = []
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            await asyncio.sleep(3600)
+
+        async def send(message):
+            sent.append(message)
+
+        path, _, query = path.partition("?")
+        scope = {
+            "type": "http",
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "query_string": query.encode(),
+            "root_path": "",
+            "headers": [(b"host", b"testserver")] + [
+                (k.encode(), v.encode()) for k, v in headers],
+            "client": ("127.0.0.1", 1234),
+            "server": ("testserver", 80),
+        }
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(self.handler(scope, receive, send))
+        finally:
+            loop.close()
+        return sent
+
+    def token(self):
+        sent = self.request(
+            "POST", "/api/token/",
+            json.dumps({"username": "alice", "password": "secret"}).encode(),
+            [("content-type", "application/json")])
+        self.assertEqual(sent[0]["status"], 200)
+        return json.loads(b"".join(m.get("body", b"") for m in sent[1:]).decode())["access"]
+
+    def test_serves_requests_with_body_and_headers(self):
+        self.make_transaction()
+        sent = self.request(
+            "GET", "/api/transactions/?fields=id,amount",
+            headers=[("authorization", "Bearer %s" % self.token()),
+                     ("accept", "application/json")])
+        self.assertEqual(sent[0]["type"], "http.response.start")
+        self.assertEqual(sent[0]["status"], 200)
+        self.assertIn((b"content-type", b"application/json"), sent[0]["headers"])
+        self.assertFalse(sent[-1].get("more_body", False))
+        data = json.loads(b"".join(m.get("body", b"") for m in sent[1:]).decode())
+        self.assertEqual(data["results"][0]["amount"], "10.00")
+
+    def test_streams_responses_in_chunks(self):
+        for i in range(3):
+            self.make_transaction(description="Row %d" % i)
+        sent = self.request(
+            "GET", "/api/transactions/export/?format=ndjson",
+            headers=[("authorization", "Bearer %s" % self.token())])
+        self.assertEqual(sent[0]["status"], 200)
+        self.assertGreater(len(sent), 2)
+        body = b"".join(m.get("body", b"") for m in sent[1:]).decode()
+        self.assertEqual(len(body.splitlines()), 3)
+
+    def test_client_gone_before_body(self):
+        self.assertEqual(self.request("GET", "/api/accounts/", disconnect=True), [])
+
+    def test_lifespan(self):
+        messages = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message["type"])
+
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(self.handler({"type": "lifespan"}, receive, send))
+        finally:
+            loop.close()
+        self.assertEqual(
+            sent, ["lifespan.startup.complete", "lifespan.shutdown.complete"])
+
+
+    @override_settings(EVENTS={"HEARTBEAT": 0.05})
+    def test_streams_events_from_the_event_loop(self):
+        token = self.token()
+        disconnect = None
+        sent = []
+
+        async def receive():
+            nonlocal disconnect
+            if disconnect is None:
+                disconnect = asyncio.Future()
+                return {"type": "http.request", "body": b""}
+            await disconnect
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+            body = message.get("body", b"")
+            if body.startswith(b": keep-alive") and len(sent) == 2:
+                events.get_backend().publish({
+                    "balances": [{"account": 1, "delta": "5.00", "value": "5.00"}],
+                    "transactions": [{"user": self.user.pk, "id": 7}],
+                    "deleted": [],
+                })
+            elif body.startswith(b"event: ledger"):
+                disconnect.set_result(None)
+
+        scope = {
+            "type": "http", "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": "/api/events/", "query_string": b"",
+            "headers": [(b"host", b"testserver"),
+                        (b"authorization", ("Bearer %s" % token).encode())],
+        }
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(asyncio.wait_for(self.handler(scope, receive, send), 5))
+        finally:
+            loop.close()
+
+        self.assertEqual(sent[0]["status"], 200)
+        self.assertIn((b"content-type", b"text/event-stream; charset=utf-8"), sent[0]["headers"])
+        ledger = [m["body"] for m in sent[1:] if m.get("body", b"").startswith(b"event:")]
+        self.assertEqual(ledger, [
+            b'event: ledger\ndata: {"balances": [{"account": 1, "delta": "5.00", '
+            b'"value": "5.00"}], "transactions": [7], "deleted": []}\n\n'])
+        self.assertFalse(events.get_backend().listening())
+
+
+class TransactionListQueryTests(LedgerMixin, TestCase):
+    """Tests pinning the number of queries used to list transactions."""
+
+    url = "/api/transactions/"
+
+    def setUp(self):
+        self.make_ledger()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertListQueries(self, rows, num):
+        for _ in range(rows - Transaction.objects.count()):
+            self.make_transaction()
+        with self.assertNumQueries(num):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), rows)
+
+    def test_list_one_row(self):
+        # Two permission lookups, then COUNT and SELECT of the page.
+        self.assertListQueries(1, 4)
+
+    def test_list_full_page(self):
+        self.assertListQueries(50, 4)
+
+    def test_retrieve(self):
+        txn = self.make_transaction()
+        with self.assertNumQueries(3):
+            response = self.client.get("%s%d/" % (self.url, txn.pk))
+        self.assertEqual(response.data["account"]["name"], "Cash")
+        self.assertEqual(response.data["updated_by"], "alice")
+
+    def test_list_rows_match_serializer(self):
+        self.user.first_name = "Alice"
+        self.user.save()
+        self.account.icon = "media/paymentIcons/cash.png"
+        self.account.save()
+        self.make_transaction("12.5", tax_deduction=True)
+        self.make_transaction("3.00", account=self.other_account, action=1)
+
+        queryset = Transaction.objects.order_by("-date", "-id")
+        expected = TransactionSerializer(
+            TransactionSerializer.setup_eager_loading(queryset), many=True).data
+        self.assertEqual(self.client.get(self.url).data["results"], expected)
+        self.assertEqual(
+            json.dumps(TransactionSerializer(
+                queryset.values(*TransactionSerializer.values()), many=True).data),
+            json.dumps(expected))
+
+
+class RepresentationTests(LedgerMixin, TestCase):
+    """Tests for sparse fieldsets and compact lists of transactions."""
+
+    url = "/api/transactions/"
+
+    def setUp(self):
+        self.make_ledger()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.txn = self.make_transaction("10.00")
+        self.make_transaction("2.00", account=self.other_account)
+
+    def test_fields(self):
+        response = self.client.get(self.url, {"fields": "id,amount,account"})
+        self.assertEqual(response.data["results"][1], {
+            "id": self.txn.pk,
+            "amount": "10.00",
+            "account": {
+                "id": self.account.pk, "name": "Cash", "abbreviation": "CASH",
+                "icon": None,
+            },
+        })
+        response = self.client.get(
+            "%s%d/" % (self.url, self.txn.pk), {"fields": "id,amount"})
+        self.assertEqual(response.data, {"id": self.txn.pk, "amount": "10.00"})
+
+    def test_expand(self):
+        response = self.client.get(
+            self.url, {"fields": "user,account,category", "expand": "category"})
+        self.assertEqual(response.data["results"][1], {
+            "user": self.user.pk,
+            "account": self.account.pk,
+            "category": {"id": self.category.pk, "name": "Food"},
+        })
+        response = self.client.get(
+            "%s%d/" % (self.url, self.txn.pk), {"expand": ""})
+        self.assertEqual(response.data["account"], self.account.pk)
+        self.assertEqual(response.data["user"], self.user.pk)
+
+    def test_compact(self):
+        response = self.client.get(
+            self.url, {"fields": "id,account,category", "compact": "true"})
+        self.assertEqual(
+            [row["account"] for row in response.data["results"]],
+            [self.other_account.pk, self.account.pk])
+        included = json.loads(json.dumps(response.data["included"]))
+        self.assertEqual(sorted(included), ["accounts", "categories"])
+        self.assertEqual(included["accounts"][str(self.account.pk)]["name"], "Cash")
+        self.assertEqual(
+            included["categories"],
+            {str(self.category.pk): {"id": self.category.pk, "name": "Food"}})
+
+    def test_only_requested_columns_are_fetched(self):
+        self.assertEqual(
+            TransactionSerializer.values(
+                {"fields": {"amount", "account"}, "expand": set(), "compact": False}),
+            ["id", "date", "account_id", "amount"])
+
+    def test_unknown_fields(self):
+        response = self.client.get(self.url, {"fields": "id,secret"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("fields", response.data)
+        response = self.client.get(self.url, {"expand": "date"})
+        self.assertEqual(response.status_code, 400)
+
+
+class KeysetPaginationTests(LedgerMixin, TestCase):
+    """Tests for keyset pagination of the transaction list."""
+
+    url = "/api/transactions/"
+
+    def setUp(self):
+        self.make_ledger()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # Several transactions share a date, so ties are broken by id.
+        self.ids = [
+            self.make_transaction(date=datetime.date(2018, 1, 1 + i // 2)).pk
+            for i in range(7)
+        ]
+        self.newest_first = sorted(
+            self.ids, key=lambda pk: (Transaction.objects.get(pk=pk).date, pk),
+            reverse=True)
+
+    def ids_of(self, response):
+        return [row["id"] for row in response.data["results"]]
+
+    def test_walk_forward_and_back(self):
+        response = self.client.get(self.url, {"cursor": "", "page_size": 3})
+        self.assertIsNone(response.data["previous"])
+        pages = [self.ids_of(response)]
+        while response.data["next"]:
+            response = self.client.get(response.data["next"])
+            pages.append(self.ids_of(response))
+        self.assertEqual(sum(pages, []), self.newest_first)
+
+        response = self.client.get(response.data["previous"])
+        self.assertEqual(self.ids_of(response), pages[-2])
+        self.assertIsNotNone(response.data["next"])
+
+    def test_no_count_query(self):
+        # Two permission lookups, then a single SELECT of the page.
+        with self.assertNumQueries(3):
+            self.client.get(self.url, {"cursor": "", "page_size": 2})
+
+    def test_page_size_is_capped(self):
+        with mock.patch.object(KeysetPagination, "max_page_size", 2):
+            response = self.client.get(self.url, {"cursor": "", "page_size": 5})
+        self.assertEqual(len(response.data["results"]), 2)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {"cursor": "garbage"})
+        self.assertEqual(response.status_code, 404)
+
+
+class TransactionFilterTests(LedgerMixin, TestCase):
+    """Tests for filtering the transaction list."""
+
+    url = "/api/transactions/"
+
+    def setUp(self):
+        self.make_ledger()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.groceries = self.make_transaction("10.00", date=datetime.date(2018, 1, 1))
+        self.salary = self.make_transaction(
+            "500.00", action=1, description="Salary", date=datetime.date(2018, 2, 1))
+        self.fuel = self.make_transaction(
+            "60.00", account=self.other_account, description="Fuel",
+            date=datetime.date(2018, 3, 1), tax_deduction=True)
+
+    def filtered(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return {row["id"] for row in response.data["results"]}
+
+    def test_date_range(self):
+        self.assertEqual(
+            self.filtered(date_from="2018-01-15", date_to="2018-02-15"),
+            {self.salary.pk})
+
+    def test_account_ids(self):
+        self.assertEqual(self.filtered(account=self.other_account.pk), {self.fuel.pk})
+        self.assertEqual(
+            self.filtered(account="%d,%d" % (self.account.pk, self.other_account.pk)),
+            {self.groceries.pk, self.salary.pk, self.fuel.pk})
+
+    def test_action_and_tax_deduction(self):
+        self.assertEqual(self.filtered(action=1), {self.salary.pk})
+        self.assertEqual(self.filtered(tax_deduction="true"), {self.fuel.pk})
+
+    def test_amount_range_and_search(self):
+        self.assertEqual(
+            self.filtered(amount_min="50", amount_max="100"), {self.fuel.pk})
+        self.assertEqual(self.filtered(search="sal"), {self.salary.pk})
+
+    def test_filters_add_no_queries(self):
+        # Two permission lookups, then COUNT and SELECT of the page.
+        with self.assertNumQueries(4):
+            self.client.get(self.url, {"account": self.account.pk, "category": 1})
+
+
+class ReportTests(LedgerMixin, TestCase):
+    """Tests for the aggregate reports endpoint."""
+
+    url = "/api/reports/"
+
+    def setUp(self):
+        self.make_ledger()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.make_transaction("10.00", date=datetime.date(2018, 1, 1))
+        self.make_transaction("5.50", date=datetime.date(2018, 1, 20))
+        self.make_transaction("100.00", action=1, date=datetime.date(2018, 2, 3))
+        self.make_transaction(
+            "7.25", account=self.other_account, date=datetime.date(2018, 2, 4))
+
+    def test_by_account_and_month(self):
+        response = self.client.get(self.url, {"group_by": "account,month"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(r["account"], r["month"], r["credit"], r["debit"], r["total"], r["count"])
+             for r in response.data],
+            [(self.account.pk, "2018-01", "0.00", "15.50", "-15.50", 2),
+             (self.account.pk, "2018-02", "100.00", "0.00", "100.00", 1),
+             (self.other_account.pk, "2018-02", "0.00", "7.25", "-7.25", 1)])
+
+    def test_by_week_with_filter(self):
+        response = self.client.get(
+            self.url, {"group_by": "week", "date_from": "2018-01-15"})
+        self.assertEqual(
+            [(r["week"], r["total"]) for r in response.data],
+            [("2018-01-15", "-5.50"), ("2018-01-29", "92.75")])
+
+    def test_whole_months_read_from_summaries(self):
+        params = {"group_by": "category,month", "date_from": "2018-01-01",
+                  "date_to": "2018-02-28"}
+        with mock.patch("transactions.views.summarise", wraps=summarise) as spy:
+            response = self.client.get(self.url, params)
+        self.assertIs(spy.call_args[0][0].model, MonthlySummary)
+        self.assertEqual(
+            response.data,
+            summarise(Transaction.objects.all(), ["category", "month"]))
+
+    def test_emptied_summaries_are_not_reported(self):
+        rent = Category.objects.create(name="Rent")
+        Transaction.objects.filter(date__month=1).update(category=rent)
+        params = {"group_by": "category", "date_from": "2018-01-01"}
+        summarised = self.client.get(self.url, dict(params, date_to="2018-01-31")).data
+        computed = self.client.get(self.url, dict(params, date_to="2018-01-30")).data
+        self.assertEqual([r["category"] for r in summarised], [rent.pk])
+        self.assertEqual(summarised, computed)
+
+    def test_single_query(self):
+        # Two permission lookups, then the aggregate query.
+        with self.assertNumQueries(3):
+            self.client.get(self.url, {"group_by": "category,year,tax_deduction"})
+
+    def test_invalid_group_by(self):
+        response = self.client.get(self.url, {"group_by": "month,year"})
+        self.assertEqual(response.status_code, 400)
+
+
+class BulkCreateTests(LedgerMixin, TestCase):
+    """Tests for the bulk transaction endpoint."""
+
+    url = "/api/transactions/bulk/"
+
+    def setUp(self):
+        self.make_ledger()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def row(self, amount="10.00", **kwargs):
+        row = {
+            "user_id": self.user.pk,
+            "account_id": self.account.pk,
+            "category_id": self.category.pk,
+            "date": "2018-01-01",
+            "action": -1,
+            "amount": amount,
+            "description": "Groceries",
+        }
+        row.update(kwargs)
+        return row
+
+    def test_json_array(self):
+        rows = [self.row("10.00"), self.row("5.00", action=1)]
+        response = self.client.post(self.url, rows, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual(Transaction.objects.count(), 2)
+        self.assertEqual(self.balance(), Decimal("-5.00"))
+
+    def test_ndjson_reports_row_errors(self):
+        body = "\n".join([
+            json.dumps(self.row("10.00")),
+            "not json",
+            json.dumps(self.row("1.00", account_id=999)),
+            json.dumps(self.row("2.00", account_id=self.other_account.pk)),
+        ])
+        response = self.client.post(
+            self.url, body, content_type="application/x-ndjson")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual([e["index"] for e in response.data["errors"]], [1, 2])
+        self.assertIn("account_id", response.data["errors"][1]["errors"])
+        self.assertEqual(self.balance(), Decimal("-10.00"))
+        self.assertEqual(self.balance(self.other_account), Decimal("-2.00"))
+
+    def test_atomic_rejects_whole_batch(self):
+        rows = [self.row("10.00"), self.row("oops")]
+        response = self.client.post(
+            self.url + "?atomic=true", rows, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Transaction.objects.count(), 0)
+        self.assertFalse(Balance.objects.exists())
+
+    def test_chunks_are_committed_separately(self):
+        rows = [self.row("1.00") for _ in range(5)]
+        bulk_create = Transaction.objects.bulk_create
+        calls = []
+
+        def fail_third_chunk(instances):
+            calls.append(1)
+            if len(calls) == 3:
+                raise OperationalError("disk I/O error")
+            return bulk_create(instances)
+
+        with mock.patch.object(Transaction.objects, "bulk_create", fail_third_chunk):
+            with self.assertRaises(OperationalError):
+                load_transactions(rows, self.user, chunk_size=2)
+        self.assertEqual(Transaction.objects.count(), 4)
+        self.assertEqual(Balance.objects.drift(), {})
+
+    def test_atomic_keeps_nothing_if_a_chunk_fails(self):
+        rows = [self.row("1.00") for _ in range(5)]
+        bulk_create = Transaction.objects.bulk_create
+        calls = []
+
+        def fail_third_chunk(instances):
+            calls.append(1)
+            if len(calls) == 3:
+                raise IntegrityError("FOREIGN KEY constraint failed")
+            return bulk_create(instances)
+
+        with mock.patch.object(Transaction.objects, "bulk_create", fail_third_chunk):
+            with self.assertRaises(IntegrityError):
+                load_transactions(rows, self.user, atomic=True, chunk_size=2)
+        self.assertFalse(Transaction.objects.exists())
+        self.assertFalse(Balance.objects.exists())
+
+    def test_atomic_validates_every_chunk_first(self):
+        rows = [self.row("1.00") for _ in range(4)] + [self.row("oops")]
+        loader = load_transactions(rows, self.user, atomic=True, chunk_size=2)
+        self.assertEqual(loader.created, 0)
+        self.assertEqual([e["index"] for e in loader.errors], [4])
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_rows_of_other_users_are_rejected(self):
+        bob = User.objects.create_user("bob")
+        rows = [self.row("10.00"), self.row("5.00", user_id=bob.pk)]
+        response = self.client.post(self.url, rows, format="json")
+        self.assertEqual(response.data["created"], 1)
+        self.assertEqual(response.data["errors"][0]["index"], 1)
+        self.assertIn("user_id", response.data["errors"][0]["errors"])
+        self.assertFalse(Transaction.objects.filter(user=bob).exists())
+
+    def test_query_count_is_independent_of_rows(self):
+        rows = [self.row("1.00") for _ in range(50)]
+        cache.accounts.ids(), cache.categories.ids()
+        # A user lookup (accounts and categories are cached), two permission
+        # lookups, one INSERT, the creation of the balance and monthly summary
+        # and an UPDATE of later balance checkpoints, inside savepoints.
+        with self.assertNumQueries(15):
+            self.client.post(self.url, rows, format="json")
+
+
+class BulkUpdateDeleteTests(LedgerMixin, TestCase):
+    """Tests for changing and deleting many transactions at once."""
+
+    url = "/api/transactions/bulk/"
+
+    def setUp(self):
+        self.make_ledger()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.food = [self.make_transaction("10.00") for _ in range(3)]
+        self.salary = self.make_transaction("100.00", action=1)
+        self.other = self.make_transaction(user=User.objects.create_user("bob"))
+        self.rent = Category.objects.create(name="Rent")
+
+    def assertConsistent(self):
+        self.assertEqual(Balance.objects.drift(), {})
+        call_command("rebuild_summaries", "--verify", stdout=StringIO())
+
+    def patch(self, data, query=""):
+        return self.client.patch(self.url + query, data, format="json")
+
+    def test_recategorise_and_move_account(self):
+        ids = [t.pk for t in self.food[:2]]
+        response = self.patch({"ids": ids, "set": {
+            "category_id": self.rent.pk, "account_id": self.other_account.pk}})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.data, {"updated": 2})
+        self.assertEqual(
+            Transaction.objects.filter(category=self.rent).count(), 2)
+        self.assertEqual(self.balance(), Decimal("80.00"))
+        self.assertEqual(self.balance(self.other_account), Decimal("-20.00"))
+        self.assertEqual(
+            MonthlySummary.objects.get(
+                account=self.other_account, category=self.rent).debit_total,
+            Decimal("20.00"))
+        self.assertConsistent()
+
+    def test_change_amount_of_filtered_transactions(self):
+        response = self.patch(
+            {"set": {"amount": "2.50"}}, "?category=%d&action=-1" % self.category.pk)
+        self.assertEqual(response.data, {"updated": 3})
+        self.assertEqual(self.balance(), Decimal("82.50"))
+        self.other.refresh_from_db()
+        self.assertEqual(self.other.amount, Decimal("10.00"))
+        self.assertConsistent()
+
+    def test_query_count_is_independent_of_rows(self):
+        def update(transactions, category):
+            with CaptureQueriesContext(connection) as context:
+                Transaction.objects.filter(
+                    pk__in=[t.pk for t in transactions]).update(category=category)
+            return [q["sql"].split(" ", 2)[:2] for q in context.captured_queries]
+
+        Transaction.objects.filter(pk=self.food[0].pk).update(category=self.rent)
+        one = update(self.food[:1], self.category)
+        many = update(self.food, self.rent)
+        self.assertEqual(len(one), len(many))
+        self.assertEqual(many.count(["UPDATE", '"transactions_transaction"']), 1)
+
+    def test_rows_matching_after_the_lock_are_left_alone(self):
+        lock = TransactionQuerySet._lock
+        late = []
+
+        def lock_then_insert(queryset):
+            rows = lock(queryset)
+            # A transaction committed by another writer once the rows are locked.
+            late.append(self.make_transaction("1.00"))
+            return rows
+
+        with mock.patch.object(TransactionQuerySet, "_lock", lock_then_insert):
+            Transaction.objects.filter(category=self.category).update(category=self.rent)
+            self.assertEqual(Transaction.objects.filter(category=self.rent).count(), 5)
+            late[0].refresh_from_db()
+            self.assertEqual(late[0].category_id, self.category.pk)
+            self.assertConsistent()
+
+            Transaction.objects.filter(category=self.rent).delete()
+            self.assertTrue(Transaction.objects.filter(pk=late[1].pk).exists())
+            self.assertConsistent()
+
+    @mock.patch("transactions.models.LOCKED_BATCH_SIZE", 2)
+    def test_large_selections_are_written_in_batches(self):
+        ids = [t.pk for t in self.food] + [self.salary.pk]
+        self.assertEqual(Transaction.objects.filter(pk__in=ids).update(amount="1.00"), 4)
+        self.assertEqual(self.balance(), Decimal("-12.00"))
+        self.assertConsistent()
+        self.assertEqual(Transaction.objects.filter(pk__in=ids).delete()[0], 4)
+        self.assertEqual(self.balance(), Decimal("-10.00"))
+        self.assertConsistent()
+
+    def test_delete_adjusts_balances_and_leaves_tombstones(self):
+        ids = [t.pk for t in self.food] + [self.other.pk]
+        response = self.client.delete(
+            self.url + "?ids=" + ",".join(str(pk) for pk in ids))
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.data, {"deleted": 3})
+        self.assertEqual(self.balance(), Decimal("90.00"))
+        self.assertTrue(Transaction.objects.filter(pk=self.other.pk).exists())
+        self.assertEqual(
+            sorted(TransactionTombstone.objects.values_list("transaction_id", flat=True)),
+            [t.pk for t in self.food])
+        changes = self.client.get("/api/transactions/changes/").data
+        self.assertEqual(sorted(changes["deleted"]), [t.pk for t in self.food])
+        self.assertConsistent()
+
+    def test_delete_one_transaction(self):
+        response = self.client.delete("/api/transactions/%d/" % self.salary.pk)
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.balance(), Decimal("-40.00"))
+        self.assertConsistent()
+
+    def test_requires_selection(self):
+        for response in (self.patch({"set": {"amount": "1.00"}}),
+                         self.client.delete(self.url)):
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("ids", response.data)
+        self.assertEqual(Transaction.objects.count(), 5)
+
+    def test_empty_filters_select_nothing(self):
+        for query in ("?search=", "?account=", "?search=&date_from="):
+            response = self.client.delete(self.url + query)
+            self.assertEqual(response.status_code, 400, query)
+            self.assertIn("ids", response.data)
+        response = self.client.delete(self.url + "?date_from=yesterday")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Transaction.objects.count(), 5)
+
+    def test_rejects_bodies_which_arent_objects(self):
+        response = self.patch([1, 2], "?ids=%d" % self.food[0].pk)
+        self.assertEqual(response.status_code, 400)
+        response = self.client.generic(
+            "PATCH", self.url + "?ids=%d" % self.food[0].pk,
+            '{"set": {"amount": "1.00"}}\n', "application/x-ndjson")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.balance(), Decimal("60.00"))
+
+    def test_rejects_invalid_changes(self):
+        ids = [self.food[0].pk]
+        bob = User.objects.get(username="bob")
+        for change in ({"account_id": 999}, {"amount": "oops"}, {"created": "2018-01-01"},
+                       {"user_id": bob.pk}, {}):
+            response = self.patch({"ids": ids, "set": change})
+            self.assertEqual(response.status_code, 400, change)
+        self.food[0].refresh_from_db()
+        self.assertEqual(self.food[0].user_id, self.user.pk)
+        self.assertEqual(self.balance(), Decimal("60.00"))
+        self.assertConsistent()
+
+
+class ExportTests(LedgerMixin, TestCase):
+    """Tests for streaming exports of transactions."""
+
+    url = "/api/transactions/export/"
+
+    def setUp(self):
+        self.make_ledger()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.make_transaction("10.00", description="Groceries, weekly")
+        self.make_transaction(
+            "2.50", action=1, date=datetime.date(2018, 2, 1), description="Refund")
+        self.make_transaction(
+            "1.00", user=User.objects.create_user("bob"), description="Bob's")
+
+    def content(self, response):
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content).decode()
+
+    def test_csv(self):
+        response = self.client.get(self.url, {"format": "csv"})
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        self.assertIn("transactions.csv", response["Content-Disposition"])
+        rows = list(parse_csv(StringIO(self.content(response))))
+        self.assertEqual([r["description"] for r in rows], ["Refund", "Groceries, weekly"])
+        self.assertEqual(rows[1], {
+            "id": rows[1]["id"], "date": "2018-01-01",
+            "description": "Groceries, weekly", "amount": "10.00", "action": "-1",
+            "account": "Cash", "category": "Food", "tax_deduction": "False",
+        })
+        mapped = list(map_rows(rows, self.user))
+        self.assertEqual(mapped[1]["account_id"], self.account.pk)
+
+    def test_ndjson_is_filtered(self):
+        response = self.client.get(
+            self.url, {"format": "ndjson", "date_from": "2018-02-01"})
+        self.assertEqual(response["Content-Type"], "application/x-ndjson; charset=utf-8")
+        rows = [json.loads(line) for line in self.content(response).splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["amount"], "2.50")
+        self.assertEqual(rows[0]["action"], 1)
+
+
+class RendererTests(LedgerMixin, TestCase):
+    """Tests for the JSON and MessagePack renderers."""
+
+    def setUp(self):
+        self.make_ledger()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.make_transaction("10.00", description="Line\u2028separator \u00e9")
+
+    def test_fast_json_matches_json(self):
+        data = {
+            "amount": Decimal("1.50"),
+            "when": timezone.now(),
+            "day": datetime.date(2018, 1, 1),
+            "included": {1: ["\u2028", None, 1.5]},
+            "text": _lazy("Lazy"),
+        }
+        self.assertEqual(
+            FastJSONRenderer().render(data), JSONRenderer().render(data))
+        response = self.client.get("/api/transactions/")
+        self.assertEqual(
+            response.content, JSONRenderer().render(response.data))
+
+    @skipUnless(msgpack, "msgpack isn't installed")
+    def test_msgpack(self):
+        response = self.client.get(
+            "/api/transactions/", HTTP_ACCEPT="application/msgpack")
+        self.assertEqual(response["Content-Type"], "application/msgpack")
+        data = msgpack.unpackb(response.content, raw=False)
+        self.assertEqual(data["results"][0]["amount"], "10.00")
+
+        body = msgpack.packb([{
+            "user_id": self.user.pk,
+            "account_id": self.account.pk,
+            "category_id": self.category.pk,
+            "date": "2018-01-02",
+            "action": -1,
+            "amount": "2.00",
+            "description": "Bus",
+        }], use_bin_type=True)
+        response = self.client.post(
+            "/api/transactions/bulk/", body, content_type="application/msgpack")
+        self.assertEqual(response.status_code, 415)
+        response = self.client.post(
+            "/api/transactions/", msgpack.packb(msgpack.unpackb(body, raw=False)[0]),
+            content_type="application/msgpack")
+        self.assertEqual(response.status_code, 201)
+
+    def test_benchmark_renderers(self):
+        out = StringIO()
+        call_command(
+            "benchmark_renderers", "--rows", "5", "--repeat", "1", stdout=out)
+        self.assertIn("transactions (5)", out.getvalue())
+        self.assertIn("json (", out.getvalue())
+        self.assertEqual(Transaction.objects.count(), 1)
+
+
+class ReferenceCacheTests(LedgerMixin, TestCase):
+    """Tests for serving accounts and categories from the reference caches."""
+
+    def setUp(self):
+        self.make_ledger()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def names(self, url):
+        return [row["name"] for row in self.client.get(url).data]
+
+    def test_reads_are_served_from_memory(self):
+        self.assertEqual(self.names("/api/accounts/"), ["Cash", "Visa"])
+        self.assertEqual(self.names("/api/category/"), ["Food"])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.names("/api/accounts/"), ["Cash", "Visa"])
+            self.assertEqual(self.names("/api/category/"), ["Food"])
+            response = self.client.get("/api/accounts/%d/" % self.account.pk)
+            self.assertEqual(response.data["name"], "Cash")
+
+    def test_saves_and_deletes_invalidate(self):
+        self.assertEqual(self.names("/api/accounts/"), ["Cash", "Visa"])
+        self.account.name = "Wallet"
+        self.account.save()
+        self.assertEqual(self.names("/api/accounts/"), ["Wallet", "Visa"])
+
+        self.other_account.is_active = False
+        self.other_account.save()
+        self.assertEqual(self.names("/api/accounts/"), ["Wallet"])
+        response = self.client.get("/api/accounts/%d/" % self.other_account.pk)
+        self.assertEqual(response.status_code, 404)
+
+        Category.objects.create(name="Rent")
+        self.category.delete()
+        self.assertEqual(self.names("/api/category/"), ["Rent"])
+
+    def test_writes_use_cached_rows(self):
+        cache.accounts.ids(), cache.categories.ids()
+        with mock.patch.object(Account.objects, "get") as account_get:
+            response = self.client.post("/api/transactions/", {
+                "user_id": self.user.pk,
+                "account_id": self.account.pk,
+                "category_id": self.category.pk,
+                "date": "2018-01-01",
+                "action": -1,
+                "amount": "10.00",
+                "description": "Groceries",
+            }, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["account"]["name"], "Cash")
+        account_get.assert_not_called()
+
+
+class ConditionalGetTests(LedgerMixin, TestCase):
+    """Tests for answering conditional GETs with 304 Not Modified."""
+
+    def setUp(self):
+        self.make_ledger()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.make_transaction("10.00")
+
+    def get(self, url, etag=None):
+        headers = {"HTTP_IF_NONE_MATCH": etag} if etag else {}
+        return self.client.get(url, **headers)
+
+    def test_reference_endpoints(self):
+        for url in ("/api/accounts/", "/api/category/"):
+            etag = self.get(url)["ETag"]
+            with self.assertNumQueries(0):
+                response = self.get(url, etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response["ETag"], etag)
+
+        etag = self.get("/api/accounts/")["ETag"]
+        self.account.name = "Wallet"
+        self.account.save()
+        response = self.get("/api/accounts/", etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_balances(self):
+        etag = self.get("/api/balances/")["ETag"]
+        # The version of balances is read from the cache.
+        with self.assertNumQueries(0):
+            response = self.get("/api/balances/", etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.make_transaction("1.00")
+        response = self.get("/api/balances/", etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_balances_changed_with_earlier_timestamp(self):
+        self.make_transaction("1.00", account=self.other_account)
+        self.make_transaction("1.00")
+        etag = self.get("/api/balances/")["ETag"]
+        # A writer which commits last may have taken its timestamp first.
+        with mock.patch("django.utils.timezone.now",
+                        return_value=timezone.now() - datetime.timedelta(hours=1)):
+            self.make_transaction("1.00", account=self.other_account)
+        response = self.get("/api/balances/", etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_balances_saved_outside_the_ledger(self):
+        etag = self.get("/api/balances/")["ETag"]
+        balance = Balance.objects.get(account=self.account)
+        balance.value = Decimal("99.00")
+        balance.save()
+        response = self.get("/api/balances/", etag)
+        self.assertEqual(response.status_code, 200)
+
+        etag = response["ETag"]
+        Balance.objects.recompute([self.account.pk])
+        self.assertEqual(self.get("/api/balances/", etag).status_code, 200)
+
+    def test_balances_repaired(self):
+        etag = self.get("/api/balances/")["ETag"]
+        Balance.objects.repair({self.account.pk: (Decimal("-10.00"), Decimal("5.00"))})
+        self.assertEqual(self.get("/api/balances/", etag).status_code, 200)
+
+    def test_etag_depends_on_query(self):
+        etag = self.get("/api/balances/")["ETag"]
+        response = self.get("/api/balances/?format=json", etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("ETag", self.get("/api/balances/?as_of=2018-01-01"))
+
+
+class TransactionResponseCacheTests(LedgerMixin, TestCase):
+    """Tests for caching transaction responses with versioned keys."""
+
+    def setUp(self):
+        self.make_ledger()
+        self.bob = User.objects.create_user("bob")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.txn = self.make_transaction("10.00")
+
+    def descriptions(self):
+        response = self.client.get("/api/transactions/")
+        return [row["description"] for row in response.data["results"]]
+
+    def assertCached(self, url="/api/transactions/"):
+        self.client.get(url)
+        # No queries at all, as the test client reuses the authenticated
+        # user, whose permissions were cached by the first request.
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_hits_skip_the_database(self):
+        self.assertCached()
+        self.assertCached("/api/transactions/%d/" % self.txn.pk)
+
+    def test_own_changes_invalidate(self):
+        self.assertEqual(self.descriptions(), ["Groceries"])
+        self.txn.description = "Lunch"
+        self.txn.save(update_fields=["description"])
+        self.assertEqual(self.descriptions(), ["Lunch"])
+
+        self.make_transaction("1.00", description="Coffee")
+        self.assertEqual(self.descriptions(), ["Coffee", "Lunch"])
+
+        self.txn.user = self.bob
+        self.txn.save()
+        self.assertEqual(self.descriptions(), ["Coffee"])
+
+        Transaction.objects.all().delete()
+        self.assertEqual(self.descriptions(), [])
+
+        self.client.post("/api/transactions/bulk/", [{
+            "user_id": self.user.pk,
+            "account_id": self.account.pk,
+            "category_id": self.category.pk,
+            "date": "2018-01-01",
+            "action": -1,
+            "amount": "2.00",
+            "description": "Bus",
+        }], format="json")
+        self.assertEqual(self.descriptions(), ["Bus"])
+
+    def test_referenced_rows_invalidate(self):
+        self.descriptions()
+        self.account.name = "Wallet"
+        self.account.save()
+        response = self.client.get("/api/transactions/")
+        self.assertEqual(response.data["results"][0]["account"]["name"], "Wallet")
+
+        self.user.first_name = "Alice"
+        self.user.save()
+        response = self.client.get("/api/transactions/")
+        self.assertEqual(response.data["results"][0]["user"]["first_name"], "Alice")
+
+    def test_other_users_changes_are_ignored(self):
+        self.descriptions()
+        self.make_transaction("1.00", user=self.bob)
+        self.assertCached()
+
+
+class TimingMiddlewareTests(LedgerMixin, TestCase):
+    """Tests for the per-request timing middleware."""
+
+    def setUp(self):
+        self.make_ledger()
+        self.make_transaction()
+        self.client.force_login(self.user)
+
+    def test_disabled_by_default(self):
+        self.assertNotIn("Server-Timing", self.client.get("/api/transactions/"))
+
+    @override_settings(REQUEST_TIMING={"ENABLED": True})
+    def test_server_timing_and_log(self):
+        with self.assertLogs("transactions.timing", "INFO") as logs:
+            response = self.client.get("/api/transactions/")
+        timing = response["Server-Timing"]
+        self.assertRegex(timing, r'^db;dur=[\d.]+;desc="\d+ queries", view;dur=')
+        self.assertIn("render;dur=", timing)
+        self.assertEqual(logs.records[0].levelname, "INFO")
+        self.assertEqual(logs.records[0].path, "/api/transactions/")
+        self.assertGreater(logs.records[0].queries, 0)
+        self.assertFalse(logs.records[0].over_budget)
+
+    @override_settings(REQUEST_TIMING={"ENABLED": True, "QUERY_BUDGET": 1})
+    def test_over_budget(self):
+        with self.assertLogs("transactions.timing", "INFO") as logs:
+            self.client.get("/api/transactions/")
+        self.assertEqual(logs.records[0].levelname, "WARNING")
+        self.assertTrue(logs.records[0].over_budget)
+
+
+class MetricsTests(LedgerMixin, TestCase):
+    """Tests for the metrics exposed at `/metrics`."""
+
+    def setUp(self):
+        metrics.REGISTRY.reset()
+        self.make_ledger()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_exposition(self):
+        self.make_transaction()
+        self.client.get("/api/transactions/")
+        self.client.get("/api/transactions/")
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        text = response.content.decode()
+        self.assertIn("# TYPE api_requests_total counter", text)
+        self.assertIn(
+            'api_requests_total{view="TransactionViewSet",method="GET",status="200"} 2',
+            text)
+        self.assertIn(
+            'api_request_duration_seconds_bucket{view="TransactionViewSet",le="+Inf"} 2',
+            text)
+        self.assertIn('api_request_duration_seconds_count{view="TransactionViewSet"} 2', text)
+        self.assertIn(
+            'cache_requests_total{cache="response:TransactionViewSet",result="hit"} 1',
+            text)
+        self.assertIn("ledger_balance_updates_total 1", text)
+        self.assertIn("ledger_update_duration_seconds_count 1", text)
+
+    def test_processes_are_added_up(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "metrics-1.json"), "w") as f:
+                json.dump({
+                    "api_requests_total": [[["BalanceViewSet", "GET", "200"], 3]],
+                    "ledger_update_duration_seconds": [[[], [1] + [0] * 11 + [0.5]]],
+                }, f)
+            with override_settings(METRICS={"DIR": directory}):
+                self.client.get("/api/balances/")
+                text = self.client.get("/metrics").content.decode()
+                self.assertTrue(os.path.exists(
+                    os.path.join(directory, "metrics-%d.json" % os.getpid())))
+        self.assertIn(
+            'api_requests_total{view="BalanceViewSet",method="GET",status="200"} 4',
+            text)
+        self.assertIn('ledger_update_duration_seconds_bucket{le="0.005"} 1', text)
+        self.assertIn("ledger_update_duration_seconds_sum 0.5", text)
+
+    def test_unwritable_directory_does_not_fail_requests(self):
+        missing = os.path.join(tempfile.gettempdir(), "missing-metrics-dir", "metrics")
+        metrics.REGISTRY._flushed = 0
+        with override_settings(METRICS={"DIR": missing}):
+            with self.assertLogs("transactions.metrics", "ERROR"):
+                response = self.client.get("/api/accounts/")
+            self.assertEqual(response.status_code, 200)
+            with self.assertLogs("transactions.metrics", "ERROR"):
+                self.assertEqual(self.client.get("/metrics").status_code, 200)
+
+
+class ImportTransactionsTests(LedgerMixin, TestCase):
+    """Tests for the `import_transactions` management command."""
+
+    CSV = (
+        "date,description,amount,account,category\n"
+        "2018-01-01,Salary,100.00,Cash,Food\n"
+        "2018-01-02,Lunch,-12.50,visa,Food\n"
+        "2018-01-03,Broken,abc,Cash,Food\n"
+        "2018-01-04,Coffee,-3.00,CASH,1\n"
+    )
+
+    OFX = (
+        "<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>\n"
+        "<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20180105120000<TRNAMT>-20.00"
+        "<FITID>1<NAME>Books</STMTTRN>\n"
+        "<STMTTRN>\n<TRNTYPE>CREDIT\n<DTPOSTED>20180106\n<TRNAMT>5.25\n"
+        "<FITID>2\n<MEMO>Refund\n</STMTTRN>\n"
+        "</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>\n"
+    )
+
+    def setUp(self):
+        self.make_ledger()
+
+    def run_import(self, content, suffix, *args):
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        self.addCleanup(os.remove, path)
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+        out, err = StringIO(), StringIO()
+        call_command(
+            "import_transactions", path, "--user", "alice", *args,
+            stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_csv(self):
+        out, err = self.run_import(self.CSV, ".csv", "--chunk-size", "2")
+        self.assertIn("Imported 3 of 4 rows", out)
+        self.assertIn("Row 2:", err)
+        self.assertEqual(self.balance(), Decimal("97.00"))
+        self.assertEqual(self.balance(self.other_account), Decimal("-12.50"))
+
+    def test_ofx(self):
+        self.run_import(self.OFX, ".ofx", "--account", "Cash", "--category", "Food")
+        self.assertEqual(
+            list(Transaction.objects.order_by("date").values_list(
+                "date", "description", "amount", "action")),
+            [(datetime.date(2018, 1, 5), "Books", Decimal("20.00"), -1),
+             (datetime.date(2018, 1, 6), "Refund", Decimal("5.25"), 1)])
+        self.assertEqual(self.balance(), Decimal("-14.75"))
+
+    def test_dry_run(self):
+        out, _ = self.run_import(self.CSV, ".csv", "--dry-run")
+        self.assertIn("Validated 3 of 4 rows", out)
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_offset_resumes_import(self):
+        self.run_import(self.CSV, ".csv", "--offset", "2")
+        self.assertEqual(
+            list(Transaction.objects.values_list("description", flat=True)),
+            ["Coffee"])
+        self.assertEqual(self.balance(), Decimal("-3.00"))
+
+    def test_balances_are_consistent_after_each_chunk(self):
+        # An import interrupted after its first chunk, then resumed.
+        load = TransactionLoader.load
+        calls = []
+
+        def interrupt(loader, *args, **kwargs):
+            calls.append(1)
+            if len(calls) > 1:
+                raise KeyboardInterrupt
+            return load(loader, *args, **kwargs)
+
+        with mock.patch.object(TransactionLoader, "load", interrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                self.run_import(self.CSV, ".csv", "--chunk-size", "2")
+        self.assertEqual(Transaction.objects.count(), 2)
+        self.assertEqual(Balance.objects.drift(), {})
+        self.run_import(self.CSV, ".csv", "--chunk-size", "2", "--offset", "2")
+        self.assertEqual(Balance.objects.drift(), {})
+        self.assertEqual(self.balance(), Decimal("97.00"))
+
+
+class BenchmarkQueriesTests(TestCase):
+    """Tests for the `benchmark_queries` management command."""
+
+    def test_reports_each_path_and_rolls_back(self):
+        out = StringIO()
+        call_command(
+            "benchmark_queries", "--transactions", "200", "--repeat", "1",
+            stdout=out)
+        self.assertIn("keyset (deep page)", out.getvalue())
+        self.assertIn("without indexes", out.getvalue())
+        self.assertFalse(Transaction.objects.exists())
+
+
+class BenchmarkSerializersTests(TestCase):
+    """Tests for the `benchmark_serializers` management command."""
+
+    def test_reports_each_path_and_rolls_back(self):
+        out = StringIO()
+        call_command(
+            "benchmark_serializers", "--rows", "5", "20", "--repeat", "1",
+            stdout=out)
+        self.assertIn("20 rows, values:", out.getvalue())
+        self.assertIn("20 rows, instances:", out.getvalue())
+        self.assertFalse(Transaction.objects.exists())
+
+
+class SeedLedgerTests(TestCase):
+    """Tests for the `seed_ledger` management command."""
+
+    def test_creates_ledger_with_consistent_balances(self):
+        call_command(
+            "seed_ledger", "--transactions", "300", "--users", "2",
+            "--accounts", "3", "--categories", "4", "--years", "1",
+            "--batch-size", "100", "--seed", "1", "--password", "secret",
+            stdout=StringIO())
+        self.assertEqual(Transaction.objects.count(), 300)
+        self.assertEqual(Transaction.objects.values("user").distinct().count(), 2)
+        self.assertEqual(Balance.objects.drift(), {})
+        user = User.objects.get(username__startswith="bench-", username__endswith="-0")
+        self.assertTrue(user.check_password("secret"))
+
+
+class BenchmarkAPITests(TestCase):
+    """Tests for the `benchmark_api` management command."""
+
+    def test_requests_every_endpoint_and_rolls_back(self):
+        out = StringIO()
+        with tempfile.NamedTemporaryFile(suffix=".json") as f:
+            call_command(
+                "benchmark_api", "--transactions", "300", "--requests", "2",
+                "--output", f.name, stdout=out)
+            report = json.load(open(f.name))
+        self.assertIn("transaction list (keyset)", out.getvalue())
+        self.assertEqual(report["meta"]["mode"], "client")
+        results = report["runs"][0]["results"]
+        self.assertTrue({"PATCH", "DELETE"} <= {r["method"] for r in results})
+        self.assertEqual(report["runs"][0]["transactions"], 300)
+        for result in results:
+            self.assertTrue(
+                all(status < 400 for status in result["status"]), result)
+            self.assertLessEqual(result["p50_ms"], result["p99_ms"])
+            self.assertIsNotNone(result["queries"])
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_url_needs_credentials(self):
+        with self.assertRaises(CommandError):
+            call_command(
+                "benchmark_api", "--url", "http://localhost:8000", stdout=StringIO())
+
+
+class EventTests(LedgerMixin, TransactionTestCase):
+    """Tests for publishing changes to the ledger."""
+
+    def setUp(self):
+        self.make_ledger()
+        self.bob = User.objects.create_user("bob")
+        self.subscriptions = [
+            events.Subscription(self.user.pk),
+            events.Subscription(self.bob.pk),
+            events.Subscription(self.bob.pk, all_users=True),
+        ]
+
+    def tearDown(self):
+        for subscription in self.subscriptions:
+            subscription.close()
+
+    def received(self):
+        return [s.get(timeout=0) for s in self.subscriptions]
+
+    def test_publishes_committed_changes_to_those_who_may_see_them(self):
+        t = self.make_transaction("10.00")
+        balances = [{"account": self.account.pk, "delta": "-10.00", "value": "-10.00"}]
+        self.assertEqual(self.received(), [
+            {"event": "ledger", "data": {
+                "balances": balances, "transactions": [t.pk], "deleted": []}},
+            {"event": "ledger", "data": {
+                "balances": balances, "transactions": [], "deleted": []}},
+            {"event": "ledger", "data": {
+                "balances": balances, "transactions": [t.pk], "deleted": []}},
+        ])
+
+        pk = t.pk
+        t.delete()
+        balances = [{"account": self.account.pk, "delta": "10.00", "value": "0.00"}]
+        self.assertEqual(self.received(), [
+            {"event": "ledger", "data": {
+                "balances": balances, "transactions": [], "deleted": [pk]}},
+            {"event": "ledger", "data": {
+                "balances": balances, "transactions": [], "deleted": []}},
+            {"event": "ledger", "data": {
+                "balances": balances, "transactions": [], "deleted": [pk]}},
+        ])
+
+    def test_changes_rolled_back_are_not_published(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.make_transaction()
+            raise RuntimeError
+        self.assertEqual(self.received(), [None, None, None])
+
+    def test_slow_subscribers_are_reset(self):
+        with override_settings(EVENTS={"QUEUE_SIZE": 2}):
+            subscription = events.Subscription(self.user.pk)
+        self.subscriptions.append(subscription)
+        for i in range(3):
+            self.make_transaction(description="Row %d" % i)
+        self.assertEqual(subscription.get(timeout=0), {"event": "reset", "data": {}})
+        self.assertIsNone(subscription.get(timeout=0))
+
+    def test_nothing_is_read_without_subscribers(self):
+        for subscription in self.subscriptions:
+            subscription.close()
+        with self.assertNumQueries(0):
+            events.publish(balances={self.account.pk: 1})
+
+
+@override_settings(EVENTS={"HEARTBEAT": 0.01})
+class EventViewTests(LedgerMixin, TestCase):
+    """Tests for streaming events from `/api/events/`."""
+
+    def setUp(self):
+        self.make_ledger()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_streams_events(self):
+        response = self.client.get("/api/events/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/event-stream; charset=utf-8")
+        content = iter(response.streaming_content)
+        self.assertEqual(next(content), b": keep-alive\n\n")
+        events.get_backend().publish({
+            "balances": [],
+            "transactions": [{"user": self.user.pk, "id": 3}],
+            "deleted": [],
+        })
+        self.assertEqual(
+            next(content),
+            b'event: ledger\ndata: {"balances": [], "transactions": [3], '
+            b'"deleted": []}\n\n')
+        self.assertEqual(next(content), b": keep-alive\n\n")
+        response.close()
+        self.assertFalse(events.get_backend().listening())
+
+    def test_requires_authentication(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get("/api/events/").status_code, 401)
+
+
+class SyncTests(LedgerMixin, TestCase):
+    """Tests for incremental sync from `/api/transactions/changes/`."""
+
+    def setUp(self):
+        self.make_ledger()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def sync(self, since="", **params):
+        response = self.client.get(
+            "/api/transactions/changes/", dict(params, since=since))
+        self.assertEqual(response.status_code, 200, response.content)
+        return json.loads(response.content.decode())
+
+    @override_settings(SYNC={"MARGIN": 0})
+    def test_sends_only_changes_since_token(self):
+        kept, changed, removed = [
+            self.make_transaction(description="Row %d" % i) for i in range(3)]
+        other = self.make_transaction(user=User.objects.create_user("bob"))
+        first = self.sync()
+        self.assertEqual(
+            [row["id"] for row in first["results"]], [kept.pk, changed.pk, removed.pk])
+        self.assertEqual(first["deleted"], [])
+        self.assertFalse(first["has_more"])
+
+        changed.description = "Changed"
+        changed.save()
+        removed_pk = removed.pk
+        removed.delete()
+        other.delete()
+        second = self.sync(first["sync_token"], fields="id,description")
+        self.assertEqual(second["results"], [{"id": changed.pk, "description": "Changed"}])
+        self.assertEqual(second["deleted"], [removed_pk])
+
+        self.assertEqual(self.sync(second["sync_token"])["results"], [])
+
+    @override_settings(SYNC={"MARGIN": 0, "PAGE_SIZE": 2})
+    def test_pages_through_changes(self):
+        created = [self.make_transaction() for _ in range(3)]
+        created[0].delete()
+        seen, deleted, token = [], [], ""
+        while True:
+            page = self.sync(token)
+            seen += [row["id"] for row in page["results"]]
+            deleted += page["deleted"]
+            token = page["sync_token"]
+            if not page["has_more"]:
+                break
+        self.assertEqual(seen, [t.pk for t in created[1:]])
+        self.assertEqual(len(deleted), 1)
+
+    @override_settings(SYNC={"MARGIN": 60})
+    def test_recent_changes_are_sent_again(self):
+        t = self.make_transaction()
+        first = self.sync()
+        self.assertEqual([row["id"] for row in self.sync(first["sync_token"])["results"]], [t.pk])
+
+    def test_invalid_token(self):
+        response = self.client.get("/api/transactions/changes/", {"since": "yesterday"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("since", json.loads(response.content.decode()))
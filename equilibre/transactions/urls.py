@@ -22,5 +22,15 @@ router.register(
     views.BalanceViewSet,
     base_name='balances'
 )
+router.register(
+    r'events',
+    views.EventViewSet,
+    base_name='events'
+)
+router.register(
+    r'reports',
+    views.ReportViewSet,
+    base_name='reports'
+)
 
 urlpatterns = router.urls
@@ -1,12 +1,129 @@
-from rest_framework import viewsets, mixins
-from transactions.models import Account, Balance, Category, Transaction
+import hashlib
+from collections import OrderedDict
+from datetime import date
+
+from django.core.cache import cache as response_cache
+from django.core.exceptions import ObjectDoesNotExist
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_date
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status, viewsets, mixins
+from rest_framework.decorators import list_route
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import JSONParser
+from rest_framework.response import Response
+from transactions import cache, events, metrics, sync
+from transactions.bulk import load_transactions, update_transactions
+from transactions.exporters import export_rows
+from transactions.filters import TransactionFilter
+from transactions.models import (
+    Account, Balance, BalanceCheckpoint, Category, Transaction,
+    TransactionTombstone)
 from transactions.serializers import AccountSerializer
 from transactions.serializers import TransactionSerializer
 from transactions.serializers import CategorySerializer
 from transactions.serializers import BalanceSerializer
+from transactions.serializers import HistoricalBalanceSerializer
+from transactions.serializers import parse_representation
+from transactions.pagination import KeysetPagination
+from transactions.reports import (
+    ReportError, parse_group_by, summarise, summary_queryset)
+from transactions.parsers import NDJSONParser
+from transactions.renderers import (
+    CSVRenderer, EventStreamRenderer, NDJSONRenderer)
+
+
+class ConditionalListMixin(object):
+    """Answer conditional GETs of a list without running its serializer.
+
+    A strong ETag is derived from `get_list_version()`, which views must
+    define to cheaply return a stamp of everything the list depends on (or
+    `None` to skip conditional handling), and a request whose `If-None-Match`
+    matches it is answered with 304 Not Modified.
+
+    """
+
+    def list(self, request, *args, **kwargs):
+        version = self.get_list_version()
+        if version is None:
+            return super(ConditionalListMixin, self).list(request, *args, **kwargs)
+
+        etag = quote_etag(hashlib.md5(("%s|%s|%s" % (
+            version, request.accepted_renderer.format, request.get_full_path(),
+        )).encode()).hexdigest())
+        if_none_match = parse_etags(request.META.get("HTTP_IF_NONE_MATCH", ""))
+        if etag in if_none_match or "*" in if_none_match:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = super(ConditionalListMixin, self).list(request, *args, **kwargs)
+        response["ETag"] = etag
+        return response
+
+
+class CachedResponseMixin(object):
+    """Cache the data of list and retrieve responses.
+
+    The data is cached under a key made from the request's URL and
+    `get_response_stamp()`, which views must define to return a stamp of
+    the versions of everything the responses contain, so a cached response is
+    never served once any of it has changed.
+
+    """
+    response_cache_timeout = 300
+
+    def _cached_response(self, handler, request, *args, **kwargs):
+        key = "response:%s" % hashlib.md5(("%s|%s" % (
+            self.get_response_stamp(), request.build_absolute_uri(),
+        )).encode()).hexdigest()
+        data = response_cache.get(key)
+        metrics.cache_requests_total.inc(
+            cache="response:%s" % type(self).__name__,
+            result="miss" if data is None else "hit")
+        if data is not None:
+            return Response(data)
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            response_cache.set(key, response.data, self.response_cache_timeout)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self._cached_response(
+            super(CachedResponseMixin, self).list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached_response(
+            super(CachedResponseMixin, self).retrieve, request, *args, **kwargs)
+
+
+class ReferenceViewSetMixin(object):
+    """Serve the active rows of a table from its reference data cache.
+
+    :reference_cache: The `ReferenceCache` of the viewset's model.
+
+    """
+    reference_cache = None
+
+    def get_list_version(self):
+        return self.reference_cache.version()
+
+    def list(self, request, *args, **kwargs):
+        serializer = self.get_serializer(self.reference_cache.active(), many=True)
+        return Response(serializer.data)
 
+    def get_object(self):
+        try:
+            obj = self.reference_cache.get(self.kwargs[self.lookup_field])
+        except ObjectDoesNotExist:
+            raise Http404
+        if not obj.is_active:
+            raise Http404
+        self.check_object_permissions(self.request, obj)
+        return obj
 
-class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
+
+class CategoryViewSet(ConditionalListMixin, ReferenceViewSetMixin,
+                      viewsets.ReadOnlyModelViewSet):
     """Views for Category objects.
 
     :methods: GET
@@ -16,9 +133,11 @@ class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
         is_active=True)
     serializer_class = CategorySerializer
     pagination_class = None
+    reference_cache = cache.categories
 
 
-class AccountViewSet(viewsets.ReadOnlyModelViewSet):
+class AccountViewSet(ConditionalListMixin, ReferenceViewSetMixin,
+                     viewsets.ReadOnlyModelViewSet):
     """Views for Account objects.
 
     :methods: GET
@@ -28,29 +147,350 @@ class AccountViewSet(viewsets.ReadOnlyModelViewSet):
         is_active=True)
     serializer_class = AccountSerializer
     pagination_class = None
+    reference_cache = cache.accounts
 
 
-class TransactionViewSet(viewsets.ModelViewSet):
+class TransactionViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     """Views for Transaction objects.
 
-    :methods: GET, POST, PATCH
+    :methods: GET, POST, PATCH, DELETE
+
+    Lists are paginated by page number, or by keyset when a `cursor` query
+    parameter is given (start with an empty `?cursor=`), and may be filtered
+    with the parameters of `TransactionFilter`. The fields and nesting of
+    transactions can be chosen with `?fields=`, `?expand=` and `?compact=`
+    (see `parse_representation()`). Lists and single
+    transactions are served from a cache until the user's transactions (or
+    the accounts, categories or users they refer to) change.
+
+    Clients keeping a copy of their transactions fetch only what has changed
+    since their last sync from `changes/` (see `changes()`).
+
+    Many transactions are created, changed or deleted at once with `bulk/`
+    (see `bulk()`).
 
     """
     serializer_class = TransactionSerializer
+    filter_class = TransactionFilter
+
+    @property
+    def paginator(self):
+        """Use keyset pagination if the client asks for it."""
+        cursor_param = KeysetPagination.cursor_query_param
+        if not hasattr(self, "_paginator") and cursor_param in self.request.query_params:
+            self._paginator = KeysetPagination()
+        return super(TransactionViewSet, self).paginator
+
+    def get_response_stamp(self):
+        user = self.request.user
+        return cache.transactions_stamp(
+            user, all_users=user.has_perm("transaction.view"))
 
     def get_queryset(self):
-        if self.request.user.has_perm("transaction.view"):
-            return Transaction.objects.all()
-        else:
-            return Transaction.objects.filter(user=self.context['request'].user)
+        queryset = Transaction.objects.visible_to(
+            self.request.user).order_by("-date", "-id")
+        serializer_class = self.get_serializer_class()
+        if self.action in ("list", "changes"):
+            # Lists are serialized from rows by `TransactionListSerializer`.
+            columns = serializer_class.values(
+                self.get_serializer_context()["representation"])
+            if self.action == "changes" and "updated" not in columns:
+                columns.append("updated")
+            return queryset.values(*columns)
+        return serializer_class.setup_eager_loading(queryset)
+
+    def get_serializer_context(self):
+        context = super(TransactionViewSet, self).get_serializer_context()
+        if self.action in ("list", "retrieve", "changes"):
+            context["representation"] = parse_representation(
+                self.request.query_params)
+        return context
+
+    def get_paginated_response(self, data):
+        response = super(TransactionViewSet, self).get_paginated_response(data)
+        included = getattr(getattr(data, "serializer", None), "included", None)
+        if included is not None:
+            response.data["included"] = included
+        return response
+
+    @list_route(methods=["post", "patch", "delete"],
+                parser_classes=(JSONParser, NDJSONParser))
+    def bulk(self, request):
+        """Create, change or delete many transactions at once.
+
+        POST creates transactions from a JSON array or NDJSON body, which
+        are committed a chunk at a time. Invalid rows are skipped and
+        reported by their index. Pass `?atomic=true` to create nothing
+        unless every row is valid and can be inserted; the rows are then
+        committed at once, so keep such loads small (see
+        `load_transactions()`).
+
+        PATCH and DELETE act on the transactions selected by `ids` (a list
+        in the body, or a comma-separated `?ids=`) and/or the filters of
+        `TransactionFilter`. PATCH sets the fields of the `set` dict of the
+        body (e.g. `{"ids": [1, 2], "set": {"category_id": 3}}`) on every one.
+        Either way the change takes a query per batch of transactions (see
+        `TransactionQuerySet.update()`), and balances and summaries are
+        adjusted by its net effect.
+
+        """
+        if request.method == "POST":
+            return self._bulk_create(request)
+
+        if not isinstance(request.data, dict):
+            raise ValidationError(
+                {"non_field_errors": ["Give a JSON object of `ids` and `set`."]})
+        queryset = self._bulk_selection(request)
+        if request.method == "PATCH":
+            updated = update_transactions(
+                queryset, request.data.get("set"), request.user,
+                context=self.get_serializer_context())
+            return Response({"updated": updated})
+        deleted, _ = queryset.delete()
+        return Response({"deleted": deleted})
+
+    def _bulk_selection(self, request):
+        """Return the transactions selected by a bulk PATCH or DELETE.
+
+        Filters given without a value select nothing, as for lists.
+
+        :raises: `ValidationError` if nothing is selected, so that a request
+                 can't change every transaction by mistake, or if a filter
+                 is invalid.
+
+        """
+        ids = request.data.get("ids", request.query_params.get("ids"))
+        filterset = self.filter_class(
+            request.query_params, request=request,
+            queryset=Transaction.objects.visible_to(request.user))
+        if not filterset.form.is_valid():
+            raise ValidationError(filterset.form.errors)
+        used = {k for k, v in filterset.form.cleaned_data.items()
+                if v not in (None, "", [])}
+        if ids is None and not used:
+            raise ValidationError(
+                {"ids": ["Select transactions by ids or filters."]})
+
+        queryset = filterset.qs
+        if ids is not None:
+            if isinstance(ids, str):
+                ids = ids.split(",") if ids else []
+            try:
+                ids = [int(pk) for pk in ids]
+            except (TypeError, ValueError):
+                raise ValidationError({"ids": ["Give a list of ids."]})
+            queryset = queryset.filter(pk__in=ids)
+        return queryset
 
+    def _bulk_create(self, request):
+        rows = request.data
+        if isinstance(rows, dict):
+            rows = [rows]
+        atomic = request.query_params.get("atomic", "").lower() in ("1", "true")
 
-class BalanceViewSet(viewsets.ReadOnlyModelViewSet):
+        loader = load_transactions(
+            rows, request.user, atomic=atomic,
+            context=self.get_serializer_context())
+
+        return Response(
+            {"created": loader.created, "errors": loader.errors},
+            status=status.HTTP_201_CREATED if loader.created or not loader.errors
+            else status.HTTP_400_BAD_REQUEST)
+
+    @list_route()
+    def changes(self, request):
+        """List the transactions changed since a sync token.
+
+        Pass the `sync_token` of the last sync as `?since=` (or nothing, the
+        first time) to get the transactions created or updated since then
+        (`results`, which take `?fields=`, `?expand=` and `?compact=` as
+        lists do) and the `pk` of those deleted (`deleted`). While `has_more`
+        is true, sync again straight away with the new `sync_token`. Changes
+        may be sent more than once, and should be applied idempotently.
+
+        """
+        try:
+            since = sync.decode_token(request.query_params.get("since"))
+        except sync.SyncError as exc:
+            raise ValidationError({"since": [str(exc)]})
+
+        changes = sync.changes_since(
+            self.get_queryset(),
+            TransactionTombstone.objects.visible_to(request.user), since)
+        serializer = self.get_serializer(changes.rows, many=True)
+        data = OrderedDict((
+            ("results", serializer.data),
+            ("deleted", changes.deleted),
+            ("sync_token", changes.token),
+            ("has_more", changes.has_more),
+        ))
+        if serializer.included is not None:
+            data["included"] = serializer.included
+        return Response(data)
+
+    @list_route(renderer_classes=(CSVRenderer, NDJSONRenderer))
+    def export(self, request):
+        """Stream every (filtered) transaction as CSV or NDJSON.
+
+        The format is chosen with `?format=csv|ndjson` or the `Accept` header.
+        Rows are read with a server-side cursor and encoded as they are sent,
+        so exports of any size use constant memory.
+
+        """
+        queryset = self.filter_queryset(
+            Transaction.objects.visible_to(request.user).order_by("-date", "-id"))
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.render_rows(export_rows(queryset)),
+            content_type="%s; charset=%s" % (renderer.media_type, renderer.charset))
+        response["Content-Disposition"] = (
+            'attachment; filename="transactions.%s"' % renderer.format)
+        return response
+
+
+class BalanceViewSet(ConditionalListMixin, viewsets.ReadOnlyModelViewSet):
     """Views for account Balance objects.
 
     :methods: GET
 
+    Pass `?as_of=YYYY-MM-DD` to list the balances at the end of a past day,
+    which are read from the monthly balance checkpoints.
+
     """
-    queryset = Balance.objects.all()
+    HEALTH_SAMPLE_SIZE = 10
+
+    def get_list_version(self):
+        # The version of balances is bumped when a change to them commits,
+        # but back-dated changes can alter past balances without changing
+        # current ones.
+        if "as_of" in self.request.query_params:
+            return None
+        return "%s|%s" % (cache.all_balances.get(), cache.accounts.version())
+
+    queryset = Balance.objects.select_related("account")
     serializer_class = BalanceSerializer
     pagination_class = None
+
+    def list(self, request, *args, **kwargs):
+        if "as_of" not in request.query_params:
+            return super(BalanceViewSet, self).list(request, *args, **kwargs)
+
+        as_of = None
+        try:
+            as_of = parse_date(request.query_params["as_of"])
+        except ValueError:
+            pass
+        if as_of is None:
+            raise ValidationError({"as_of": ["Enter a date as YYYY-MM-DD."]})
+        if as_of.replace(day=1) == date.min:
+            # Balances are read from the checkpoint at the end of the
+            # previous month, which would be before the first date.
+            raise ValidationError({"as_of": ["Enter a date after January of year 1."]})
+
+        balances = list(self.filter_queryset(self.get_queryset()))
+        values = BalanceCheckpoint.objects.balances_as_of(
+            as_of, [b.account_id for b in balances])
+        serializer = HistoricalBalanceSerializer([
+            {"id": b.pk, "account": b.account, "value": values[b.account_id], "as_of": as_of}
+            for b in balances
+        ], many=True, context=self.get_serializer_context())
+        return Response(serializer.data)
+
+    @list_route()
+    def health(self, request):
+        """Check a random sample of balances against their transactions.
+
+        Responds with 503 if any sampled balance has drifted, so that it can
+        be used by monitoring; `reconcile_balances` repairs them.
+
+        """
+        account_ids = list(Balance.objects.order_by("?").values_list(
+            "account_id", flat=True)[:self.HEALTH_SAMPLE_SIZE])
+        drift = Balance.objects.drift(account_ids)
+        return Response({
+            "healthy": not drift,
+            "checked": len(account_ids),
+            "drift": [
+                {
+                    "account": account_id,
+                    "expected": str(expected),
+                    "actual": None if actual is None else str(actual),
+                }
+                for account_id, (expected, actual) in sorted(drift.items())
+            ],
+        }, status=status.HTTP_503_SERVICE_UNAVAILABLE if drift else status.HTTP_200_OK)
+
+
+class EventViewSet(viewsets.GenericViewSet):
+    """A stream of the changes to the ledger, as server-sent events.
+
+    :methods: GET
+
+    A `ledger` event is sent when a write to the ledger is committed, with
+    the change and new value of each balance, and the `pk` of the
+    transactions the user may see which were created or updated
+    (`transactions`) or deleted (`deleted`). A `reset` event means that
+    events were dropped, and the data shown should be fetched again.
+
+    When served by `equilibre.asgi`, streams are read by the event loop, so
+    idle clients don't hold a thread.
+
+    """
+    renderer_classes = (EventStreamRenderer,)
+
+    def list(self, request):
+        user = request.user
+        all_users = user.has_perm("transaction.view")
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.render_rows(events.stream(user.pk, all_users)),
+            content_type="%s; charset=%s" % (renderer.media_type, renderer.charset))
+        # Read by `transactions.asgi` instead of `streaming_content`.
+        response.async_streaming_content = renderer.render_rows_async(
+            events.astream(user.pk, all_users))
+        response["Cache-Control"] = "no-cache"
+        # Stop proxies such as nginx buffering the stream.
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+
+class ReportViewSet(viewsets.GenericViewSet):
+    """Views for aggregate reports of transactions.
+
+    Totals are grouped by the comma-separated fields in `?group_by=` (any of
+    account, category, action, tax_deduction and one of year, month or week),
+    and transactions may be filtered as for `TransactionViewSet`. Reports of
+    whole months are read from the monthly summaries.
+
+    :methods: GET
+
+    """
+    filter_class = TransactionFilter
+    pagination_class = None
+
+    def get_queryset(self):
+        return Transaction.objects.visible_to(self.request.user)
+
+    def list(self, request):
+        try:
+            group_by = parse_group_by(request.query_params.get("group_by"))
+        except ReportError as exc:
+            raise ValidationError({"group_by": [str(exc)]})
+
+        filterset = self.filter_class(
+            request.query_params, queryset=self.get_queryset(), request=request)
+        if filterset.form.is_valid():
+            queryset = summary_queryset(filterset.form.cleaned_data, group_by)
+            if queryset is not None:
+                return Response(summarise(
+                    queryset.visible_to(request.user), group_by))
+
+        queryset = self.filter_queryset(self.get_queryset())
+        return Response(summarise(queryset, group_by))
+
+
+def metrics_view(request):
+    """Expose the metrics of every process in the Prometheus text format."""
+    return HttpResponse(
+        metrics.REGISTRY.expose(),
+        content_type="text/plain; version=0.0.4; charset=utf-8")